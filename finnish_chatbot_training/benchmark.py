@@ -0,0 +1,306 @@
+import os
+import json
+import time
+import logging
+import tempfile
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from conversation_processor import ConversationProcessor, ConversationDataset
+from data_processor import DataProcessor
+from database_manager import DatabaseManager
+from reddit_collector import RedditCollector
+from pipeline_metrics import PipelineMetrics
+from synthetic_corpus import write_corpus
+from frame_schema import read_frame, bytes_per_row
+from pipeline_logging import setup_logging
+
+
+logger = logging.getLogger(__name__)
+
+SCALING_ROWS = [10_000, 100_000, 1_000_000, 10_000_000]
+SCALING_METRICS = {"rows_per_second": "higher", "peak_rss_bytes": "lower"}
+
+SAMPLE_WORDS = [
+    'hyvä', 'kiitos', 'suomi', 'suomessa', 'paljon', 'vähän', 'sauna', 'kahvi', 'järvi',
+    'talvi', 'kesä', 'mökki', 'ruisleipä', 'että', 'mutta', 'niin', 'myös', 'vain', 'äiti', 'öljy'
+]
+
+def make_sample_frame(rows, posts=None, seed=0):
+    """Build a processed-CSV shaped DataFrame with random Finnish-like comments"""
+    rng = np.random.default_rng(seed)
+    posts = posts or max(1, rows // 8)
+    words = np.array(SAMPLE_WORDS, dtype=object)
+    lengths = rng.integers(1, 30, size=rows)
+    picks = rng.integers(0, len(words), size=int(lengths.sum()))
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    texts = [' '.join(words[picks[offsets[i]:offsets[i + 1]]]) for i in range(rows)]
+
+    return pd.DataFrame({
+        'source': 'reddit',
+        'subreddit': 'Suomi',
+        'post_id': [f"p{n}" for n in rng.integers(0, posts, size=rows)],
+        'text': texts,
+        'created_utc': rng.integers(1_600_000_000, 1_700_000_000, size=rows).astype(float),
+        'score': rng.integers(-5, 500, size=rows)
+    })
+
+def benchmark_jsonl_generation(rows=1_000_000, json_encoder="json"):
+    """Report conversations per second for single- and multi-turn JSONL generation"""
+    df = make_sample_frame(rows)
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        processor = ConversationProcessor(output_dir=output_dir, json_encoder=json_encoder)
+        results = {}
+
+        for name, method in [("single_turn", processor._create_single_turn_data),
+                             ("multi_turn", processor._create_multi_turn_data)]:
+            output_path = os.path.join(output_dir, f"{name}.jsonl")
+            start_time = time.perf_counter()
+            count = method(df, output_path)
+            elapsed_time = time.perf_counter() - start_time
+
+            results[name] = {
+                "conversations": count,
+                "seconds": elapsed_time,
+                "conversations_per_second": count / elapsed_time if elapsed_time > 0 else 0.0
+            }
+            logger.info(f"{name}: {count} conversations in {elapsed_time:.2f}s "
+                        f"({results[name]['conversations_per_second']:,.0f} conversations/s, encoder={json_encoder})")
+
+    return results
+
+def benchmark_dataset_loading(rows=1_000_000, output_format="jsonl", random_reads=100_000):
+    """Report data-loading throughput of ConversationDataset over generated training files"""
+    df = make_sample_frame(rows)
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        processor = ConversationProcessor(output_dir=output_dir, output_format=output_format)
+        output_path = os.path.join(output_dir, "bench_single_turn.jsonl")
+        processor._create_single_turn_data(df, output_path)
+        if output_format == "sharded":
+            output_path = os.path.join(output_dir, "bench_single_turn.shards.json")
+        del df
+
+        results = {}
+
+        start_time = time.perf_counter()
+        dataset = ConversationDataset(output_path)
+        results["open_seconds"] = time.perf_counter() - start_time
+
+        def measure(name, positions):
+            start_time = time.perf_counter()
+            read_bytes = 0
+            for position in positions:
+                read_bytes += len(dataset.read_line(position))
+            elapsed_time = time.perf_counter() - start_time
+            results[name] = {
+                "records": len(positions),
+                "records_per_second": len(positions) / elapsed_time if elapsed_time > 0 else 0.0,
+                "mb_per_second": read_bytes / elapsed_time / 1e6 if elapsed_time > 0 else 0.0
+            }
+            logger.info(f"{name}: {results[name]['records_per_second']:,.0f} records/s, "
+                        f"{results[name]['mb_per_second']:.1f} MB/s")
+
+        measure("sequential", range(len(dataset)))
+        measure("random", dataset.order(shuffle=True, seed=0)[:random_reads].tolist())
+
+        start_time = time.perf_counter()
+        parsed = sum(1 for _ in dataset.iterate(shuffle=True, seed=0, num_shards=4, shard_id=0))
+        elapsed_time = time.perf_counter() - start_time
+        results["shuffled_parsed_worker"] = {
+            "records": parsed,
+            "records_per_second": parsed / elapsed_time if elapsed_time > 0 else 0.0
+        }
+        logger.info(f"shuffled + json.loads (1 of 4 workers): "
+                    f"{results['shuffled_parsed_worker']['records_per_second']:,.0f} records/s")
+
+        logger.info(f"Dataset with {len(dataset)} records opened in {results['open_seconds']:.2f}s ({output_format})")
+        dataset.close()
+
+    return results
+
+def benchmark_schema_memory(rows=1_000_000, seed=0):
+    """Compare per-row memory and load time of inferred dtypes with the shared schema"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        raw_file = write_corpus(os.path.join(work_dir, "synthetic.csv"), rows, seed=seed)
+        results = {}
+
+        for name, read in [("inferred", lambda: pd.read_csv(raw_file, encoding='utf-8')),
+                           ("schema", lambda: read_frame(raw_file, encoding='utf-8'))]:
+            start_time = time.perf_counter()
+            df = read()
+            elapsed_time = time.perf_counter() - start_time
+            results[name] = {
+                "bytes_per_row": bytes_per_row(df),
+                "load_seconds": elapsed_time,
+                "columns": {column: {"dtype": str(df[column].dtype),
+                                     "bytes_per_row": df[column].memory_usage(deep=True, index=False) / len(df)}
+                            for column in df.columns}
+            }
+            del df
+
+    results["reduction"] = 1 - results["schema"]["bytes_per_row"] / results["inferred"]["bytes_per_row"]
+    for column, inferred in results["inferred"]["columns"].items():
+        typed = results["schema"]["columns"][column]
+        logger.info(f"{column:<14} {inferred['dtype']:>10} {inferred['bytes_per_row']:8.1f} B/row -> "
+                    f"{typed['dtype']:>10} {typed['bytes_per_row']:8.1f} B/row")
+    logger.info(f"Total: {results['inferred']['bytes_per_row']:.1f} -> {results['schema']['bytes_per_row']:.1f} bytes/row "
+                f"({results['reduction']:.0%} less), load {results['inferred']['load_seconds']:.2f}s -> "
+                f"{results['schema']['load_seconds']:.2f}s")
+    return results
+
+def benchmark_scaling(scales=SCALING_ROWS, seed=0, finnish_sample_rows=20_000, **corpus_options):
+    """Run every pipeline stage over seeded synthetic corpora of each size
+
+    Returns {rows: {stage: metrics}} with throughput and peak memory per stage. Language
+    detection is measured on at most finnish_sample_rows texts, as it is far slower per
+    row than the batch stages.
+    """
+    collector = RedditCollector(client_id="benchmark", client_secret="benchmark", user_agent="benchmark")
+    results = {}
+
+    for rows in scales:
+        with tempfile.TemporaryDirectory() as work_dir:
+            raw_file = os.path.join(work_dir, "raw", f"synthetic_{rows}.csv")
+            os.makedirs(os.path.join(work_dir, "processed"))
+            write_corpus(raw_file, rows, seed=seed, **corpus_options)
+
+            metrics = PipelineMetrics(metrics_dir=work_dir)
+
+            texts = pd.read_csv(raw_file, usecols=['text'], nrows=finnish_sample_rows)['text'].tolist()
+            with metrics.stage("is_finnish", raw_file) as record:
+                record.rows_in = len(texts)
+                record.rows_out = sum(1 for text in texts if collector._is_finnish(text))
+            del texts
+
+            processor = DataProcessor(checkpoint_dir=os.path.join(work_dir, "checkpoints"))
+            with metrics.stage("process_file", raw_file, inputs=[raw_file]) as record:
+                processed_file = processor.process_file(raw_file)
+                record.rows_in = processor.last_stats["rows_in"]
+                record.rows_out = processor.last_stats["rows_out"]
+                record.status = "ok" if processed_file else "error"
+
+            if processed_file:
+                db_manager = DatabaseManager(db_path=os.path.join(work_dir, "benchmark.db"))
+                with metrics.stage("store_data", processed_file, inputs=[processed_file]) as record:
+                    db_manager.store_data(processed_file)
+                    record.rows_in = db_manager.last_stats["rows_in"]
+                    record.rows_out = db_manager.last_stats["rows_out"]
+
+                conversation_processor = ConversationProcessor(output_dir=os.path.join(work_dir, "training"))
+                with metrics.stage("process_csv_to_jsonl", processed_file, inputs=[processed_file]) as record:
+                    stats = conversation_processor.process_csv_to_jsonl(processed_file)
+                    record.rows_in = stats.get("input_rows", 0)
+                    record.rows_out = stats["single_turn_count"] + stats["multi_turn_count"]
+            else:
+                logger.error(f"process_file failed on {rows} rows, skipping the later stages at this scale")
+
+            results[str(rows)] = {
+                record.stage: {
+                    "rows_in": record.rows_in,
+                    "rows_out": record.rows_out,
+                    "wall_seconds": record.wall_seconds,
+                    "rows_per_second": record.rows_per_second,
+                    "peak_rss_bytes": record.peak_rss_bytes
+                } for record in metrics.records
+            }
+            for stage, stage_result in results[str(rows)].items():
+                logger.info(f"{rows:>10} rows  {stage:<22} {stage_result['rows_per_second']:>12,.0f} rows/s  "
+                            f"peak RSS {stage_result['peak_rss_bytes'] / 2**20:,.0f} MiB")
+
+    return results
+
+def compare_to_baseline(results, baseline, tolerance=0.2):
+    """List the stage metrics that are more than tolerance worse than the baseline run"""
+    regressions = []
+    for rows, stages in results.items():
+        for stage, stage_result in stages.items():
+            expected = baseline.get(rows, {}).get(stage)
+            if not expected:
+                continue
+            for metric, better in SCALING_METRICS.items():
+                if not expected.get(metric):
+                    continue
+                change = stage_result[metric] / expected[metric] - 1
+                if (better == "higher" and change < -tolerance) or (better == "lower" and change > tolerance):
+                    regressions.append({"rows": rows, "stage": stage, "metric": metric, "baseline": expected[metric],
+                                        "current": stage_result[metric], "change": change})
+    return regressions
+
+def run_scaling_suite(scales=SCALING_ROWS, baseline_path="benchmarks/scaling_baseline.json",
+                      output_dir="logs/benchmarks", tolerance=0.2, update_baseline=False, **options):
+    """Benchmark all scales, save the curves and check them against the stored baseline"""
+    results = benchmark_scaling(scales=scales, **options)
+
+    os.makedirs(output_dir, exist_ok=True)
+    report_path = os.path.join(output_dir, f"scaling_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    logger.info(f"Scaling results saved to {report_path}")
+
+    regressions = []
+    if os.path.exists(baseline_path):
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            regressions = compare_to_baseline(results, json.load(f), tolerance=tolerance)
+        for regression in regressions:
+            logger.warning(f"REGRESSION: {regression['stage']} at {regression['rows']} rows, {regression['metric']} "
+                           f"{regression['baseline']:,.0f} -> {regression['current']:,.0f} ({regression['change']:+.0%})")
+        if not regressions:
+            logger.info(f"No regressions against {baseline_path} (tolerance {tolerance:.0%})")
+    elif not update_baseline:
+        # Throughput depends on the machine, so each one records its own baseline
+        logger.warning(f"No baseline at {baseline_path}, regressions were not checked; "
+                       f"run once with --update-baseline on this machine to create it")
+
+    if update_baseline:
+        os.makedirs(os.path.dirname(baseline_path) or '.', exist_ok=True)
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        logger.info(f"Baseline updated: {baseline_path}")
+
+    return {"results": results, "report": report_path, "regressions": regressions}
+
+if __name__ == "__main__":
+    setup_logging(log_file=None)
+    import argparse
+    parser = argparse.ArgumentParser(description="Pipeline performance benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    jsonl_parser = subparsers.add_parser("jsonl", help="JSONL training data generation throughput")
+    jsonl_parser.add_argument("--rows", type=int, default=1_000_000, help="Number of input rows")
+    jsonl_parser.add_argument("--encoder", choices=["json", "orjson"], default="json", help="JSON string encoder")
+
+    dataset_parser = subparsers.add_parser("dataset", help="ConversationDataset data-loading throughput")
+    dataset_parser.add_argument("--rows", type=int, default=1_000_000, help="Number of input rows")
+    dataset_parser.add_argument("--output-format", choices=["jsonl", "sharded"], default="jsonl",
+                                help="Training data layout to read")
+
+    schema_parser = subparsers.add_parser("schema", help="Per-row memory of inferred dtypes vs the shared schema")
+    schema_parser.add_argument("--rows", type=int, default=1_000_000, help="Number of synthetic rows")
+
+    scaling_parser = subparsers.add_parser("scaling", help="All stages over synthetic corpora of growing size")
+    scaling_parser.add_argument("--rows", type=int, nargs="+", default=SCALING_ROWS, help="Corpus sizes to run")
+    scaling_parser.add_argument("--seed", type=int, default=0, help="Synthetic corpus seed")
+    scaling_parser.add_argument("--duplicate-rate", type=float, default=0.05, help="Fraction of duplicated texts")
+    scaling_parser.add_argument("--corruption-rate", type=float, default=0.02, help="Fraction of damaged rows")
+    scaling_parser.add_argument("--max-depth", type=int, default=6, help="Deepest reply level of a thread")
+    scaling_parser.add_argument("--baseline", default="benchmarks/scaling_baseline.json", help="Stored baseline results")
+    scaling_parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown or memory growth")
+    scaling_parser.add_argument("--update-baseline", action="store_true", help="Save this run as the new baseline")
+
+    args = parser.parse_args()
+
+    if args.benchmark == "jsonl":
+        benchmark_jsonl_generation(rows=args.rows, json_encoder=args.encoder)
+    elif args.benchmark == "dataset":
+        benchmark_dataset_loading(rows=args.rows, output_format=args.output_format)
+    elif args.benchmark == "schema":
+        benchmark_schema_memory(rows=args.rows)
+    elif args.benchmark == "scaling":
+        suite = run_scaling_suite(scales=args.rows, baseline_path=args.baseline, tolerance=args.tolerance,
+                                  update_baseline=args.update_baseline, seed=args.seed,
+                                  duplicate_rate=args.duplicate_rate, corruption_rate=args.corruption_rate,
+                                  max_depth=args.max_depth)
+        if suite["regressions"]:
+            raise SystemExit(1)
@@ -0,0 +1,70 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+
+
+logger = logging.getLogger(__name__)
+
+def file_signature(path):
+    """Size and modification time of a file, enough to tell whether a checkpoint still applies"""
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def rows_digest(index):
+    """Digest of the row labels a checkpointed loop iterates over"""
+    digest = hashlib.sha256()
+    for label in index:
+        digest.update(str(label).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+class Checkpoint:
+    def __init__(self, checkpoint_dir, input_file, stage):
+        """Atomically written progress record of one stage on one input file"""
+        name = os.path.basename(input_file)
+        path_hash = hashlib.sha1(os.path.abspath(input_file).encode('utf-8')).hexdigest()[:8]
+        self.path = os.path.join(checkpoint_dir, f"{name}.{path_hash}.{stage}.json")
+        self.input_file = input_file
+        self.stage = stage
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def load(self, expected=None):
+        """Saved state, or None when missing, unreadable or not matching the expected fields"""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable checkpoint {self.path}: {str(e)}")
+            return None
+
+        if state.get("input_signature") != file_signature(self.input_file):
+            logger.info(f"Input changed since checkpoint {self.path}, starting over")
+            return None
+        for key, value in (expected or {}).items():
+            if state.get(key) != value:
+                logger.info(f"Checkpoint {self.path} does not match the current run ({key}), starting over")
+                return None
+        return state
+
+    def save(self, state):
+        """Write state atomically (temporary file + rename)"""
+        state = dict(state, input_signature=file_signature(self.input_file))
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix='.checkpoint.')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,242 @@
+import os
+import json
+import bisect
+import logging
+import numpy as np
+import pandas as pd
+from conversation_processor import ConversationDataset
+from data_processor import NORMALIZE_PATTERNS
+from pipeline_logging import setup_logging
+
+
+logger = logging.getLogger(__name__)
+
+class ConversationPacker:
+    def __init__(self, token_budget=2048, message_overhead=1, conversation_overhead=2, baseline_batch_size=32):
+        """Initialize packer for fixed token budgets
+
+        message_overhead and conversation_overhead match the role token per message
+        and the <bos>/<eos> pair added by tokenized_export.tokenize_conversation.
+        """
+        self.token_budget = token_budget
+        self.message_overhead = message_overhead
+        self.conversation_overhead = conversation_overhead
+        self.baseline_batch_size = baseline_batch_size
+
+    def measure(self, conversations):
+        """Vectorized token length of every message, plus each conversation's message offsets"""
+        message_counts = np.fromiter((len(c.get("messages", [])) for c in conversations),
+                                     dtype=np.int64, count=len(conversations))
+        contents = pd.Series([m.get("content", "") for c in conversations for m in c.get("messages", [])],
+                             dtype=object)
+        # The words tokenized_export.VocabTokenizer encodes: data_processor.normalize_text, vectorized
+        normalized = contents.str.lower()
+        for pattern in NORMALIZE_PATTERNS:
+            normalized = normalized.str.replace(pattern, '', regex=True)
+        message_lengths = normalized.str.count(r'\S+').fillna(0).to_numpy(dtype=np.int64) + self.message_overhead
+        message_starts = np.concatenate(([0], np.cumsum(message_counts)))
+        return message_lengths, message_starts
+
+    def conversation_lengths(self, message_lengths, message_starts):
+        """Token length of each conversation from its message lengths"""
+        # Differences of the running total, which also holds for empty conversations at the end
+        running = np.concatenate(([0], np.cumsum(message_lengths, dtype=np.int64)))
+        return running[message_starts[1:]] - running[message_starts[:-1]] + self.conversation_overhead
+
+    def split_long(self, message_lengths, message_starts):
+        """Split conversations over the token budget at message boundaries
+
+        Returns one (conversation, first message, end message) row per segment, in
+        conversation order, and the segment lengths. A single message longer than the
+        budget is kept whole in its own segment and truncated by the trainer.
+        """
+        lengths = self.conversation_lengths(message_lengths, message_starts)
+        message_counts = np.diff(message_starts)
+        short = np.flatnonzero(lengths <= self.token_budget)
+        segments = [np.stack([short, np.zeros_like(short), message_counts[short]], axis=1)]
+        segment_lengths = [lengths[short]]
+
+        split = []
+        split_lengths = []
+        for position in np.flatnonzero(lengths > self.token_budget).tolist():
+            per_message = message_lengths[message_starts[position]:message_starts[position + 1]].tolist()
+            first = 0
+            current_length = self.conversation_overhead
+            for index, length in enumerate(per_message):
+                if index > first and current_length + length > self.token_budget:
+                    split.append((position, first, index))
+                    split_lengths.append(current_length)
+                    first = index
+                    current_length = self.conversation_overhead
+                current_length += length
+            split.append((position, first, len(per_message)))
+            split_lengths.append(current_length)
+        segments.append(np.array(split, dtype=np.int64).reshape(-1, 3))
+        segment_lengths.append(np.array(split_lengths, dtype=np.int64))
+
+        segments = np.concatenate(segments)
+        order = np.argsort(segments[:, 0], kind='stable')
+        return segments[order], np.concatenate(segment_lengths).astype(np.int64)[order]
+
+    def pack(self, lengths):
+        """Best-fit-decreasing bin packing; returns the bin number of each item"""
+        order = np.argsort(-lengths, kind='stable')
+        assignment = np.empty(len(lengths), dtype=np.int64)
+        bin_count = 0
+        # Distinct remaining capacities kept sorted, each mapping to the bins that have it
+        capacities = []
+        bins_by_capacity = {}
+
+        for position, length in zip(order.tolist(), lengths[order].tolist()):
+            slot = bisect.bisect_left(capacities, length)
+            if slot < len(capacities):
+                capacity = capacities[slot]
+                bins = bins_by_capacity[capacity]
+                bin_number = bins.pop()
+                if not bins:
+                    del bins_by_capacity[capacity]
+                    capacities.pop(slot)
+            else:
+                capacity = max(self.token_budget, length)
+                bin_number = bin_count
+                bin_count += 1
+
+            assignment[position] = bin_number
+            remaining = capacity - length
+            if remaining > 0:
+                if remaining not in bins_by_capacity:
+                    bisect.insort(capacities, remaining)
+                    bins_by_capacity[remaining] = []
+                bins_by_capacity[remaining].append(bin_number)
+
+        return assignment
+
+    def bucket(self, lengths):
+        """Group items of similar length into batches whose padded size fits the token budget"""
+        order = np.argsort(lengths, kind='stable')
+        batches = []
+        current = []
+        current_max = 0
+        for position, length in zip(order.tolist(), lengths[order].tolist()):
+            new_max = max(current_max, length)
+            if current and new_max * (len(current) + 1) > self.token_budget:
+                batches.append(current)
+                current = []
+                new_max = length
+            current.append(position)
+            current_max = new_max
+        if current:
+            batches.append(current)
+        return batches
+
+    def padding_efficiency(self, lengths, batches, padded_size=None):
+        """Share of real tokens in padded batches
+
+        Batches are padded to padded_size (a packed sequence, grown to hold an oversize
+        item) or, without it, to the longest item times the batch size.
+        """
+        real = int(lengths.sum())
+        padded = 0
+        for batch in batches:
+            if not len(batch):
+                continue
+            if padded_size:
+                padded += max(padded_size, int(lengths[batch].sum()))
+            else:
+                padded += int(lengths[batch].max()) * len(batch)
+        return real / padded if padded else 1.0
+
+    def run(self, input_paths, output_path, mode="pack", chunk_size=10000):
+        """Split, then pack or bucket conversations into token budgets and write them as JSONL
+
+        Conversations are measured chunk_size at a time and only segment positions and
+        lengths are kept; each batch's conversations are read back from the dataset as
+        it is written.
+        """
+        if mode not in ("pack", "bucket"):
+            raise ValueError(f"Unsupported packing mode: {mode}")
+
+        dataset = ConversationDataset(input_paths)
+        try:
+            return self._run(dataset, output_path, mode, chunk_size)
+        finally:
+            dataset.close()
+
+    def _run(self, dataset, output_path, mode, chunk_size):
+        original_lengths = []
+        segments = []
+        segment_lengths = []
+        for start in range(0, len(dataset), chunk_size):
+            message_lengths, message_starts = self.measure(dataset[start:start + chunk_size])
+            original_lengths.append(self.conversation_lengths(message_lengths, message_starts))
+            chunk_segments, chunk_lengths = self.split_long(message_lengths, message_starts)
+            chunk_segments[:, 0] += start
+            segments.append(chunk_segments)
+            segment_lengths.append(chunk_lengths)
+        original_lengths = np.concatenate(original_lengths) if original_lengths else np.zeros(0, dtype=np.int64)
+        segments = np.concatenate(segments) if segments else np.zeros((0, 3), dtype=np.int64)
+        segment_lengths = np.concatenate(segment_lengths) if segment_lengths else np.zeros(0, dtype=np.int64)
+
+        baseline_batches = [np.arange(start, min(start + self.baseline_batch_size, len(dataset)))
+                            for start in range(0, len(dataset), self.baseline_batch_size)]
+        before = self.padding_efficiency(original_lengths, baseline_batches)
+        overflow = int((segment_lengths > self.token_budget).sum())
+        if overflow:
+            logger.warning(f"{overflow} single messages exceed the token budget of {self.token_budget}")
+
+        if mode == "pack":
+            assignment = self.pack(segment_lengths)
+            order = np.argsort(assignment, kind='stable')
+            boundaries = np.flatnonzero(np.diff(assignment[order])) + 1
+            batches = np.split(order, boundaries) if len(order) else []
+            after = self.padding_efficiency(segment_lengths, batches, padded_size=self.token_budget)
+        else:
+            batches = [np.array(batch) for batch in self.bucket(segment_lengths)]
+            after = self.padding_efficiency(segment_lengths, batches)
+
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            for batch in batches:
+                record = {
+                    "tokens": int(segment_lengths[batch].sum()),
+                    "conversations": [self._segment(dataset, *segment) for segment in segments[batch].tolist()]
+                }
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+        report = {
+            "mode": mode,
+            "token_budget": self.token_budget,
+            "conversations": len(dataset),
+            "segments": len(segments),
+            "split_conversations": int((original_lengths > self.token_budget).sum()),
+            "batches": len(batches),
+            "padding_efficiency_before": before,
+            "padding_efficiency_after": after,
+            "output_path": output_path
+        }
+        logger.info(f"Packed {len(dataset)} conversations into {len(batches)} {mode} batches of "
+                    f"{self.token_budget} tokens; padding efficiency {before:.1%} -> {after:.1%}")
+        return report
+
+    @staticmethod
+    def _segment(dataset, position, first, end):
+        """A conversation as read from the dataset, or the messages of one of its segments"""
+        conversation = dataset[position]
+        messages = conversation.get("messages", [])
+        if first == 0 and end == len(messages):
+            return conversation
+        return {"messages": messages[first:end]}
+
+if __name__ == "__main__":
+    setup_logging(log_file=None)
+    import argparse
+    parser = argparse.ArgumentParser(description="Pack training conversations into fixed token budgets")
+    parser.add_argument("inputs", nargs="+", help="JSONL files or .shards.json manifests")
+    parser.add_argument("--output", required=True, help="Output JSONL with one packed batch per line")
+    parser.add_argument("--token-budget", type=int, default=2048, help="Tokens per packed sequence or batch")
+    parser.add_argument("--mode", choices=["pack", "bucket"], default="pack",
+                        help="pack: bin-pack into sequences; bucket: length-bucketed padded batches")
+    args = parser.parse_args()
+
+    packer = ConversationPacker(token_budget=args.token_budget)
+    print(json.dumps(packer.run(args.inputs, args.output, mode=args.mode), indent=2))
@@ -1,26 +1,83 @@
 import pandas as pd
+import numpy as np
 import json
 import os
+import mmap
+import hashlib
 import logging
+from json.encoder import encode_basestring
+from jsonl_shards import JsonlWriter, ShardedJsonlWriter, ShardedJsonlReader, manifest_path_for
+from thread_builder import ThreadBuilder
+from profiling import hot_timers
+from frame_schema import read_frame
 
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+SINGLE_TURN_PROMPT = "Please respond in Finnish style to the following content"
+
+DEFAULT_SPLIT_RATIOS = {"train": 0.9, "validation": 0.05, "test": 0.05}
+
 class ConversationProcessor:
-    def __init__(self, output_dir="data/training"):
-        """Initialize conversation processor"""
+    def __init__(self, output_dir="data/training", batch_size=10000,
+                 write_buffer_size=8 * 1024 * 1024, json_encoder="json",
+                 output_format="jsonl", shard_size_bytes=256 * 1024 * 1024, compression="gzip",
+                 shard_block_size=64 * 1024, max_thread_turns=16, split_ratios=None, split_salt="finnish-chatbot"):
+        """Initialize conversation processor
+
+        With split_ratios (e.g. DEFAULT_SPLIT_RATIOS) every output is written once per split,
+        as <name>.<split>.jsonl, with conversations assigned by a stable hash of post_id.
+        """
+        if output_format not in ("jsonl", "sharded"):
+            raise ValueError(f"Unsupported output format: {output_format}")
+        if split_ratios and abs(sum(split_ratios.values()) - 1.0) > 1e-9:
+            raise ValueError(f"Split ratios must sum to 1: {split_ratios}")
+
         self.output_dir = output_dir
+        self.batch_size = batch_size
+        self.write_buffer_size = write_buffer_size
+        self.output_format = output_format
+        self.shard_size_bytes = shard_size_bytes
+        self.compression = compression
+        self.shard_block_size = shard_block_size
+        self.thread_builder = ThreadBuilder(max_turns=max_thread_turns)
+        self.split_ratios = dict(split_ratios) if split_ratios else None
+        self.split_salt = split_salt
+        self.split_counts = {}
+        self._encode_string = self._load_string_encoder(json_encoder)
         os.makedirs(output_dir, exist_ok=True)
 
+    def _load_string_encoder(self, json_encoder):
+        """Select the encoder used for JSON string values"""
+        if json_encoder == "orjson":
+            try:
+                import orjson
+
+                def encode_with_orjson(value):
+                    try:
+                        return orjson.dumps(value).decode('utf-8')
+                    except TypeError:
+                        # orjson rejects lone surrogates, the stdlib encoder does not
+                        return encode_basestring(value)
+
+                logger.info("Using orjson for JSONL string encoding")
+                return encode_with_orjson
+            except ImportError:
+                logger.warning("orjson library not installed, using standard json encoder")
+        elif json_encoder != "json":
+            logger.warning(f"Unknown JSON encoder '{json_encoder}', using standard json encoder")
+
+        return encode_basestring
+
     def process_csv_to_jsonl(self, csv_file):
         """Convert processed CSV to JSONL format for training data"""
         try:
             logger.info(f"Starting to process file: {csv_file}")
-            df = pd.read_csv(csv_file, encoding='utf-8')
+            df = read_frame(csv_file, encoding='utf-8')
 
 
             base_filename = os.path.basename(csv_file).split('.')[0]
+            self.split_counts = {}
 
 
             single_turn_path = os.path.join(self.output_dir, f"{base_filename}_single_turn.jsonl")
@@ -30,79 +87,404 @@ class ConversationProcessor:
             multi_turn_path = os.path.join(self.output_dir, f"{base_filename}_multi_turn.jsonl")
             multi_turn_count = self._create_multi_turn_data(df, multi_turn_path)
 
-            logger.info(f"Processing complete. Generated {single_turn_count} single-turn and {multi_turn_count} multi-turn conversations")
-
-            return {
-                "single_turn_path": single_turn_path,
-                "multi_turn_path": multi_turn_path,
+            result = {
+                "single_turn_path": self._result_path(single_turn_path),
+                "multi_turn_path": self._result_path(multi_turn_path),
                 "single_turn_count": single_turn_count,
-                "multi_turn_count": multi_turn_count
+                "multi_turn_count": multi_turn_count,
+                "input_rows": len(df)
             }
 
+            if self.split_ratios:
+                result["splits"] = {
+                    "single_turn": self.split_counts.get(single_turn_path, {}),
+                    "multi_turn": self.split_counts.get(multi_turn_path, {})
+                }
+                splits_path = os.path.join(self.output_dir, f"{base_filename}_splits.json")
+                with open(splits_path, 'w', encoding='utf-8') as f:
+                    json.dump({"ratios": self.split_ratios, "salt": self.split_salt,
+                               "counts": result["splits"]}, f, indent=2)
+                logger.info(f"Split counts saved: {splits_path}")
+
+            logger.info(f"Processing complete. Generated {single_turn_count} single-turn and {multi_turn_count} multi-turn conversations")
+
+            return result
+
         except Exception as e:
             logger.error(f"Error processing CSV to generate training data: {str(e)}")
             raise
 
+    def _encode_value(self, value):
+        """Encode a single message content exactly as json.dumps(ensure_ascii=False) would"""
+        if type(value) is str:
+            return self._encode_string(value)
+        return json.dumps(value, ensure_ascii=False)
+
+    def split_path(self, output_path, split):
+        """Path of one split of an output, e.g. x_single_turn.jsonl -> x_single_turn.train.jsonl"""
+        root, extension = os.path.splitext(output_path)
+        return f"{root}.{split}{extension}"
+
+    def _result_path(self, output_path):
+        """Path (or per-split paths) that consumers should open for an output"""
+        final_path = manifest_path_for if self.output_format == "sharded" else (lambda path: path)
+        if self.split_ratios:
+            return {split: final_path(self.split_path(output_path, split)) for split in self.split_ratios}
+        return final_path(output_path)
+
+    def assign_splits(self, df):
+        """Split number of every row from a stable hash of its post_id (text when post_id is missing)"""
+        if 'post_id' in df.columns:
+            keys = df['post_id'].astype(object).where(df['post_id'].notna(), df.get('text'))
+        else:
+            keys = df.get('text', pd.Series('', index=df.index))
+        codes, uniques = pd.factorize(keys.astype(str))
+
+        # blake2b of salt and key, so an item's split never depends on what else is in the corpus
+        points = np.array([
+            int.from_bytes(hashlib.blake2b(f"{self.split_salt}:{key}".encode('utf-8'), digest_size=8).digest(), 'big')
+            / 2 ** 64
+            for key in uniques
+        ], dtype=np.float64)
+        boundaries = np.cumsum(list(self.split_ratios.values()))[:-1]
+        unique_splits = np.searchsorted(boundaries, points, side='right')
+        return unique_splits[codes] if len(codes) else np.zeros(0, dtype=np.int64)
+
+    def _open_writer(self, output_path):
+        if self.output_format == "sharded":
+            return ShardedJsonlWriter(output_path, shard_size_bytes=self.shard_size_bytes,
+                                      compression=self.compression, block_size_bytes=self.shard_block_size)
+        return JsonlWriter(output_path, batch_size=self.batch_size, buffer_size=self.write_buffer_size)
+
+    def _write_lines(self, output_path, lines):
+        """Write JSONL lines in batches through a large write buffer (or into shards)"""
+        count = 0
+        with self._open_writer(output_path) as writer:
+            for line in lines:
+                writer.write(line)
+                count += 1
+        return count
+
+    def _open_outputs(self, output_path):
+        """One writer for the output, or one per split when splitting"""
+        if not self.split_ratios:
+            return [self._open_writer(output_path)]
+        return [self._open_writer(self.split_path(output_path, split)) for split in self.split_ratios]
+
+    def _write_keyed(self, df, writers, keyed_lines, counts):
+        """Write (row, line) pairs of df to already open writers, routing rows to their split"""
+        # Producing each pair is where rows are serialized to JSON
+        keyed_lines = hot_timers.iterate("conversation.json_serialization", keyed_lines)
+        if not self.split_ratios:
+            writer = writers[0]
+            for _, line in keyed_lines:
+                writer.write(line)
+                counts[0] += 1
+            return
+
+        row_splits = self.assign_splits(df).tolist()
+        for row, line in keyed_lines:
+            split = row_splits[row]
+            writers[split].write(line)
+            counts[split] += 1
+
+    def _write_conversations(self, df, output_path, keyed_lines):
+        """Write (row, line) pairs to one output, or to one output per split in a single pass"""
+        writers = self._open_outputs(output_path)
+        counts = [0] * len(writers)
+        try:
+            self._write_keyed(df, writers, keyed_lines, counts)
+        finally:
+            for writer in writers:
+                writer.close()
+
+        if self.split_ratios:
+            self.split_counts[output_path] = dict(zip(self.split_ratios, counts))
+        return sum(counts)
+
+    def open_stream(self, base_filename):
+        """Open single- and multi-turn outputs that record batches are appended to"""
+        return ConversationStream(self, base_filename)
+
+    def _single_turn_mask(self, texts):
+        """Vectorized mask of texts that are strings with at least 10 non-blank characters"""
+        try:
+            lengths = texts.str.strip().str.len()
+        except AttributeError:
+            # Column holds no strings at all
+            return np.zeros(len(texts), dtype=bool)
+        return (lengths >= 10).to_numpy()
+
+    def _single_turn_lines(self, df):
+        """(row, JSON line) of every single-turn conversation in df"""
+        if 'text' not in df.columns:
+            return iter(())
+
+        texts = df['text']
+        kept_rows = np.flatnonzero(self._single_turn_mask(texts))
+        kept_texts = texts.iloc[kept_rows].tolist()
+
+        prefix = ('{"messages": [{"role": "human", "content": ' + self._encode_string(SINGLE_TURN_PROMPT)
+                  + '}, {"role": "assistant", "content": ')
+        suffix = '}]}'
+        encode = self._encode_string
+
+        return zip(kept_rows.tolist(), (prefix + encode(text) + suffix for text in kept_texts))
+
     def _create_single_turn_data(self, df, output_path):
         """Create single-turn conversation data"""
-        count = 0
-        with open(output_path, 'w', encoding='utf-8') as f:
-            for _, row in df.iterrows():
-                try:
-                    if not isinstance(row.get('text', ''), str) or len(row.get('text', '').strip()) < 10:
-                        continue
-
-                    conversation = {
-                        "messages": [
-                            {"role": "human", "content": "Please respond in Finnish style to the following content"},
-                            {"role": "assistant", "content": row.get('text', '')}
-                        ]
-                    }
-
-                    f.write(json.dumps(conversation, ensure_ascii=False) + '\n')
-                    count += 1
-                except Exception as e:
-                    logger.warning(f"Error processing single-turn conversation row: {str(e)}")
-                    continue
+        count = self._write_conversations(df, output_path, self._single_turn_lines(df))
 
         logger.info(f"JSONL file saved: {output_path}")
         return count
 
+    def _iter_post_groups(self, df):
+        """Yield row positions of each post_id group in groupby('post_id') order"""
+        codes, _ = pd.factorize(df['post_id'], sort=True)
+        order = np.argsort(codes, kind='stable')
+        # Rows without a post_id are dropped by groupby, so drop them here as well
+        order = order[codes[order] >= 0]
+        if len(order) == 0:
+            return
+
+        sorted_codes = codes[order]
+        boundaries = np.flatnonzero(np.diff(sorted_codes)) + 1
+        starts = np.concatenate(([0], boundaries))
+        ends = np.concatenate((boundaries, [len(order)]))
+
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            yield order[start:end]
+
+    def _multi_turn_lines(self, df):
+        """(first row, JSON line) of every multi-turn conversation in df"""
+        if 'post_id' not in df.columns:
+            return
+
+        if 'text' in df.columns:
+            contents = df['text'].tolist()
+        else:
+            contents = [''] * len(df)
+        encode = self._encode_value
+        roles = ('{"role": "human", "content": ', '{"role": "assistant", "content": ')
+
+        if {'comment_id', 'parent_id'}.issubset(df.columns):
+            groups = self.thread_builder.iter_chains(df)
+        else:
+            groups = self._iter_post_groups(df)
+
+        for positions in groups:
+            if len(positions) > 1:
+                positions = positions.tolist()
+                messages = [roles[i % 2] + encode(contents[pos]) + '}'
+                            for i, pos in enumerate(positions)]
+                yield positions[0], '{"messages": [' + ', '.join(messages) + ']}'
+
     def _create_multi_turn_data(self, df, output_path):
-        """Create multi-turn conversation data"""
+        """Create multi-turn conversation data
+
+        When the input carries comment_id and parent_id, each root-to-leaf reply chain becomes
+        one conversation; older files without them fall back to one conversation per post_id.
+        """
         count = 0
 
 
         if 'post_id' not in df.columns:
-            with open(output_path, 'w', encoding='utf-8') as f:
-                pass
+            self._write_conversations(df, output_path, [])
             return 0
 
         try:
 
-            grouped = df.groupby('post_id')
-
-            with open(output_path, 'w', encoding='utf-8') as f:
-                for post_id, group in grouped:
-                    if len(group) > 1:
-                        messages = []
-
-                        for i, (_, comment) in enumerate(group.iterrows()):
-                            if i % 2 == 0:
-                                messages.append({"role": "human", "content": comment.get('text', '')})
-                            else:
-                                messages.append({"role": "assistant", "content": comment.get('text', '')})
-
-                        if len(messages) >= 2:
-                            conversation = {"messages": messages}
-                            f.write(json.dumps(conversation, ensure_ascii=False) + '\n')
-                            count += 1
+            count = self._write_conversations(df, output_path, self._multi_turn_lines(df))
 
             logger.info(f"JSONL file saved: {output_path}")
             return count
 
         except Exception as e:
             logger.error(f"Error generating multi-turn conversation data: {str(e)}")
-            with open(output_path, 'w', encoding='utf-8') as f:
-                pass
-            return 0
\ No newline at end of file
+            self._write_conversations(df, output_path, [])
+            return 0
+
+
+class ConversationStream:
+    def __init__(self, processor, base_filename):
+        """Single- and multi-turn outputs kept open while record batches arrive
+
+        Each batch must contain whole posts, as RedditCollector.iter_batches yields them.
+        """
+        self.processor = processor
+        self.single_turn_path = os.path.join(processor.output_dir, f"{base_filename}_single_turn.jsonl")
+        self.multi_turn_path = os.path.join(processor.output_dir, f"{base_filename}_multi_turn.jsonl")
+        self._single_writers = processor._open_outputs(self.single_turn_path)
+        self._multi_writers = processor._open_outputs(self.multi_turn_path)
+        self._single_counts = [0] * len(self._single_writers)
+        self._multi_counts = [0] * len(self._multi_writers)
+
+    def write_batch(self, df):
+        """Append the conversations of one processed batch"""
+        df = df.reset_index(drop=True)
+        self.processor._write_keyed(df, self._single_writers, self.processor._single_turn_lines(df),
+                                    self._single_counts)
+        try:
+            self.processor._write_keyed(df, self._multi_writers, self.processor._multi_turn_lines(df),
+                                        self._multi_counts)
+        except Exception as e:
+            logger.error("Error generating multi-turn conversation data for batch: %s", e)
+
+    def close(self):
+        """Close the outputs and return the same statistics as process_csv_to_jsonl"""
+        for writer in self._single_writers + self._multi_writers:
+            writer.close()
+
+        result = {
+            "single_turn_path": self.processor._result_path(self.single_turn_path),
+            "multi_turn_path": self.processor._result_path(self.multi_turn_path),
+            "single_turn_count": sum(self._single_counts),
+            "multi_turn_count": sum(self._multi_counts)
+        }
+        if self.processor.split_ratios:
+            result["splits"] = {
+                "single_turn": dict(zip(self.processor.split_ratios, self._single_counts)),
+                "multi_turn": dict(zip(self.processor.split_ratios, self._multi_counts))
+            }
+        logger.info(f"Streamed {result['single_turn_count']} single-turn and "
+                    f"{result['multi_turn_count']} multi-turn conversations")
+        return result
+
+class ConversationDataset:
+    def __init__(self, paths, index_chunk_size=64 * 1024 * 1024):
+        """Open generated JSONL files (or shard manifests) for memory-mapped random access"""
+        if isinstance(paths, str):
+            paths = [paths]
+        self.paths = list(paths)
+        self.index_chunk_size = index_chunk_size
+
+        self._offsets = []
+        self._maps = {}
+        self._readers = {}
+        counts = []
+        for path in self.paths:
+            if path.endswith('.shards.json'):
+                reader = ShardedJsonlReader(path)
+                self._readers[path] = reader
+                self._offsets.append(None)
+                counts.append(len(reader))
+            else:
+                offsets = self._load_or_build_index(path)
+                self._offsets.append(offsets)
+                counts.append(len(offsets) - 1)
+
+        # Global position of the first record of each file
+        self._starts = np.concatenate(([0], np.cumsum(counts, dtype=np.int64)))
+        logger.info(f"Opened dataset with {len(self)} conversations from {len(self.paths)} files")
+
+    @staticmethod
+    def index_path_for(path):
+        """Sidecar path of the line-offset index of a plain JSONL file"""
+        return f"{path}.offsets.npy"
+
+    def _load_or_build_index(self, path):
+        """Load the line-offset index, rebuilding it when missing or stale"""
+        index_path = self.index_path_for(path)
+        file_size = os.path.getsize(path)
+
+        if os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(path):
+            try:
+                offsets = np.load(index_path, mmap_mode='r')
+                if len(offsets) > 0 and offsets[-1] == file_size:
+                    return offsets
+            except Exception as e:
+                logger.warning(f"Could not load index {index_path}: {str(e)}")
+
+        logger.info(f"Building line-offset index for {path}")
+        offsets = [np.zeros(1, dtype=np.int64)]
+        if file_size > 0:
+            data = self._map(path)
+            for chunk_start in range(0, file_size, self.index_chunk_size):
+                chunk = np.frombuffer(data, dtype=np.uint8, count=min(self.index_chunk_size, file_size - chunk_start),
+                                      offset=chunk_start)
+                offsets.append(np.flatnonzero(chunk == ord('\n')).astype(np.int64) + chunk_start + 1)
+                del chunk
+            if data[file_size - 1] != ord('\n'):
+                offsets.append(np.array([file_size], dtype=np.int64))
+        offsets = np.concatenate(offsets)
+
+        try:
+            np.save(index_path, offsets)
+        except OSError as e:
+            logger.warning(f"Could not save index {index_path}: {str(e)}")
+        return offsets
+
+    def _map(self, path):
+        data = self._maps.get(path)
+        if data is None:
+            with open(path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[path] = data
+        return data
+
+    def _reader(self, path):
+        reader = self._readers.get(path)
+        if reader is None:
+            reader = ShardedJsonlReader(path)
+            self._readers[path] = reader
+        return reader
+
+    def __len__(self):
+        return int(self._starts[-1])
+
+    def read_line(self, position):
+        """Return the conversation at a global position as a raw JSON string"""
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError(f"Conversation {position} out of range")
+
+        file_number = int(np.searchsorted(self._starts, position, side='right')) - 1
+        local = position - int(self._starts[file_number])
+        path = self.paths[file_number]
+
+        if self._offsets[file_number] is None:
+            return self._reader(path).read_line(local)
+
+        offsets = self._offsets[file_number]
+        start, end = int(offsets[local]), int(offsets[local + 1])
+        return self._map(path)[start:end].decode('utf-8').rstrip('\n')
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[position] for position in range(*key.indices(len(self)))]
+        return json.loads(self.read_line(key))
+
+    def order(self, shuffle=False, seed=0, epoch=0, num_shards=1, shard_id=0):
+        """Positions visited by one worker: optionally shuffled, then strided across num_shards"""
+        if not 0 <= shard_id < num_shards:
+            raise ValueError(f"shard_id must be in [0, {num_shards})")
+        if shuffle:
+            positions = np.random.default_rng([seed, epoch]).permutation(len(self))
+        else:
+            positions = np.arange(len(self))
+        return positions[shard_id::num_shards]
+
+    def iterate(self, shuffle=False, seed=0, epoch=0, num_shards=1, shard_id=0):
+        """Iterate conversations deterministically, optionally shuffled and sharded across workers"""
+        for position in self.order(shuffle, seed, epoch, num_shards, shard_id).tolist():
+            yield self[position]
+
+    def __iter__(self):
+        return self.iterate()
+
+    def close(self):
+        for data in self._maps.values():
+            data.close()
+        for reader in self._readers.values():
+            reader.close()
+        self._maps = {}
+        self._readers = {}
+
+    def __getstate__(self):
+        # Memory maps and open files are reopened lazily in each worker process
+        state = self.__dict__.copy()
+        state['_maps'] = {}
+        state['_offsets'] = [None if offsets is None else np.asarray(offsets) for offsets in self._offsets]
+        state['_readers'] = {}
+        return state
@@ -0,0 +1,316 @@
+import os
+import re
+import json
+import sqlite3
+import hashlib
+import logging
+import tempfile
+from collections import Counter
+from itertools import chain
+from contextlib import closing
+import numpy as np
+import pandas as pd
+from frame_schema import STRING_DTYPE
+from pipeline_logging import setup_logging
+
+
+logger = logging.getLogger(__name__)
+
+# Runs of letters, lowercased; digits, punctuation and underscores separate tokens
+TOKEN_PATTERN = re.compile(r"[^\W\d_]+")
+TEXT_COLUMNS = ["processed_text", "text"]
+
+def _hashes(keys):
+    """Stable 64-bit hashes of strings, the same in every process so sketches can be merged"""
+    digests = b''.join(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest() for key in keys)
+    return np.frombuffer(digests, dtype='<u8')
+
+class CountMinSketch:
+    def __init__(self, width=2 ** 20, depth=4):
+        """Frequency estimates that never undercount, off by at most 2N/width with high probability"""
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.uint64)
+
+    def _columns(self, hashes):
+        # Double hashing: row i uses h1 + i * h2
+        h1 = hashes & np.uint64(0xFFFFFFFF)
+        h2 = (hashes >> np.uint64(32)) | np.uint64(1)
+        return [((h1 + np.uint64(i) * h2) % np.uint64(self.width)).astype(np.int64) for i in range(self.depth)]
+
+    def add(self, hashes, counts):
+        for row, columns in enumerate(self._columns(hashes)):
+            self.table[row] += np.bincount(columns, weights=counts, minlength=self.width).astype(np.uint64)
+
+    def estimate(self, hashes):
+        return np.min([self.table[row, columns] for row, columns in enumerate(self._columns(hashes))], axis=0)
+
+    def merge(self, other):
+        self.table += other.table
+
+class HyperLogLog:
+    def __init__(self, precision=14):
+        """Distinct count in 2**precision one-byte registers, about 1.04 / sqrt(2**precision) relative error"""
+        self.precision = precision
+        self.registers = np.zeros(2 ** precision, dtype=np.uint8)
+
+    def add(self, hashes):
+        if len(hashes) == 0:
+            return
+        buckets = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - self.precision)) - 1)
+        # Position of the leftmost 1 bit in the remaining 64 - precision bits (exact in float64 below 2**53)
+        bit_length = np.frexp(rest.astype(np.float64))[1]
+        rank = (64 - self.precision - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, buckets, rank)
+
+    def count(self):
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+class HeavyHitters:
+    def __init__(self, capacity=10000):
+        """Misra-Gries summary: every key seen more than N/(capacity+1) times keeps a counter
+
+        Counters are lower bounds of the true counts. Summaries of separate streams merge
+        by adding counters and pruning back to capacity.
+        """
+        self.capacity = capacity
+        self.counters = Counter()
+
+    def add(self, counts):
+        self.counters.update(counts)
+        self._prune()
+
+    def _prune(self):
+        if len(self.counters) <= self.capacity:
+            return
+        values = np.fromiter(self.counters.values(), dtype=np.int64, count=len(self.counters))
+        threshold = int(np.partition(values, len(values) - self.capacity - 1)[len(values) - self.capacity - 1])
+        self.counters = Counter({key: count - threshold for key, count in self.counters.items() if count > threshold})
+
+    def merge(self, other):
+        self.add(other.counters)
+
+class CorpusStatistics:
+    def __init__(self, ngram_orders=(1, 2), width=2 ** 20, depth=4, precision=14,
+                 vocabulary_capacity=50000, ngram_capacity=10000):
+        """Bounded-memory token and n-gram statistics of a stream of texts
+
+        One Count-Min sketch holds the frequencies of all n-grams (n-grams are joined
+        with spaces, so they never collide with tokens), with a HyperLogLog and a
+        heavy-hitter summary per order, and a heavy-hitter summary of document
+        frequencies of tokens for stopword derivation. Everything else is exact
+        counters, so memory does not grow with the corpus.
+        """
+        self.options = {
+            "ngram_orders": list(ngram_orders), "width": width, "depth": depth, "precision": precision,
+            "vocabulary_capacity": vocabulary_capacity, "ngram_capacity": ngram_capacity
+        }
+        self.frequencies = CountMinSketch(width, depth)
+        self.distinct = {n: HyperLogLog(precision) for n in ngram_orders}
+        self.heavy_hitters = {n: HeavyHitters(vocabulary_capacity if n == 1 else ngram_capacity) for n in ngram_orders}
+        self.document_frequencies = HeavyHitters(vocabulary_capacity)
+        self.documents = 0
+        self.ngram_totals = {n: 0 for n in ngram_orders}
+
+    def update(self, texts):
+        """Add one batch of texts; counting the batch exactly first keeps sketch updates per distinct key"""
+        token_lists = [TOKEN_PATTERN.findall(text.lower()) for text in texts if isinstance(text, str)]
+        self.documents += len(token_lists)
+        self.document_frequencies.add(Counter(token for tokens in token_lists for token in set(tokens)))
+
+        for n in self.distinct:
+            if n == 1:
+                counts = Counter(chain.from_iterable(token_lists))
+            else:
+                # Counted as tuples, joined once per distinct n-gram
+                grams = Counter(chain.from_iterable(zip(*(tokens[i:] for i in range(n))) for tokens in token_lists))
+                counts = Counter({' '.join(gram): count for gram, count in grams.items()})
+            if not counts:
+                continue
+            keys = list(counts)
+            hashes = _hashes(keys)
+            self.frequencies.add(hashes, np.fromiter(counts.values(), dtype=np.float64, count=len(counts)))
+            self.distinct[n].add(hashes)
+            self.heavy_hitters[n].add(counts)
+            self.ngram_totals[n] += sum(counts.values())
+
+    def merge(self, other):
+        """Fold in statistics of another stream built with the same options"""
+        if other.options != self.options:
+            raise ValueError(f"Cannot merge corpus statistics built with different options: {other.options} != {self.options}")
+        self.frequencies.merge(other.frequencies)
+        for n in self.distinct:
+            self.distinct[n].merge(other.distinct[n])
+            self.heavy_hitters[n].merge(other.heavy_hitters[n])
+            self.ngram_totals[n] += other.ngram_totals[n]
+        self.document_frequencies.merge(other.document_frequencies)
+        self.documents += other.documents
+        return self
+
+    def estimate(self, keys):
+        """Count-Min frequency estimates (upper bounds) of tokens or space-joined n-grams"""
+        keys = list(keys)
+        return dict(zip(keys, self.frequencies.estimate(_hashes(keys)).tolist())) if keys else {}
+
+    def top(self, n=1, k=20):
+        """The k most frequent n-grams of order n with their estimated counts"""
+        candidates = self.heavy_hitters[n].counters.most_common(k)
+        estimates = self.estimate(key for key, _ in candidates)
+        return sorted(estimates.items(), key=lambda item: (-item[1], item[0]))
+
+    def stopwords(self, min_document_share=0.05, max_words=200):
+        """Tokens found in at least min_document_share of the documents, most common first"""
+        min_documents = min_document_share * max(self.documents, 1)
+        return [token for token, count in self.document_frequencies.counters.most_common(max_words)
+                if count >= min_documents]
+
+    def vocabulary(self, min_count=5):
+        """(token, estimated count) pairs of the tracked tokens seen at least min_count times"""
+        return [(token, count) for token, count in self.top(1, self.options["vocabulary_capacity"]) if count >= min_count]
+
+    def summary(self, k=20):
+        return {
+            "documents": self.documents,
+            "ngram_totals": {str(n): total for n, total in self.ngram_totals.items()},
+            "distinct_estimates": {str(n): hll.count() for n, hll in self.distinct.items()},
+            "top": {str(n): self.top(n, k) for n in self.distinct}
+        }
+
+    def save(self, path):
+        """Write the sketches to one .npz file, atomically"""
+        state = {
+            "options": self.options,
+            "documents": self.documents,
+            "ngram_totals": {str(n): total for n, total in self.ngram_totals.items()},
+            "heavy_hitters": {str(n): dict(summary.counters) for n, summary in self.heavy_hitters.items()},
+            "document_frequencies": dict(self.document_frequencies.counters)
+        }
+        arrays = {f"distinct_{n}": hll.registers for n, hll in self.distinct.items()}
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.corpus_stats.', suffix='.npz')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez_compressed(f, frequencies=self.frequencies.table,
+                                    state=np.array(json.dumps(state, ensure_ascii=False)), **arrays)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            state = json.loads(str(data["state"]))
+            stats = cls(**state["options"])
+            stats.frequencies.table = data["frequencies"].copy()
+            for n, hll in stats.distinct.items():
+                hll.registers = data[f"distinct_{n}"].copy()
+        stats.documents = state["documents"]
+        stats.ngram_totals = {int(n): total for n, total in state["ngram_totals"].items()}
+        for n, counters in state["heavy_hitters"].items():
+            stats.heavy_hitters[int(n)].counters = Counter(counters)
+        stats.document_frequencies.counters = Counter(state["document_frequencies"])
+        return stats
+
+def iter_database_texts(db_path="data/finnish_chatbot.db", column="processed_text", batch_rows=50000):
+    """Batches of one text column of the conversations table, read with a cursor"""
+    if column not in TEXT_COLUMNS:
+        raise ValueError(f"Unknown text column '{column}', expected one of {TEXT_COLUMNS}")
+    with closing(sqlite3.connect(db_path, timeout=60.0)) as conn:
+        cursor = conn.execute(f"SELECT {column} FROM conversations")
+        while True:
+            rows = cursor.fetchmany(batch_rows)
+            if not rows:
+                return
+            yield [row[0] for row in rows]
+
+def iter_file_texts(paths, column="processed_text", batch_rows=50000):
+    """Batches of one text column of processed CSV files, read in chunks"""
+    for path in paths:
+        for chunk in pd.read_csv(path, usecols=[column], dtype={column: STRING_DTYPE}, chunksize=batch_rows):
+            yield chunk[column].dropna().tolist()
+
+def build_statistics(batches, stats=None, **options):
+    """Feed batches of texts into stats (a new CorpusStatistics built from options by default)"""
+    stats = stats or CorpusStatistics(**options)
+    for batch in batches:
+        stats.update(batch)
+    return stats
+
+def merge_sketches(paths, output_path=None):
+    """CorpusStatistics of several sketch files merged, saved to output_path when given"""
+    stats = CorpusStatistics.load(paths[0])
+    for path in paths[1:]:
+        stats.merge(CorpusStatistics.load(path))
+    if output_path:
+        stats.save(output_path)
+    return stats
+
+def write_stopwords(stats, path="data/stats/stopwords.txt", min_document_share=0.05, max_words=200):
+    """One derived stopword per line"""
+    words = stats.stopwords(min_document_share=min_document_share, max_words=max_words)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(f"{word}\n" for word in words)
+    logger.info(f"Wrote {len(words)} derived stopwords to {path}")
+    return path
+
+def write_vocabulary(stats, path="data/stats/vocabulary.tsv", min_count=5):
+    """token<TAB>estimated count per line, most frequent first"""
+    vocabulary = stats.vocabulary(min_count=min_count)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(f"{token}\t{count}\n" for token, count in vocabulary)
+    logger.info(f"Wrote vocabulary of {len(vocabulary)} tokens to {path}")
+    return path
+
+def load_stopwords(path):
+    """Stopwords written by write_stopwords"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return {line.strip() for line in f if line.strip()}
+
+if __name__ == "__main__":
+    setup_logging(log_file=None)
+    import argparse
+    parser = argparse.ArgumentParser(description="Streaming token statistics, derived stopwords and vocabulary")
+    parser.add_argument("--output-dir", default="data/stats", help="Directory for stopwords.txt and vocabulary.tsv")
+    parser.add_argument("--min-document-share", type=float, default=0.05, help="Document share making a token a stopword")
+    parser.add_argument("--min-count", type=int, default=5, help="Smallest count kept in the vocabulary")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Stream texts into sketches (the database by default)")
+    build_parser.add_argument("files", nargs="*", help="Processed CSV files to read instead of the database")
+    build_parser.add_argument("--db", default="data/finnish_chatbot.db", help="Database to read")
+    build_parser.add_argument("--column", choices=TEXT_COLUMNS, default="processed_text", help="Text column")
+    build_parser.add_argument("--sketch", default="data/stats/corpus_stats.npz", help="Sketch file to write")
+    build_parser.add_argument("--merge", action="store_true", help="Add to the existing sketch file instead of replacing it")
+
+    merge_parser = subparsers.add_parser("merge", help="Merge sketch files from separate runs")
+    merge_parser.add_argument("sketches", nargs="+", help="Sketch files to merge")
+    merge_parser.add_argument("--sketch", default="data/stats/corpus_stats.npz", help="Merged sketch file to write")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        batches = iter_file_texts(args.files, args.column) if args.files else iter_database_texts(args.db, args.column)
+        existing = CorpusStatistics.load(args.sketch) if args.merge and os.path.exists(args.sketch) else None
+        stats = build_statistics(batches, stats=existing)
+        stats.save(args.sketch)
+    else:
+        stats = merge_sketches(args.sketches, args.sketch)
+
+    write_stopwords(stats, os.path.join(args.output_dir, "stopwords.txt"), min_document_share=args.min_document_share)
+    write_vocabulary(stats, os.path.join(args.output_dir, "vocabulary.tsv"), min_count=args.min_count)
+    print(json.dumps(stats.summary(), indent=2, ensure_ascii=False))
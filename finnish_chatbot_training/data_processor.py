@@ -1,9 +1,17 @@
 import pandas as pd
 import re
 import os
+import hashlib
 import logging
 import nltk
 from nltk.corpus import stopwords
+from checkpoint import Checkpoint, rows_digest
+from frame_schema import read_frame
+from quality_scoring import QualityScorer
+from transform_plan import TransformPlan
+from corpus_stats import load_stopwords
+from profiling import hot_timers
+from pipeline_logging import setup_logging
 
 
 import ssl
@@ -22,14 +30,44 @@ except Exception as e:
     print(f"Automatic NLTK data download failed: {str(e)}")
 
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Steps of process_file in declaration order; the plan executor may run row-wise ones in another order
+PROCESS_STEPS = ["validate", "dedup", "filter", "score", "preprocess"]
+
+# Removed from lowercased text by normalize_text, in this order: links, HTML tags, punctuation, digits
+NORMALIZE_PATTERNS = [r'https?://\S+|www\.\S+', r'<.*?>', r'[^\w\s]', r'\d+']
+
+def normalize_text(text):
+    """Word tokens of text as in processed_text, before stopword removal
+
+    Shared with tokenized_export, so vocabularies and encodings see the same words.
+    """
+    if not isinstance(text, str):
+        return []
+    text = text.lower()
+    for pattern in NORMALIZE_PATTERNS:
+        text = re.sub(pattern, '', text)
+    return text.split()
+
 class DataProcessor:
-    def __init__(self):
-        """Initialize data processor"""
+    def __init__(self, checkpoint_dir="data/checkpoints", checkpoint_rows=50000, quality_thresholds=None,
+                 steps=None, stopwords_file=None):
+        """Initialize data processor
+
+        quality_thresholds overrides entries of quality_scoring.QUALITY_THRESHOLDS and
+        steps selects and orders the PROCESS_STEPS run by process_file. stopwords_file
+        adds stopwords, one per line, e.g. a list derived by corpus_stats.py.
+        """
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_rows = checkpoint_rows
+        self.quality_scorer = QualityScorer(quality_thresholds)
+        self.steps = list(steps or PROCESS_STEPS)
+        self.last_stats = {"rows_in": 0, "rows_out": 0, "quality_rejections": {}, "plan": None}
         # Finnish stopwords list
         self.stopwords = self._load_stopwords()
+        if stopwords_file:
+            self.stopwords |= load_stopwords(stopwords_file)
         logger.info(f"Loaded {len(self.stopwords)} Finnish stopwords")
 
     def _load_stopwords(self):
@@ -55,7 +93,11 @@ class DataProcessor:
         return set(custom_finnish_stopwords)
 
     def process_file(self, input_file, max_retries=3):
-        """Process a single file with robust error handling"""
+        """Process a single file with robust error handling
+
+        self.steps run as a TransformPlan: filtering, scoring and preprocessing are
+        fused into one pass over checkpoint_rows chunks, written out chunk by chunk.
+        """
         attempt = 0
         errors_detected = 0
         repairs_made = 0
@@ -72,77 +114,70 @@ class DataProcessor:
 
 
                 try:
-                    df = pd.read_csv(input_file, encoding='utf-8')
+                    df = read_frame(input_file, encoding='utf-8')
                     logger.info(f"File successfully loaded with UTF-8 encoding")
                 except pd.errors.ParserError:
                     logger.warning(f"CORRUPTION DETECTED: CSV parser error, attempting repair by skipping bad lines")
                     errors_detected += 1
                     try:
-                        df = pd.read_csv(input_file, on_bad_lines='skip')
+                        df = read_frame(input_file, on_bad_lines='skip')
                         repairs_made += 1
                         logger.info(f"REPAIRED: Successfully loaded file by skipping malformed lines")
                     except TypeError:
 
-                        df = pd.read_csv(input_file, error_bad_lines=False, warn_bad_lines=True)
+                        df = read_frame(input_file, error_bad_lines=False, warn_bad_lines=True)
                         repairs_made += 1
                         logger.info(f"REPAIRED: Successfully loaded file by ignoring bad lines")
                 except UnicodeDecodeError:
                     logger.warning(f"CORRUPTION DETECTED: Unicode decode error, attempting repair with alternative encoding")
                     errors_detected += 1
-                    df = pd.read_csv(input_file, encoding='latin-1')
+                    df = read_frame(input_file, encoding='latin-1')
                     repairs_made += 1
                     logger.info(f"REPAIRED: Successfully loaded file using latin-1 encoding")
 
 
-                logger.info(f"VALIDATING data structure and content...")
+                self.last_stats = {"rows_in": len(df), "rows_out": 0, "quality_rejections": {}, "plan": None}
 
-                missing_columns = []
-                for col in ['text', 'source', 'post_id']:
-                    if col not in df.columns:
-                        missing_columns.append(col)
-                        errors_detected += 1
+                def validate(df):
+                    nonlocal errors_detected, repairs_made
+                    logger.info(f"VALIDATING data structure and content...")
 
-                if missing_columns:
-                    logger.warning(f"CORRUPTION DETECTED: Missing required columns: {', '.join(missing_columns)}")
-                    for col in missing_columns:
-                        df[col] = "" if col == 'text' else "unknown"
-                        repairs_made += 1
-                    logger.info(f"REPAIRED: Added missing columns with default values")
+                    missing_columns = []
+                    for col in ['text', 'source', 'post_id']:
+                        if col not in df.columns:
+                            missing_columns.append(col)
+                            errors_detected += 1
 
-                null_counts = df.isnull().sum()
-                total_nulls = null_counts.sum()
-
-                if total_nulls > 0:
-                    logger.warning(f"CORRUPTION DETECTED: Found {total_nulls} null values across {sum(null_counts > 0)} columns")
-                    errors_detected += 1
-
-
-                    if 'text' in df.columns:
-                        null_text_count = df['text'].isnull().sum()
-                        if null_text_count > 0:
-                            logger.warning(f"CORRUPTION DETECTED: {null_text_count} null values in 'text' column")
-                            df['text'] = df['text'].fillna("")
+                    if missing_columns:
+                        logger.warning(f"CORRUPTION DETECTED: Missing required columns: {', '.join(missing_columns)}")
+                        for col in missing_columns:
+                            df[col] = "" if col == 'text' else "unknown"
                             repairs_made += 1
-                            logger.info(f"REPAIRED: Replaced null values in 'text' column with empty strings")
-
+                        logger.info(f"REPAIRED: Added missing columns with default values")
 
-                    try:
-                        df['text'] = df['text'].astype(str)
-                        logger.info(f"REPAIRED: Converted all text values to string type")
-                    except Exception as e:
-                        logger.error(f"Failed to convert text column to string: {str(e)}")
+                    null_counts = df.isnull().sum()
+                    total_nulls = null_counts.sum()
 
+                    if total_nulls > 0:
+                        logger.warning(f"CORRUPTION DETECTED: Found {total_nulls} null values across {sum(null_counts > 0)} columns")
+                        errors_detected += 1
 
-                original_count = len(df)
-                df.drop_duplicates(subset=['text'], keep='first', inplace=True)
-                duplicate_count = original_count - len(df)
-                if duplicate_count > 0:
-                    logger.info(f"DETECTED: {duplicate_count} duplicate records")
-                    logger.info(f"CLEANED: Removed {duplicate_count} duplicate records")
 
+                        if 'text' in df.columns:
+                            null_text_count = df['text'].isnull().sum()
+                            if null_text_count > 0:
+                                logger.warning(f"CORRUPTION DETECTED: {null_text_count} null values in 'text' column")
+                                df['text'] = df['text'].fillna("")
+                                repairs_made += 1
+                                logger.info(f"REPAIRED: Replaced null values in 'text' column with empty strings")
 
-                df = self._filter_content(df)
 
+                        try:
+                            df['text'] = df['text'].astype(str)
+                            logger.info(f"REPAIRED: Converted all text values to string type")
+                        except Exception as e:
+                            logger.error(f"Failed to convert text column to string: {str(e)}")
+                    return df
 
                 logger.info(f"Starting text preprocessing with enhanced error handling...")
                 preprocessing_errors = 0
@@ -153,10 +188,7 @@ class DataProcessor:
                         return self._preprocess_text(row_text)
                     except Exception as e:
                         preprocessing_errors += 1
-                        if preprocessing_errors <= 3:
-                            logger.warning(f"CORRUPTION DETECTED: Error preprocessing text: {str(e)}. Using fallback.")
-                        elif preprocessing_errors == 4:
-                            logger.warning(f"More preprocessing errors found but suppressing logs...")
+                        logger.warning("CORRUPTION DETECTED: Error preprocessing text: %s. Using fallback.", e)
 
                         if not isinstance(row_text, str):
                             return ""
@@ -165,7 +197,11 @@ class DataProcessor:
                         text = re.sub(r'[^a-zåäöA-ZÅÄÖ\s]', '', text)
                         return text
 
-                df['processed_text'] = df['text'].apply(preprocess_with_logging)
+                output_file = input_file.replace('/raw/', '/processed/')
+                os.makedirs(os.path.dirname(output_file), exist_ok=True)
+                plan = self.plan(self.steps, validate=validate,
+                                 preprocess=lambda chunk: self._preprocess_column(chunk, preprocess_with_logging))
+                self._execute_with_checkpoints(plan, df, input_file, output_file)
 
                 if preprocessing_errors > 0:
                     errors_detected += 1
@@ -173,11 +209,6 @@ class DataProcessor:
                     logger.info(f"REPAIRED: Fixed {preprocessing_errors} text preprocessing errors using fallback method")
 
 
-                output_file = input_file.replace('/raw/', '/processed/')
-                os.makedirs(os.path.dirname(output_file), exist_ok=True)
-                df.to_csv(output_file, index=False, encoding='utf-8')
-
-
                 if errors_detected > 0:
                     logger.info(f"SUCCESS: Corrupted file processed despite {errors_detected} issues. Made {repairs_made} repairs.")
                 else:
@@ -193,6 +224,121 @@ class DataProcessor:
                     logger.error(f"FAILED: Could not process file after {max_retries} attempts")
                     return None
 
+    def plan(self, steps=None, **funcs):
+        """Lazy TransformPlan of the named PROCESS_STEPS; nothing runs before its execute()
+
+        funcs replaces the function of a step by name, e.g. validate=... to repair and
+        count the problems of one file. Costs are rough microseconds per row.
+        """
+        step_options = {
+            "validate": dict(kind="frame", func=self._ensure_columns),
+            "dedup": dict(kind="frame", func=self._drop_duplicate_texts),
+            "filter": dict(kind="filter", cost=1.0, reads=["text"], func=self._filter_content),
+            "score": dict(kind="filter", cost=10.0, reads=["text", "score", "author"], func=self._quality_filter),
+            "preprocess": dict(kind="transform", cost=20.0, reads=["text"], writes=["processed_text"],
+                               func=self._preprocess_column)
+        }
+        plan = TransformPlan(chunk_rows=self.checkpoint_rows)
+        for name in steps or self.steps:
+            if name not in step_options:
+                raise ValueError(f"Unknown processing step '{name}', expected one of {PROCESS_STEPS}")
+            options = dict(step_options[name])
+            options["func"] = funcs.get(name, options["func"])
+            plan.add(name, **options)
+        return plan
+
+    def _execute_with_checkpoints(self, plan, df, input_file, output_file):
+        """Run plan on df, appending each chunk of its final fused pass to a partial output
+
+        A checkpoint is written after each chunk, so a restarted run (a retry or a new
+        run) on an unchanged input resumes after the last completed chunk. The rows
+        entering that pass are recomputed deterministically from the input, and their
+        digest and the plan in the checkpoint guard against resuming a different run.
+        """
+        checkpoint = Checkpoint(self.checkpoint_dir, input_file, "process")
+        partial_file = f"{output_file}.partial"
+        expected = {"output_file": output_file, "plan": plan.explain()}
+
+        def resume(pass_df):
+            expected["kept_rows"] = rows_digest(pass_df.index)
+            state = checkpoint.load(expected=expected)
+            if state and os.path.exists(partial_file) and os.path.getsize(partial_file) >= state["partial_bytes"]:
+                # Drop anything appended after the last checkpoint was written
+                with open(partial_file, 'r+b') as f:
+                    f.truncate(state["partial_bytes"])
+                self.last_stats["rows_out"] = state["rows_written"]
+                logger.info(f"RESUMING: {input_file} from checkpoint at row {state['rows_done']}/{len(pass_df)}")
+                return state["rows_done"]
+            if os.path.exists(partial_file):
+                os.remove(partial_file)
+            return 0
+
+        def sink(chunk, rows_done, rows_total):
+            header = not os.path.exists(partial_file)
+            chunk.to_csv(partial_file, mode='a', header=header, index=False, encoding='utf-8')
+            self.last_stats["rows_out"] += len(chunk)
+            if rows_done < rows_total:
+                checkpoint.save(dict(expected, rows_done=rows_done, rows_written=self.last_stats["rows_out"],
+                                     partial_bytes=os.path.getsize(partial_file)))
+
+        plan.execute(df, sink=sink, resume=resume)
+        self.last_stats["plan"] = plan.last_report
+        os.replace(partial_file, output_file)
+        checkpoint.clear()
+
+    def process_batch(self, df, seen_texts=None):
+        """Clean, deduplicate, filter and preprocess one in-memory batch of raw records
+
+        seen_texts is a set of text digests shared across the batches of one run, so
+        duplicates are removed across batch boundaries as well as within a batch.
+        """
+        def dedup(df):
+            df = self._drop_duplicate_texts(df)
+            if seen_texts is None:
+                return df
+            digests = [hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest() for text in df['text'].tolist()]
+            is_new = [digest not in seen_texts for digest in digests]
+            seen_texts.update(digests)
+            return df[is_new]
+
+        plan = self.plan(dedup=dedup)
+        df = plan.execute(df)
+        self.last_stats["plan"] = plan.last_report
+        return df.reset_index(drop=True)
+
+    def _ensure_columns(self, df):
+        """Add missing required columns and make text a non-null string column"""
+        df = df.copy()
+        for col in ['text', 'source', 'post_id']:
+            if col not in df.columns:
+                df[col] = "" if col == 'text' else "unknown"
+        df['text'] = df['text'].fillna("").astype(str)
+        return df
+
+    def _drop_duplicate_texts(self, df):
+        """Keep the first record of each text"""
+        original_count = len(df)
+        df = df.drop_duplicates(subset=['text'], keep='first')
+        duplicate_count = original_count - len(df)
+        if duplicate_count > 0:
+            logger.info(f"DETECTED: {duplicate_count} duplicate records")
+            logger.info(f"CLEANED: Removed {duplicate_count} duplicate records")
+        return df
+
+    def _quality_filter(self, df):
+        """QualityScorer.filter, adding its rejections to last_stats across chunks"""
+        with hot_timers.timer("processor.quality_filter", len(df)):
+            df = self.quality_scorer.filter(df)
+        totals = self.last_stats["quality_rejections"]
+        for signal, count in self.quality_scorer.last_rejections.items():
+            totals[signal] = totals.get(signal, 0) + count
+        return df
+
+    def _preprocess_column(self, df, preprocess=None):
+        """df with processed_text added by preprocess (default _safe_preprocess_text) on each text"""
+        with hot_timers.timer("processor.preprocess_text", len(df)):
+            return df.assign(processed_text=df['text'].apply(preprocess or self._safe_preprocess_text))
+
     def _filter_content(self, df):
         """Filter inappropriate content"""
         try:
@@ -200,11 +346,13 @@ class DataProcessor:
 
             original_count = len(df)
 
-            mask = df['text'].apply(lambda x:
-                isinstance(x, str) and any(word in x.lower() for word in offensive_words)
-            )
+            with hot_timers.timer("processor.filter_content", len(df)):
+                mask = df['text'].apply(lambda x:
+                    isinstance(x, str) and any(word in x.lower() for word in offensive_words)
+                )
             filtered_df = df[~mask]
-            logger.info(f"Filtered out {original_count - len(filtered_df)} records containing inappropriate content")
+            # Logged once per chunk of a plan pass
+            logger.info("Filtered out %d records containing inappropriate content", original_count - len(filtered_df))
 
             return filtered_df
         except Exception as e:
@@ -218,16 +366,7 @@ class DataProcessor:
             if not isinstance(text, str):
                 return ""
 
-            text = text.lower()
-
-            text = re.sub(r'https?://\S+|www\.\S+', '', text)
-
-            text = re.sub(r'<.*?>', '', text)
-
-            text = re.sub(r'[^\w\s]', '', text)
-            text = re.sub(r'\d+', '', text)
-
-            tokens = text.split()
+            tokens = normalize_text(text)
 
             tokens = [word for word in tokens if word not in self.stopwords]
 
@@ -236,7 +375,7 @@ class DataProcessor:
             return processed_text
 
         except Exception as e:
-            logger.error(f"Error preprocessing text: {str(e)}")
+            logger.error("Error preprocessing text: %s", e)
             return ""
 
     def _safe_preprocess_text(self, text):
@@ -244,7 +383,7 @@ class DataProcessor:
         try:
             return self._preprocess_text(text)
         except Exception as e:
-            logger.warning(f"Error preprocessing text: {str(e)}. Using fallback.")
+            logger.warning("Error preprocessing text: %s. Using fallback.", e)
 
             if not isinstance(text, str):
                 return ""
@@ -254,6 +393,7 @@ class DataProcessor:
             return text
 
 if __name__ == "__main__":
+    setup_logging(log_file=None)
     processor = DataProcessor()
 
     import sys
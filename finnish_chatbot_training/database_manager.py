@@ -3,15 +3,25 @@ import pandas as pd
 import logging
 import os
 import json
+from checkpoint import file_signature
+from frame_schema import read_frame
+from profiling import hot_timers
+from pipeline_logging import setup_logging
 
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class DatabaseManager:
-    def __init__(self, db_path="data/finnish_chatbot.db"):
-        """Initialize database manager"""
+    def __init__(self, db_path="data/finnish_chatbot.db", checkpoint_rows=50000, timeout=60.0):
+        """Initialize database manager
+
+        timeout is how long a connection waits for another process's write lock, e.g.
+        when several queue workers store files into the same database.
+        """
         self.db_path = db_path
+        self.checkpoint_rows = checkpoint_rows
+        self.timeout = timeout
+        self.last_stats = {"rows_in": 0, "rows_out": 0}
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
 
         self._create_tables_if_not_exist()
@@ -19,7 +29,7 @@ class DatabaseManager:
     def _create_tables_if_not_exist(self):
         """Create necessary tables (if they don't exist)"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
             cursor = conn.cursor()
 
             cursor.execute('''
@@ -31,10 +41,18 @@ class DatabaseManager:
                     created_at TIMESTAMP,
                     metadata TEXT,
                     created_utc REAL,
-                    inserted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    inserted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    source_file TEXT
                 )
             ''')
 
+            # Databases created before source_file existed get the column added
+            cursor.execute("PRAGMA table_info(conversations)")
+            if 'source_file' not in [column[1] for column in cursor.fetchall()]:
+                cursor.execute("ALTER TABLE conversations ADD COLUMN source_file TEXT")
+            # Stored row counts and replacements look rows up by their file on every run
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_conversations_source_file ON conversations(source_file)")
+
 
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS processed_files (
@@ -43,6 +61,17 @@ class DatabaseManager:
                 )
             ''')
 
+            # Progress of interrupted store_data runs, committed together with the rows
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS store_checkpoints (
+                    file_path TEXT PRIMARY KEY,
+                    file_size INTEGER,
+                    file_mtime_ns INTEGER,
+                    rows_done INTEGER,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
             conn.commit()
             logger.info("Database tables created or already exist")
 
@@ -52,64 +81,66 @@ class DatabaseManager:
             if conn:
                 conn.close()
 
-    def store_data(self, processed_file):
-        """Store processed data to database"""
+    def store_data(self, processed_file, replace=False):
+        """Store processed data to database
+
+        With replace=True, rows previously stored from the same file are deleted first, so a
+        rebuilt file replaces its old contents instead of being skipped.
+
+        Rows are committed every checkpoint_rows rows together with a store_checkpoints entry,
+        so an interrupted run on an unchanged file resumes after the last committed chunk.
+        """
+        self.last_stats = {"rows_in": 0, "rows_out": 0}
         try:
 
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
             cursor = conn.cursor()
 
-            cursor.execute("SELECT file_path FROM processed_files WHERE file_path = ?", (processed_file,))
-            if cursor.fetchone():
-                logger.info(f"File {processed_file} has already been processed, skipping")
-                return False
+            signature = file_signature(processed_file)
+            cursor.execute("SELECT file_size, file_mtime_ns, rows_done FROM store_checkpoints WHERE file_path = ?",
+                           (processed_file,))
+            checkpoint = cursor.fetchone()
+            rows_done = 0
 
-            df = pd.read_csv(processed_file, encoding='utf-8')
-
-            if 'processed_text' in df.columns:
-                df['processed_text'] = df['processed_text'].fillna('')
+            if checkpoint and checkpoint[:2] == (signature["size"], signature["mtime_ns"]):
+                rows_done = checkpoint[2]
+                logger.info(f"RESUMING: storing {processed_file} from checkpoint at row {rows_done}")
             else:
-                df['processed_text'] = ''
+                if checkpoint:
+                    # Rows of an interrupted run on an older version of the file
+                    logger.info(f"Discarding partial store of changed file {processed_file}")
+                    cursor.execute("DELETE FROM conversations WHERE source_file = ?", (processed_file,))
+                    cursor.execute("DELETE FROM store_checkpoints WHERE file_path = ?", (processed_file,))
 
-            if 'text' in df.columns:
-                df['text'] = df['text'].fillna('')
-            else:
-                df['text'] = ''
+                if replace:
+                    self._claim_legacy_rows(cursor, processed_file)
+                    cursor.execute("DELETE FROM conversations WHERE source_file = ?", (processed_file,))
+                    cursor.execute("DELETE FROM processed_files WHERE file_path = ?", (processed_file,))
+                    if cursor.rowcount:
+                        logger.info(f"Replacing previously stored records from {processed_file}")
 
-            if 'source' in df.columns:
-                df['source'] = df['source'].fillna('unknown')
-            else:
-                df['source'] = 'unknown'
+                cursor.execute("SELECT file_path FROM processed_files WHERE file_path = ?", (processed_file,))
+                if cursor.fetchone():
+                    logger.info(f"File {processed_file} has already been processed, skipping")
+                    return False
+
+            df = read_frame(processed_file, encoding='utf-8')
 
             successfully_inserted = 0
+            for start in range(rows_done, len(df), self.checkpoint_rows):
+                chunk = df.iloc[start:start + self.checkpoint_rows]
+                with hot_timers.timer("database.insert_rows", len(chunk)):
+                    successfully_inserted += self._insert_rows(cursor, chunk, source_file=processed_file)
+                cursor.execute('''
+                    INSERT OR REPLACE INTO store_checkpoints (file_path, file_size, file_mtime_ns, rows_done)
+                    VALUES (?, ?, ?, ?)
+                ''', (processed_file, signature["size"], signature["mtime_ns"], start + len(chunk)))
+                conn.commit()
+                self.last_stats = {"rows_in": start + len(chunk) - rows_done, "rows_out": successfully_inserted}
+
 
-            for _, row in df.iterrows():
-                try:
-                    metadata = {}
-                    for meta_field in ['subreddit', 'post_id', 'tweet_id', 'score']:
-                        if meta_field in row and not pd.isna(row[meta_field]):
-                            metadata[meta_field] = row[meta_field]
-
-                    metadata_json = json.dumps(metadata)
-
-                    cursor.execute('''
-                        INSERT INTO conversations (source, text, processed_text, created_at, metadata, created_utc)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (
-                        row.get('source', 'unknown'),
-                        row.get('text', ''),
-                        row.get('processed_text', ''),
-                        row.get('created_at', None),
-                        metadata_json,
-                        row.get('created_utc', None)
-                    ))
-                    successfully_inserted += 1
-                except Exception as e:
-                    logger.error(f"Error inserting row data: {str(e)}")
-                    continue
-
-
-            cursor.execute("INSERT INTO processed_files (file_path) VALUES (?)", (processed_file,))
+            cursor.execute("INSERT OR IGNORE INTO processed_files (file_path) VALUES (?)", (processed_file,))
+            cursor.execute("DELETE FROM store_checkpoints WHERE file_path = ?", (processed_file,))
 
             conn.commit()
             logger.info(f"Successfully stored {successfully_inserted} records from {processed_file} to database")
@@ -124,10 +155,114 @@ class DatabaseManager:
             if 'conn' in locals() and conn:
                 conn.close()
 
+    def _claim_legacy_rows(self, cursor, processed_file):
+        """Attribute rows stored from processed_file before source_file existed to it
+
+        Those rows have no source_file, so replacing the file would otherwise duplicate
+        them; they are matched by text, and only for a file recorded as stored.
+        """
+        cursor.execute("SELECT 1 FROM processed_files WHERE file_path = ?", (processed_file,))
+        if not cursor.fetchone():
+            return
+        cursor.execute("SELECT 1 FROM conversations WHERE source_file IS NULL LIMIT 1")
+        if not cursor.fetchone():
+            return
+        texts = read_frame(processed_file, encoding='utf-8', usecols=['text'])['text'].fillna('')
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS legacy_texts (text TEXT PRIMARY KEY)")
+        cursor.execute("DELETE FROM legacy_texts")
+        cursor.executemany("INSERT OR IGNORE INTO legacy_texts (text) VALUES (?)", ((text,) for text in texts))
+        cursor.execute('''
+            UPDATE conversations SET source_file = ?
+            WHERE source_file IS NULL AND text IN (SELECT text FROM legacy_texts)
+        ''', (processed_file,))
+        if cursor.rowcount:
+            logger.info(f"Attributed {cursor.rowcount} legacy records without a source file to {processed_file}")
+
+    def stored_rows(self, source_file):
+        """Number of rows in the database stored from source_file"""
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM conversations WHERE source_file = ?",
+                                (source_file,)).fetchone()[0]
+        finally:
+            conn.close()
+
+    def store_batch(self, df, conn, source_file=None):
+        """Insert one in-memory batch of processed records on an open connection and commit"""
+        try:
+            with hot_timers.timer("database.insert_rows", len(df)):
+                inserted = self._insert_rows(conn.cursor(), df, source_file=source_file)
+            conn.commit()
+            return inserted
+        except Exception as e:
+            logger.error(f"Error storing batch to database: {str(e)}")
+            conn.rollback()
+            return 0
+
+    def mark_processed(self, file_path, conn=None):
+        """Record a file (or stream name) as stored so it is skipped next time"""
+        own_connection = conn is None
+        if own_connection:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+        try:
+            conn.execute("INSERT OR IGNORE INTO processed_files (file_path) VALUES (?)", (file_path,))
+            conn.commit()
+        finally:
+            if own_connection:
+                conn.close()
+
+    def _insert_rows(self, cursor, df, source_file=None):
+        """Insert DataFrame rows into the conversations table, returns the number inserted"""
+        df = df.copy()
+        if 'processed_text' in df.columns:
+            df['processed_text'] = df['processed_text'].fillna('')
+        else:
+            df['processed_text'] = ''
+
+        if 'text' in df.columns:
+            df['text'] = df['text'].fillna('')
+        else:
+            df['text'] = ''
+
+        if 'source' in df.columns:
+            df['source'] = df['source'].astype(object).fillna('unknown')
+        else:
+            df['source'] = 'unknown'
+
+        successfully_inserted = 0
+
+        for _, row in df.iterrows():
+            try:
+                metadata = {}
+                for meta_field in ['subreddit', 'post_id', 'comment_id', 'parent_id', 'depth', 'tweet_id', 'score']:
+                    if meta_field in row and not pd.isna(row[meta_field]):
+                        metadata[meta_field] = row[meta_field]
+
+                metadata_json = json.dumps(metadata)
+
+                cursor.execute('''
+                    INSERT INTO conversations (source, text, processed_text, created_at, metadata, created_utc, source_file)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    row.get('source', 'unknown'),
+                    row.get('text', ''),
+                    row.get('processed_text', ''),
+                    row.get('created_at', None),
+                    metadata_json,
+                    row.get('created_utc', None),
+                    source_file
+                ))
+                successfully_inserted += 1
+            except Exception as e:
+                logger.error("Error inserting row data: %s", e)
+                continue
+
+        return successfully_inserted
+
     def get_stats(self):
         """Get database statistics"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
             cursor = conn.cursor()
 
             cursor.execute("SELECT COUNT(*) FROM conversations")
@@ -149,6 +284,7 @@ class DatabaseManager:
                 conn.close()
 
 if __name__ == "__main__":
+    setup_logging(log_file=None)
     db_manager = DatabaseManager()
     db_manager.store_data("data/processed/reddit_20250406_235231.csv")
     print(db_manager.get_stats())
\ No newline at end of file
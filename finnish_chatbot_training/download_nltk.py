@@ -2,8 +2,8 @@ import nltk
 import ssl
 import sys
 import logging
+from pipeline_logging import setup_logging
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 def setup_ssl_context():
@@ -63,6 +63,7 @@ def verify_nltk_data():
     return all_available
 
 if __name__ == "__main__":
+    setup_logging(log_file=None)
     logger.info("Starting NLTK data download and verification...")
 
 
@@ -0,0 +1,82 @@
+import logging
+import numpy as np
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+def _string_dtype():
+    """Arrow-backed strings with NaN for missing values where available, plain objects otherwise
+
+    pandas 3 "str" uses pyarrow storage when pyarrow is installed; pandas 2.1+ has the
+    same type as "string[pyarrow_numpy]". Either way missing values stay NaN, so code
+    written against object columns (isna, fillna, isinstance(value, str)) is unchanged.
+    """
+    if int(pd.__version__.split('.')[0]) >= 3:
+        return "str"
+    try:
+        import pyarrow  # noqa: F401
+        return pd.api.types.pandas_dtype("string[pyarrow_numpy]")
+    except (ImportError, TypeError):
+        return object
+
+STRING_DTYPE = _string_dtype()
+
+# Low-cardinality columns repeat a few values (or one value per post) over many rows and are
+# stored dictionary-encoded; ids and free text are strings, so numeric-looking ids are never
+# re-inferred as numbers; numbers have a fixed width and nullable integers allow gaps.
+COLUMN_TYPES = {
+    'source': 'category',
+    'subreddit': 'category',
+    'post_id': 'category',
+    'post_title': 'category',
+    'author': 'category',
+    'comment_id': STRING_DTYPE,
+    'parent_id': STRING_DTYPE,
+    'tweet_id': STRING_DTYPE,
+    'text': STRING_DTYPE,
+    'processed_text': STRING_DTYPE,
+    'created_at': STRING_DTYPE,
+    'created_utc': 'float64',
+    'score': 'Int32',
+    'depth': 'Int16'
+}
+NUMERIC_COLUMNS = {name: dtype for name, dtype in COLUMN_TYPES.items() if dtype in ('float64', 'Int32', 'Int16')}
+
+def read_frame(path, **read_options):
+    """pd.read_csv with the shared column types, validated once
+
+    Numeric columns are left to the parser and converted here, so a malformed value
+    becomes a counted null instead of failing the read or leaving the column as
+    strings. Other read_csv options (encoding, on_bad_lines, usecols, ...) pass through.
+    """
+    dtypes = {name: dtype for name, dtype in COLUMN_TYPES.items() if name not in NUMERIC_COLUMNS}
+    df = pd.read_csv(path, dtype=dtypes, **read_options)
+    return apply_schema(df, source=path)
+
+def apply_schema(df, source="frame"):
+    """Convert the known columns of df to the shared types; unknown columns are left alone"""
+    invalid = {}
+    for name, dtype in COLUMN_TYPES.items():
+        if name not in df.columns:
+            continue
+        column = df[name]
+        if name in NUMERIC_COLUMNS:
+            values = pd.to_numeric(column, errors='coerce')
+            if dtype != 'float64':
+                limits = np.iinfo(dtype.lower())
+                values = values.where((values % 1 == 0) & values.between(limits.min, limits.max))
+            bad = int((values.isna() & column.notna()).sum())
+            if bad:
+                invalid[name] = bad
+            df[name] = values.astype(dtype)
+        elif str(column.dtype) != str(dtype):
+            df[name] = column.astype(dtype)
+
+    for name, count in invalid.items():
+        logger.warning(f"SCHEMA: {count} invalid values in '{name}' of {source} replaced with nulls")
+    return df
+
+def bytes_per_row(df):
+    """Memory of df, including string contents, divided by its number of rows"""
+    return df.memory_usage(deep=True).sum() / max(len(df), 1)
@@ -0,0 +1,239 @@
+import os
+import gzip
+import json
+import logging
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+# One row per record: which shard it lives in, where its (compressed) block starts
+# and how long it is, and where the record sits inside the decompressed block.
+INDEX_DTYPE = np.dtype([
+    ('shard', '<u4'),
+    ('block_offset', '<u8'),
+    ('block_length', '<u4'),
+    ('record_offset', '<u4'),
+    ('record_length', '<u4')
+])
+
+COMPRESSIONS = (None, 'gzip')
+
+def manifest_path_for(output_path):
+    """Manifest path used for a logical JSONL output written in sharded mode"""
+    root, _ = os.path.splitext(output_path)
+    return f"{root}.shards.json"
+
+class JsonlWriter:
+    def __init__(self, output_path, batch_size=10000, buffer_size=8 * 1024 * 1024):
+        """Initialize a plain JSONL writer that writes lines in batches through a large buffer"""
+        self.output_path = output_path
+        self.batch_size = batch_size
+        self._file = open(output_path, 'w', encoding='utf-8', buffering=buffer_size)
+        self._batch = []
+
+    def write(self, line):
+        """Append one JSON line (without trailing newline)"""
+        self._batch.append(line)
+        if len(self._batch) >= self.batch_size:
+            self._flush_batch()
+
+    def _flush_batch(self):
+        if self._batch:
+            self._file.write('\n'.join(self._batch) + '\n')
+            self._batch = []
+
+    def close(self):
+        self._flush_batch()
+        self._file.close()
+        return self.output_path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class ShardedJsonlWriter:
+    def __init__(self, output_path, shard_size_bytes=256 * 1024 * 1024, compression='gzip',
+                 block_size_bytes=64 * 1024, compression_level=6):
+        """Initialize a writer producing size-bounded JSONL shards plus an offset index"""
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unsupported compression: {compression}")
+
+        self.output_dir = os.path.dirname(output_path) or '.'
+        self.base_name = os.path.splitext(os.path.basename(output_path))[0]
+        self.manifest_path = manifest_path_for(output_path)
+        self.index_path = os.path.join(self.output_dir, f"{self.base_name}.idx.npy")
+        self.shard_size_bytes = shard_size_bytes
+        self.compression = compression
+        self.block_size_bytes = block_size_bytes
+        self.compression_level = compression_level
+
+        self.shards = []
+        self._index_rows = []
+        self._file = None
+        self._shard_bytes = 0
+        self._block = []
+        self._block_bytes = 0
+        self._remove_stale_shards()
+
+    def _remove_stale_shards(self):
+        """Remove shards left by a previous run of the same output"""
+        if not os.path.exists(self.manifest_path):
+            return
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                old_shards = json.load(f).get('shards', [])
+            for shard in old_shards:
+                shard_path = os.path.join(self.output_dir, shard)
+                if os.path.exists(shard_path):
+                    os.remove(shard_path)
+        except Exception as e:
+            logger.warning(f"Could not clean up previous shards for {self.manifest_path}: {str(e)}")
+
+    def _shard_name(self, shard_number):
+        extension = '.jsonl.gz' if self.compression == 'gzip' else '.jsonl'
+        return f"{self.base_name}-{shard_number:05d}{extension}"
+
+    def _open_next_shard(self):
+        if self._file:
+            self._file.close()
+        shard_name = self._shard_name(len(self.shards))
+        self.shards.append(shard_name)
+        self._file = open(os.path.join(self.output_dir, shard_name), 'wb')
+        self._shard_bytes = 0
+
+    def write(self, line):
+        """Append one JSON line (without trailing newline)"""
+        data = (line + '\n').encode('utf-8')
+
+        if self.compression is None:
+            if self._file is None or (self._shard_bytes > 0 and self._shard_bytes + len(data) > self.shard_size_bytes):
+                self._open_next_shard()
+            self._index_rows.append((len(self.shards) - 1, self._shard_bytes, len(data), 0, len(data)))
+            self._file.write(data)
+            self._shard_bytes += len(data)
+            return
+
+        self._block.append(data)
+        self._block_bytes += len(data)
+        if self._block_bytes >= self.block_size_bytes:
+            self._flush_block()
+
+    def _flush_block(self):
+        """Compress the pending records as one independently decompressible gzip member"""
+        if not self._block:
+            return
+        if self._file is None or self._shard_bytes >= self.shard_size_bytes:
+            self._open_next_shard()
+
+        compressed = gzip.compress(b''.join(self._block), compresslevel=self.compression_level, mtime=0)
+        shard_number = len(self.shards) - 1
+        record_offset = 0
+        for data in self._block:
+            self._index_rows.append((shard_number, self._shard_bytes, len(compressed), record_offset, len(data)))
+            record_offset += len(data)
+
+        self._file.write(compressed)
+        self._shard_bytes += len(compressed)
+        self._block = []
+        self._block_bytes = 0
+
+    def close(self):
+        """Flush pending data and write the index and manifest sidecars"""
+        if self.compression is not None:
+            self._flush_block()
+        if self._file:
+            self._file.close()
+            self._file = None
+
+        index = np.array(self._index_rows, dtype=INDEX_DTYPE)
+        np.save(self.index_path, index)
+
+        manifest = {
+            "records": len(index),
+            "compression": self.compression,
+            "shards": self.shards,
+            "index": os.path.basename(self.index_path)
+        }
+        with open(self.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+
+        logger.info(f"Wrote {len(index)} records to {len(self.shards)} shards, index: {self.index_path}")
+        return self.manifest_path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class ShardedJsonlReader:
+    def __init__(self, manifest_path):
+        """Open a sharded JSONL output for O(1) random access by record number"""
+        self.manifest_path = manifest_path
+        self.base_dir = os.path.dirname(manifest_path) or '.'
+
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+
+        self.compression = manifest["compression"]
+        self.shards = manifest["shards"]
+        self.index = np.load(os.path.join(self.base_dir, manifest["index"]), mmap_mode='r')
+        self._files = {}
+        self._cached_block_key = None
+        self._cached_block = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def _shard_file(self, shard_number):
+        f = self._files.get(shard_number)
+        if f is None:
+            f = open(os.path.join(self.base_dir, self.shards[shard_number]), 'rb')
+            self._files[shard_number] = f
+        return f
+
+    def _read_block(self, shard_number, block_offset, block_length):
+        key = (shard_number, block_offset)
+        if key != self._cached_block_key:
+            f = self._shard_file(shard_number)
+            f.seek(block_offset)
+            block = f.read(block_length)
+            if self.compression == 'gzip':
+                block = gzip.decompress(block)
+            self._cached_block_key = key
+            self._cached_block = block
+        return self._cached_block
+
+    def read_line(self, n):
+        """Return record n as a JSON string"""
+        if n < 0:
+            n += len(self)
+        if not 0 <= n < len(self):
+            raise IndexError(f"Record {n} out of range")
+
+        shard, block_offset, block_length, record_offset, record_length = self.index[n].tolist()
+        block = self._read_block(shard, block_offset, block_length)
+        return block[record_offset:record_offset + record_length].decode('utf-8').rstrip('\n')
+
+    def __getitem__(self, n):
+        return json.loads(self.read_line(n))
+
+    def iter_shuffled(self, seed=0):
+        """Iterate all records in a reproducible global shuffle without loading them all"""
+        order = np.random.default_rng(seed).permutation(len(self))
+        for n in order.tolist():
+            yield self[n]
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
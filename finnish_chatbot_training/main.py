@@ -7,23 +7,22 @@ else:
     ssl._create_default_https_context = _create_unverified_https_context
 import os
 import time
+import hashlib
 import logging
-import schedule
 from reddit_collector import RedditCollector
 from data_processor import DataProcessor
 from database_manager import DatabaseManager
-from conversation_processor import ConversationProcessor
+from conversation_processor import ConversationProcessor, DEFAULT_SPLIT_RATIOS
+from streaming_pipeline import run_streaming_pipeline
+from corpus_stats import build_statistics, iter_file_texts, merge_sketches, write_stopwords, write_vocabulary
+from run_manifest import RunManifest, STAGES, flatten_paths
+from pipeline_metrics import PipelineMetrics, StageRecord, peak_rss_bytes
+from profiling import StageProfiler, PROFILED_STAGES, PROFILE_MODES, hot_timers
+from pipeline_logging import setup_logging, flush_repeated
+from pipeline_scheduler import PipelineScheduler, RunLock
 
 
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("logs/pipeline.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 
@@ -32,66 +31,182 @@ os.makedirs("data/processed", exist_ok=True)
 os.makedirs("data/training", exist_ok=True)
 os.makedirs("logs", exist_ok=True)
 
-def run_pipeline():
-    """Run the complete data pipeline"""
+def sketch_path_for(processed_file, stats_dir="data/stats"):
+    """Per-file corpus statistics sketch of a processed file"""
+    name = os.path.splitext(os.path.basename(processed_file))[0]
+    path_hash = hashlib.sha1(os.path.abspath(processed_file).encode('utf-8')).hexdigest()[:8]
+    return os.path.join(stats_dir, "files", f"{name}.{path_hash}.npz")
+
+def run_pipeline(output_format="jsonl", split=False, streaming=False, keep_intermediate=True,
+                 collect=True, input_files=(), force=(), metrics_dir="logs/metrics",
+                 profile=(), profile_mode="both", profile_dir="logs/profiles", corpus_stats=False,
+                 stats_dir="data/stats", stopwords_file=None, include_known=True):
+    """Run the complete data pipeline
+
+    Each stage output is recorded in data/run_manifest.json with the hashes of its inputs,
+    code and config; outputs whose fingerprint is unchanged are skipped and stale ones rebuilt.
+    Every raw file seen by an earlier run is checked again (unless include_known is False),
+    plus input_files and new collections.
+    Per-stage metrics are written as a JSON report and a Prometheus text file under metrics_dir.
+    Stages named in profile are run under cProfile and/or a stack sampler, with hot-loop
+    timers enabled, and their dumps are written under profile_dir.
+    With corpus_stats, each processed file gets a token statistics sketch under stats_dir,
+    and the merged sketch, derived stopwords and vocabulary are rewritten; stopwords_file
+    adds stopwords to preprocessing.
+    """
+    if streaming:
+        if profile:
+            logger.warning("Profiling is only supported in batch mode, ignoring --profile")
+        if corpus_stats or stopwords_file:
+            logger.warning("Corpus statistics and extra stopwords are only supported in batch mode, ignoring them")
+        return run_pipeline_streaming(output_format=output_format, split=split, keep_intermediate=keep_intermediate,
+                                      metrics_dir=metrics_dir)
+
     start_time = time.time()
     logger.info("Starting data pipeline execution")
 
-
+    metrics = PipelineMetrics(metrics_dir=metrics_dir)
+    profiler = StageProfiler(stages=profile, mode=profile_mode, output_dir=profile_dir)
+    hot_timers.enabled = profiler.enabled
+    hot_timers.reset()
+    manifest = RunManifest(force=force)
+    skipped = {stage: 0 for stage in STAGES}
     collected_files = []
 
 
-    reddit_collector = RedditCollector(
-        client_id=os.environ.get("REDDIT_CLIENT_ID"),
-        client_secret=os.environ.get("REDDIT_CLIENT_SECRET"),
-        user_agent="finnish_chatbot_data_collector v1.0"
-    )
-    reddit_file = reddit_collector.collect_data(limit=200)
-    if reddit_file:
-        collected_files.append(reddit_file)
-        logger.info(f"Collected Reddit data to: {reddit_file}")
-
-
-    processor = DataProcessor()
+    if collect:
+        reddit_collector = RedditCollector(
+            client_id=os.environ.get("REDDIT_CLIENT_ID"),
+            client_secret=os.environ.get("REDDIT_CLIENT_SECRET"),
+            user_agent="finnish_chatbot_data_collector v1.0"
+        )
+        with metrics.stage("collector") as record, profiler.profile("collector"):
+            reddit_file = reddit_collector.collect_data(limit=200)
+            record.rows_in = reddit_collector.last_stats["rows_in"]
+            record.rows_out = reddit_collector.last_stats["rows_out"]
+            if reddit_file:
+                record.file = reddit_file
+                record.bytes_written = os.path.getsize(reddit_file)
+        if reddit_file:
+            collected_files.append(reddit_file)
+            logger.info(f"Collected Reddit data to: {reddit_file}")
+
+    known_files = manifest.known_inputs("process") if include_known else []
+    raw_files = [file for file in dict.fromkeys(known_files + list(input_files) + collected_files)
+                 if os.path.exists(file)]
+
+
+    processor = None
     processed_files = []
 
-    for file in collected_files:
-        processed_file = processor.process_file(file)
+    for file in raw_files:
+        processor = processor or DataProcessor(stopwords_file=stopwords_file)
+        fingerprint = manifest.fingerprint("process", [file],
+                                           config={"quality_thresholds": processor.quality_scorer.thresholds,
+                                                   "stopwords": sorted(processor.stopwords),
+                                                   "steps": processor.steps})
+        entry = manifest.lookup("process", file, fingerprint)
+        metrics.count_cache("manifest_process", hit=entry is not None)
+        if entry:
+            processed_files.append(entry["outputs"][0])
+            skipped["process"] += 1
+            continue
+
+        with metrics.stage("processor", file, inputs=[file], outputs=[file.replace('/raw/', '/processed/')]) as record, \
+                profiler.profile("processor", file):
+            processed_file = processor.process_file(file)
+            record.rows_in = processor.last_stats["rows_in"]
+            record.rows_out = processor.last_stats["rows_out"] if processed_file else 0
+            record.status = "ok" if processed_file else "error"
         if processed_file:
             processed_files.append(processed_file)
+            manifest.record("process", file, fingerprint, outputs=[processed_file])
             logger.info(f"Processed file: {file} -> {processed_file}")
 
 
     db_manager = DatabaseManager()
 
     for file in processed_files:
-        success = db_manager.store_data(file)
+        fingerprint = manifest.fingerprint("store", [file], config={"db_path": db_manager.db_path})
+        entry = manifest.lookup("store", file, fingerprint)
+        # The database outlives its manifest entries: one recreated or emptied since must be refilled
+        hit = entry is not None and (entry["result"] or {}).get("stored_rows") == db_manager.stored_rows(file)
+        metrics.count_cache("manifest_store", hit=hit)
+        if hit:
+            skipped["store"] += 1
+            continue
+
+        with metrics.stage("database", file, inputs=[file], appends=[db_manager.db_path]) as record, \
+                profiler.profile("database", file):
+            success = db_manager.store_data(file, replace=True)
+            record.rows_in = db_manager.last_stats["rows_in"]
+            record.rows_out = db_manager.last_stats["rows_out"]
+            record.status = "ok" if success else "error"
         if success:
+            manifest.record("store", file, fingerprint, outputs=[db_manager.db_path],
+                            result={"stored_rows": db_manager.stored_rows(file)})
             logger.info(f"Stored {file} to database")
         else:
             logger.warning(f"Failed to store {file} to database")
 
 
-    conversation_processor = ConversationProcessor(output_dir="data/training")
+    conversation_processor = ConversationProcessor(
+        output_dir="data/training",
+        output_format=output_format,
+        split_ratios=DEFAULT_SPLIT_RATIOS if split else None
+    )
+    conversion_config = {
+        "output_dir": conversation_processor.output_dir,
+        "output_format": conversation_processor.output_format,
+        "compression": conversation_processor.compression,
+        "shard_size_bytes": conversation_processor.shard_size_bytes,
+        "split_ratios": conversation_processor.split_ratios,
+        "split_salt": conversation_processor.split_salt,
+        "max_thread_turns": conversation_processor.thread_builder.max_turns
+    }
     training_files = []
 
     for file in processed_files:
         try:
-            stats = conversation_processor.process_csv_to_jsonl(file)
+            fingerprint = manifest.fingerprint("convert", [file], config=conversion_config)
+            entry = manifest.lookup("convert", file, fingerprint)
+            metrics.count_cache("manifest_convert", hit=entry is not None)
+            if entry:
+                stats = entry["result"]
+                skipped["convert"] += 1
+            else:
+                with metrics.stage("conversation", file, inputs=[file]) as record, \
+                        profiler.profile("conversation", file):
+                    stats = conversation_processor.process_csv_to_jsonl(file)
+                    record.rows_in = stats.get("input_rows", 0)
+                    record.rows_out = stats["single_turn_count"] + stats["multi_turn_count"]
+                    record.bytes_written = sum(os.path.getsize(path) for path in
+                                               flatten_paths(stats["single_turn_path"]) + flatten_paths(stats["multi_turn_path"])
+                                               if os.path.exists(path))
+                manifest.record("convert", file, fingerprint,
+                                outputs=flatten_paths(stats["single_turn_path"]) + flatten_paths(stats["multi_turn_path"]),
+                                result=stats)
             training_files.append({
                 "source": file,
                 "single_turn": stats["single_turn_path"],
                 "multi_turn": stats["multi_turn_path"],
                 "stats": {
                     "single_turn_count": stats["single_turn_count"],
-                    "multi_turn_count": stats["multi_turn_count"]
+                    "multi_turn_count": stats["multi_turn_count"],
+                    "splits": stats.get("splits")
                 }
             })
-            logger.info(f"Generated training data for {file}: {stats['single_turn_count']} single-turn and {stats['multi_turn_count']} multi-turn conversations")
+            if not entry:
+                logger.info(f"Generated training data for {file}: {stats['single_turn_count']} single-turn and {stats['multi_turn_count']} multi-turn conversations")
         except Exception as e:
             logger.error(f"Error generating training data for {file}: {str(e)}")
 
 
+    stats_outputs = None
+    if corpus_stats:
+        stats_outputs = update_corpus_stats(processed_files, manifest, metrics, skipped, stats_dir=stats_dir)
+
+
     db_stats = db_manager.get_stats()
     logger.info(f"Database statistics: {db_stats}")
 
@@ -101,6 +216,17 @@ def run_pipeline():
     logger.info(f"Training data statistics: Generated {total_single_turn} single-turn and {total_multi_turn} multi-turn conversations")
 
 
+    logger.info(f"Skipped up-to-date outputs: {skipped}")
+
+    metrics.count_cache("file_hash", hit=True, count=manifest.hash_cache_hits)
+    metrics.count_cache("file_hash", hit=False, count=manifest.hash_cache_misses)
+    metrics_report = metrics.write_json_report()
+    metrics.write_prometheus()
+    profile_outputs = profiler.write()
+    hot_timers.enabled = False
+    flush_repeated()
+
+
     elapsed_time = time.time() - start_time
     logger.info(f"Data pipeline execution completed, time elapsed: {elapsed_time:.2f} seconds")
 
@@ -113,19 +239,120 @@ def run_pipeline():
             "total_single_turn": total_single_turn,
             "total_multi_turn": total_multi_turn
         },
+        "skipped_stages": skipped,
+        "metrics": dict(metrics.summary(), report=metrics_report),
+        "profile": profile_outputs,
+        "corpus_stats": stats_outputs,
         "elapsed_time": elapsed_time
     }
 
-# Set up scheduled tasks
-def schedule_pipeline():
-    """Set up a daily scheduled task"""
-    schedule.every().day.at("02:00").do(run_pipeline)  # Run at 2:00 AM every day
+def update_corpus_stats(processed_files, manifest, metrics, skipped, stats_dir="data/stats"):
+    """Sketch processed_text of each new or changed file, then merge all file sketches
 
-    logger.info("Data pipeline scheduled task set up, will run daily at 2:00 AM")
+    Sketches of unchanged files are reused, so a run only reads the files it rebuilt;
+    the merge covers every sketch in the manifest, also those of files not in this run.
+    """
+    for file in processed_files:
+        sketch_file = sketch_path_for(file, stats_dir)
+        fingerprint = manifest.fingerprint("stats", [file])
+        hit = manifest.lookup("stats", file, fingerprint) is not None
+        metrics.count_cache("manifest_stats", hit=hit)
+        if hit:
+            skipped["stats"] += 1
+        else:
+            with metrics.stage("stats", file, inputs=[file], outputs=[sketch_file]) as record:
+                stats = build_statistics(iter_file_texts([file]))
+                stats.save(sketch_file)
+                record.rows_in = record.rows_out = stats.documents
+            manifest.record("stats", file, fingerprint, outputs=[sketch_file])
+
+    sketch_files = [path for entry in manifest.data["stages"].get("stats", {}).values()
+                    for path in entry["outputs"] if os.path.exists(path)]
+    if not sketch_files:
+        return None
+    sketch = os.path.join(stats_dir, "corpus_stats.npz")
+    stats = merge_sketches(sketch_files, sketch)
+    summary = stats.summary(k=10)
+    logger.info(f"Corpus statistics: {summary['documents']} documents, "
+                f"~{summary['distinct_estimates']['1']} distinct tokens, top tokens {summary['top']['1']}")
+    return {
+        "sketch": sketch,
+        "stopwords": write_stopwords(stats, os.path.join(stats_dir, "stopwords.txt")),
+        "vocabulary": write_vocabulary(stats, os.path.join(stats_dir, "vocabulary.tsv")),
+        "summary": summary
+    }
 
-    while True:
-        schedule.run_pending()
-        time.sleep(60)
+def run_pipeline_streaming(output_format="jsonl", split=False, keep_intermediate=True, metrics_dir="logs/metrics"):
+    """Run the pipeline with all stages overlapped on bounded queues of record batches"""
+    logger.info("Starting streaming data pipeline execution")
+
+    reddit_collector = RedditCollector(
+        client_id=os.environ.get("REDDIT_CLIENT_ID"),
+        client_secret=os.environ.get("REDDIT_CLIENT_SECRET"),
+        user_agent="finnish_chatbot_data_collector v1.0"
+    )
+    db_manager = DatabaseManager()
+    conversation_processor = ConversationProcessor(
+        output_dir="data/training",
+        output_format=output_format,
+        split_ratios=DEFAULT_SPLIT_RATIOS if split else None
+    )
+
+    result = run_streaming_pipeline(
+        reddit_collector,
+        DataProcessor(),
+        db_manager,
+        conversation_processor,
+        limit=200,
+        keep_intermediate=keep_intermediate
+    )
+
+    metrics = PipelineMetrics(metrics_dir=metrics_dir)
+    for name, stage in result["stage_stats"].items():
+        record = StageRecord(name, result["processed_file"])
+        record.wall_seconds = stage["busy_seconds"]
+        record.rows_in = stage["rows_in"]
+        record.rows_out = stage["rows_out"]
+        # Stages share one process and run together, so each reports the peak of the run
+        record.peak_rss_bytes = peak_rss_bytes()
+        record.status = "error" if stage["errors"] else "ok"
+        metrics.add_record(record)
+    metrics_report = metrics.write_json_report()
+    metrics.write_prometheus()
+
+    training = result["training"]
+    db_stats = db_manager.get_stats()
+    logger.info(f"Database statistics: {db_stats}")
+    logger.info(f"Training data statistics: Generated {training['single_turn_count']} single-turn and {training['multi_turn_count']} multi-turn conversations")
+    logger.info(f"Data pipeline execution completed, time elapsed: {result['elapsed_time']:.2f} seconds")
+
+    return {
+        "collected_files": [result["raw_file"]] if result["raw_file"] else [],
+        "processed_files": [result["processed_file"]] if result["processed_file"] else [],
+        "training_files": [{
+            "source": result["processed_file"] or f"stream://{result['run_name']}",
+            "single_turn": training["single_turn_path"],
+            "multi_turn": training["multi_turn_path"],
+            "stats": {
+                "single_turn_count": training["single_turn_count"],
+                "multi_turn_count": training["multi_turn_count"],
+                "splits": training.get("splits")
+            }
+        }],
+        "db_stats": db_stats,
+        "training_stats": {
+            "total_single_turn": training["single_turn_count"],
+            "total_multi_turn": training["multi_turn_count"]
+        },
+        "stage_stats": result["stage_stats"],
+        "metrics": dict(metrics.summary(), report=metrics_report),
+        "elapsed_time": result["elapsed_time"]
+    }
+
+# Set up scheduled tasks
+def schedule_pipeline(concurrency=2, **pipeline_options):
+    """Run the scheduler daemon: the pipeline daily at 2:00 AM, plus backfills queued with pipeline_scheduler.py"""
+    PipelineScheduler(concurrency=concurrency, pipeline_options=pipeline_options).run()
 
 if __name__ == "__main__":
 
@@ -139,14 +366,57 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Data collection and processing pipeline")
     parser.add_argument("--run-once", action="store_true", help="Run pipeline once, don't set up scheduled task")
     parser.add_argument("--skip-schedule", action="store_true", help="Skip immediate run, only set up scheduled task")
+    parser.add_argument("--output-format", choices=["jsonl", "sharded"], default="jsonl",
+                        help="Training data output: single JSONL files or compressed shards with an offset index")
+    parser.add_argument("--split", action="store_true",
+                        help="Write train/validation/test outputs assigned by a stable hash of post_id")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Run all stages concurrently on bounded queues of record batches")
+    parser.add_argument("--no-intermediate", action="store_true",
+                        help="In streaming mode, don't write the raw and processed CSV files")
+    parser.add_argument("--skip-collection", action="store_true",
+                        help="Don't collect new data, only bring existing outputs up to date")
+    parser.add_argument("--files", nargs="+", default=[], help="Additional raw CSV files to process")
+    parser.add_argument("--force", action="append", choices=STAGES + ["all"], default=[],
+                        help="Rebuild a stage even if its outputs are up to date (repeatable)")
+    parser.add_argument("--profile", action="append", choices=PROFILED_STAGES + ["all"], default=[],
+                        help="Profile a stage and time its hot loops, writing dumps to logs/profiles (repeatable)")
+    parser.add_argument("--profile-mode", choices=PROFILE_MODES, default="both",
+                        help="cProfile dumps, sampled flame-graph stacks, or both")
+    parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"], default="INFO",
+                        help="Lowest level written to the console and logs/pipeline.log")
+    parser.add_argument("--log-format", choices=["json", "text"], default="json",
+                        help="Format of logs/pipeline.log: one JSON object per line or plain text")
+    parser.add_argument("--corpus-stats", action="store_true",
+                        help="Update token statistics sketches, derived stopwords and vocabulary under data/stats")
+    parser.add_argument("--stopwords-file", default=None,
+                        help="Extra stopwords for preprocessing, one per line (e.g. from corpus_stats.py)")
+    parser.add_argument("--backfill-concurrency", type=int, default=2,
+                        help="Backfill partitions the scheduler runs at the same time")
     args = parser.parse_args()
+    setup_logging(level=args.log_level, log_file="logs/pipeline.log", log_format=args.log_format)
+
+    pipeline_options = {
+        "output_format": args.output_format,
+        "split": args.split,
+        "streaming": args.streaming,
+        "keep_intermediate": not args.no_intermediate,
+        "collect": not args.skip_collection,
+        "input_files": args.files,
+        "force": args.force,
+        "profile": args.profile,
+        "profile_mode": args.profile_mode,
+        "corpus_stats": args.corpus_stats,
+        "stopwords_file": args.stopwords_file
+    }
 
     if not args.skip_schedule:
 
         logger.info("Executing data pipeline immediately")
-        run_pipeline()
+        with RunLock():
+            run_pipeline(**pipeline_options)
 
     if not args.run_once:
 
         logger.info("Starting scheduled tasks")
-        schedule_pipeline()
\ No newline at end of file
+        schedule_pipeline(concurrency=args.backfill_concurrency, **pipeline_options)
\ No newline at end of file
@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from datetime import datetime, timezone
+
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_listener = None
+_repeat_filter = None
+_queue_handler = None
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with repeat counts and extra fields as their own keys"""
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName
+        }
+        if getattr(record, 'repeated', None):
+            entry["repeated"] = record.repeated
+            entry["window_seconds"] = record.window_seconds
+        if getattr(record, 'fields', None):
+            entry["fields"] = record.fields
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class RepeatFilter(logging.Filter):
+    def __init__(self, burst=5, window_seconds=60.0):
+        """Let the first burst records of each message template through per window
+
+        Records are grouped by logger, level and unformatted message, so per-row
+        messages must pass their values as arguments ("... %s", e) rather than as
+        f-strings. Suppressed records are counted, never formatted, and reported as
+        one summary record when the window rolls over or on flush.
+        """
+        super().__init__()
+        self.burst = burst
+        self.window_seconds = window_seconds
+        self.handler = None
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.levelno, record.msg if isinstance(record.msg, str) else repr(record.msg))
+        summary = None
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or record.created - window["start"] >= self.window_seconds:
+                if window and window["suppressed"]:
+                    summary = self._summary(window)
+                window = self._windows[key] = {"start": record.created, "passed": 0, "suppressed": 0, "record": record}
+            if window["passed"] < self.burst:
+                window["passed"] += 1
+                passed = True
+            else:
+                window["suppressed"] += 1
+                window["record"] = record
+                passed = False
+
+        if summary is not None and self.handler is not None:
+            self.handler.enqueue(summary)
+        return passed
+
+    def _summary(self, window):
+        last = window["record"]
+        summary = logging.makeLogRecord(last.__dict__)
+        summary.msg = f"{last.msg} (repeated {window['suppressed']} more times)"
+        summary.repeated = window["suppressed"]
+        summary.window_seconds = round(last.created - window["start"], 3)
+        summary.created = time.time()
+        return summary
+
+    def flush(self):
+        """Report every pending suppressed count now"""
+        with self._lock:
+            summaries = [self._summary(window) for window in self._windows.values() if window["suppressed"]]
+            self._windows = {}
+        if self.handler is not None:
+            for summary in summaries:
+                self.handler.enqueue(summary)
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue records unformatted, so formatting happens on the listener thread
+
+    Arguments are formatted after the call returns, so they must not be mutated
+    once logged.
+    """
+    def prepare(self, record):
+        return record
+
+def setup_logging(level="INFO", log_file="logs/pipeline.log", log_format="json", console=True,
+                  burst=5, window_seconds=60.0):
+    """Route all logging through one queue to a background thread that writes the handlers
+
+    log_file gets one JSON object per line (log_format="json") or the plain text
+    format; the console always gets plain text. Calling it again replaces the setup.
+    """
+    global _listener, _repeat_filter, _queue_handler
+    shutdown_logging()
+
+    handlers = []
+    if log_file:
+        os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+        file_handler = logging.FileHandler(log_file, encoding='utf-8')
+        file_handler.setFormatter(JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT))
+        handlers.append(file_handler)
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        handlers.append(console_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    _repeat_filter = RepeatFilter(burst=burst, window_seconds=window_seconds)
+    _repeat_filter.handler = queue_handler
+    queue_handler.addFilter(_repeat_filter)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    _queue_handler = queue_handler
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return queue_handler
+
+def flush_repeated():
+    """Emit the counts of suppressed repeated messages, e.g. at the end of a pipeline run"""
+    if _repeat_filter is not None:
+        _repeat_filter.flush()
+
+def shutdown_logging():
+    """Flush repeat counts and drain the queue; safe to call more than once"""
+    global _listener, _repeat_filter, _queue_handler
+    flush_repeated()
+    _repeat_filter = None
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+atexit.register(shutdown_logging)
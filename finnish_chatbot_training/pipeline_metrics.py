@@ -0,0 +1,266 @@
+import os
+import sys
+import json
+import time
+import logging
+import tempfile
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__)
+
+def current_rss_bytes():
+    """Resident set size of this process in bytes, or None where /proc is unavailable"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def peak_rss_bytes():
+    """Peak resident set size of this process in bytes"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        return 0
+
+def _file_state(path):
+    try:
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+    except OSError:
+        return 0, None
+
+class RssSampler:
+    def __init__(self, interval=0.05):
+        """Highest RSS seen by a thread sampling this process between start() and stop()
+
+        Unlike the kernel's peak counter this leaves other measurements alone, so stages
+        running concurrently each get the peak of their own interval (of the whole process,
+        as threads share its memory). Without /proc it falls back to the process peak.
+        """
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        rss = current_rss_bytes()
+        if rss is None:
+            return False
+        self.peak = max(self.peak, rss)
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        if self._sample():
+            self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop sampling and return the peak in bytes"""
+        if self._thread is None:
+            return peak_rss_bytes()
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return self.peak
+
+class StageRecord:
+    def __init__(self, stage, file=None):
+        """Measurements of one stage on one file"""
+        self.stage = stage
+        self.file = file
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.rows_in = 0
+        self.rows_out = 0
+        self.peak_rss_bytes = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.cache_hit = None
+        self.status = "ok"
+
+    @property
+    def rows_per_second(self):
+        return self.rows_in / self.wall_seconds if self.wall_seconds > 0 else 0.0
+
+    def to_dict(self):
+        return {
+            "stage": self.stage,
+            "file": self.file,
+            "status": self.status,
+            "wall_seconds": self.wall_seconds,
+            "cpu_seconds": self.cpu_seconds,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "rows_per_second": self.rows_per_second,
+            "peak_rss_bytes": self.peak_rss_bytes,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "cache_hit": self.cache_hit
+        }
+
+class PipelineMetrics:
+    def __init__(self, metrics_dir="logs/metrics"):
+        """Collect per-stage, per-file metrics of one pipeline run"""
+        self.metrics_dir = metrics_dir
+        self.run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.started_at = time.time()
+        self.records = []
+        self.caches = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, stage, file=None, inputs=(), outputs=(), appends=()):
+        """Time a stage; the yielded StageRecord takes rows_in/rows_out from the caller
+
+        inputs count as bytes read. outputs count with their full size when the stage
+        modified them, appends (such as the database) only with their growth.
+        """
+        record = StageRecord(stage, file)
+        before = {path: _file_state(path) for path in list(outputs) + list(appends)}
+        sampler = RssSampler().start()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        except Exception:
+            record.status = "error"
+            raise
+        finally:
+            record.wall_seconds = time.perf_counter() - wall_start
+            record.cpu_seconds = time.process_time() - cpu_start
+            record.peak_rss_bytes = sampler.stop()
+            record.bytes_read = sum(_file_state(path)[0] for path in inputs)
+            for path in outputs:
+                size, mtime = _file_state(path)
+                if mtime != before[path][1]:
+                    record.bytes_written += size
+            for path in appends:
+                record.bytes_written += max(0, _file_state(path)[0] - before[path][0])
+            with self._lock:
+                self.records.append(record)
+
+    def add_record(self, record):
+        """Add a record measured elsewhere (e.g. by the streaming pipeline)"""
+        with self._lock:
+            self.records.append(record)
+
+    def count_cache(self, name, hit, count=1):
+        """Count cache hits and misses, e.g. manifest skips or already-stored files"""
+        with self._lock:
+            cache = self.caches.setdefault(name, {"hits": 0, "misses": 0})
+            cache["hits" if hit else "misses"] += count
+
+    def stage_totals(self):
+        """Metrics aggregated over all files of each stage"""
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record.stage, {
+                "files": 0, "errors": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "rows_in": 0, "rows_out": 0,
+                "peak_rss_bytes": 0, "bytes_read": 0, "bytes_written": 0
+            })
+            total["files"] += 1
+            total["errors"] += record.status != "ok"
+            for key in ("wall_seconds", "cpu_seconds", "rows_in", "rows_out", "bytes_read", "bytes_written"):
+                total[key] += getattr(record, key)
+            total["peak_rss_bytes"] = max(total["peak_rss_bytes"], record.peak_rss_bytes)
+        for total in totals.values():
+            total["rows_per_second"] = total["rows_in"] / total["wall_seconds"] if total["wall_seconds"] > 0 else 0.0
+        return totals
+
+    def cache_rates(self):
+        rates = {}
+        for name, cache in self.caches.items():
+            lookups = cache["hits"] + cache["misses"]
+            rates[name] = dict(cache, hit_rate=cache["hits"] / lookups if lookups else 0.0)
+        return rates
+
+    def summary(self):
+        """Compact metrics summary for the run_pipeline return value"""
+        return {
+            "run_id": self.run_id,
+            "elapsed_seconds": time.time() - self.started_at,
+            "peak_rss_bytes": peak_rss_bytes(),
+            "stages": self.stage_totals(),
+            "caches": self.cache_rates()
+        }
+
+    def report(self):
+        return dict(self.summary(), files=[record.to_dict() for record in self.records])
+
+    def _write_atomic(self, path, content):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.metrics.')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def write_json_report(self, path=None):
+        """Write the full per-file report as JSON"""
+        path = path or os.path.join(self.metrics_dir, f"run_{self.run_id}.json")
+        self._write_atomic(path, json.dumps(self.report(), indent=2, default=str))
+        logger.info(f"Metrics report saved: {path}")
+        return path
+
+    def prometheus_text(self):
+        """Stage totals and cache rates in the Prometheus text exposition format"""
+        lines = []
+        gauges = [
+            ("wall_seconds", "Wall-clock seconds spent in the stage"),
+            ("cpu_seconds", "Process CPU seconds spent in the stage"),
+            ("rows_in", "Rows read by the stage"),
+            ("rows_out", "Rows produced by the stage"),
+            ("rows_per_second", "Input rows per wall-clock second"),
+            ("peak_rss_bytes", "Peak resident set size during the stage"),
+            ("bytes_read", "Bytes of input files read by the stage"),
+            ("bytes_written", "Bytes written by the stage"),
+            ("files", "Files handled by the stage"),
+            ("errors", "Files on which the stage failed")
+        ]
+        totals = self.stage_totals()
+        for key, help_text in gauges:
+            lines.append(f"# HELP finnish_pipeline_stage_{key} {help_text}")
+            lines.append(f"# TYPE finnish_pipeline_stage_{key} gauge")
+            for stage, total in sorted(totals.items()):
+                lines.append(f'finnish_pipeline_stage_{key}{{stage="{stage}"}} {float(total[key])}')
+
+        lines.append("# HELP finnish_pipeline_cache_hit_rate Share of lookups answered from a cache")
+        lines.append("# TYPE finnish_pipeline_cache_hit_rate gauge")
+        for name, cache in sorted(self.cache_rates().items()):
+            lines.append(f'finnish_pipeline_cache_hit_rate{{cache="{name}"}} {float(cache["hit_rate"])}')
+
+        lines.append("# HELP finnish_pipeline_peak_rss_bytes Peak resident set size of the run's process")
+        lines.append("# TYPE finnish_pipeline_peak_rss_bytes gauge")
+        lines.append(f"finnish_pipeline_peak_rss_bytes {float(peak_rss_bytes())}")
+
+        lines.append("# HELP finnish_pipeline_last_run_timestamp_seconds Unix time the last run finished")
+        lines.append("# TYPE finnish_pipeline_last_run_timestamp_seconds gauge")
+        lines.append(f"finnish_pipeline_last_run_timestamp_seconds {time.time()}")
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path=None):
+        """Write the node_exporter textfile-collector file (replaced atomically each run)"""
+        path = path or os.path.join(self.metrics_dir, "finnish_pipeline.prom")
+        self._write_atomic(path, self.prometheus_text())
+        return path
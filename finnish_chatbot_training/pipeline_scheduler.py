@@ -0,0 +1,394 @@
+import os
+import re
+import glob
+import json
+import time
+import fcntl
+import sqlite3
+import logging
+import multiprocessing
+from contextlib import closing
+from datetime import date, datetime, timedelta
+import schedule
+from pipeline_logging import setup_logging
+
+
+logger = logging.getLogger(__name__)
+
+PARTITION_STATUSES = ["pending", "running", "done", "failed"]
+# Collection date in the names RedditCollector gives raw files
+RAW_FILE_DATE = re.compile(r'_(\d{8})_\d{6}\.csv$')
+
+class RunLock:
+    def __init__(self, path="data/pipeline.lock", shared=False, blocking=True):
+        """flock on a lock file: shared for backfill partitions, exclusive for full runs
+
+        Partitions work on disjoint files and may hold the lock together; a full run
+        (the nightly job or main.py) re-checks every file and holds it alone. The lock
+        goes away with the process, so a crashed run never leaves it behind.
+        """
+        self.path = path
+        self.shared = shared
+        self.blocking = blocking
+        self._file = None
+
+    def acquire(self):
+        """True once held; False only when blocking=False and another run holds it"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._file = open(self.path, 'a')
+        mode = (fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX) | (0 if self.blocking else fcntl.LOCK_NB)
+        try:
+            fcntl.flock(self._file, mode)
+        except BlockingIOError:
+            self._file.close()
+            self._file = None
+            return False
+        return True
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        blocking, self.blocking = self.blocking, False
+        try:
+            held = self.acquire()
+        finally:
+            self.blocking = blocking
+        if not held:
+            if not blocking:
+                raise RuntimeError(f"Pipeline run lock {self.path} is held by another run")
+            logger.info(f"Waiting for the {'shared' if self.shared else 'exclusive'} pipeline run lock {self.path}")
+            self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+def raw_file_date(path):
+    """Collection date of a raw file from its name, or its modification date"""
+    match = RAW_FILE_DATE.search(os.path.basename(path))
+    if match:
+        return datetime.strptime(match.group(1), "%Y%m%d").date()
+    return datetime.fromtimestamp(os.path.getmtime(path)).date()
+
+def raw_files_by_date(raw_dir="data/raw"):
+    """Raw CSV files grouped by collection date"""
+    files = {}
+    for path in sorted(glob.glob(os.path.join(raw_dir, "*.csv"))):
+        files.setdefault(raw_file_date(path).isoformat(), []).append(path)
+    return files
+
+class PipelineScheduler:
+    def __init__(self, state_path="data/scheduler.db", lock_path="data/pipeline.lock", raw_dir="data/raw",
+                 concurrency=2, max_attempts=3, nightly_at="02:00", poll_seconds=30.0, pipeline_options=None,
+                 log_dir="logs/scheduler"):
+        """Daemon running the nightly pipeline and date-range backfills
+
+        A backfill is split into one partition per day, covering the raw files collected
+        that day. Up to concurrency partitions run at once, each in its own process
+        holding the run lock shared; the nightly run (with pipeline_options) holds it
+        exclusively, and no partition starts while it is due or running. Partition
+        status is kept in a SQLite file, so a day that is done is never run again,
+        whichever backfill asks for it.
+        """
+        self.state_path = state_path
+        self.lock_path = lock_path
+        self.raw_dir = raw_dir
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.nightly_at = nightly_at
+        self.poll_seconds = poll_seconds
+        self.pipeline_options = dict(pipeline_options or {})
+        self.log_dir = log_dir
+        # Everything a partition or nightly process needs to rebuild the scheduler
+        self.options = {
+            "state_path": state_path, "lock_path": lock_path, "raw_dir": raw_dir, "concurrency": concurrency,
+            "max_attempts": max_attempts, "nightly_at": nightly_at, "poll_seconds": poll_seconds,
+            "pipeline_options": self.pipeline_options, "log_dir": log_dir
+        }
+        self._running = {}
+        self._nightly = None
+        self._nightly_due = False
+        os.makedirs(os.path.dirname(state_path) or '.', exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS backfills (
+                    backfill_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    start_date TEXT NOT NULL,
+                    end_date TEXT NOT NULL,
+                    options TEXT,
+                    submitted_at REAL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS partitions (
+                    partition_date TEXT PRIMARY KEY,
+                    backfill_id INTEGER NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    pid INTEGER,
+                    started_at REAL,
+                    finished_at REAL,
+                    result TEXT,
+                    error TEXT
+                )
+            ''')
+
+    def _connect(self):
+        # Autocommit mode, transactions are opened explicitly with BEGIN IMMEDIATE
+        return closing(sqlite3.connect(self.state_path, timeout=60.0, isolation_level=None))
+
+    def submit_backfill(self, start_date, end_date, force=(), options=None):
+        """Queue one partition per day from start_date to end_date inclusive
+
+        Days already done are skipped and failed days are queued again; force and
+        options (run_pipeline keyword arguments) apply to the partitions this backfill adds.
+        Returns the backfill id and the number of partitions queued.
+        """
+        start, end = date.fromisoformat(str(start_date)), date.fromisoformat(str(end_date))
+        if end < start:
+            raise ValueError(f"Backfill end {end} is before its start {start}")
+        if end >= date.today():
+            # A done day is never run again, so a day still being collected must not be partitioned
+            raise ValueError(f"Backfill end {end} is not in the past; days from {date.today()} on are left to the nightly run")
+        days = [(start + timedelta(days=n)).isoformat() for n in range((end - start).days + 1)]
+        backfill_options = dict(self.pipeline_options, **(options or {}), force=list(force))
+
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                backfill_id = conn.execute(
+                    "INSERT INTO backfills (start_date, end_date, options, submitted_at) VALUES (?, ?, ?, ?)",
+                    (start.isoformat(), end.isoformat(), json.dumps(backfill_options), time.time())).lastrowid
+                before = conn.total_changes
+                conn.executemany('''
+                    INSERT INTO partitions (partition_date, backfill_id) VALUES (?, ?)
+                    ON CONFLICT (partition_date) DO UPDATE SET
+                        backfill_id = excluded.backfill_id, status = 'pending', attempts = 0, error = NULL
+                    WHERE partitions.status = 'failed'
+                ''', [(day, backfill_id) for day in days])
+                queued = conn.total_changes - before
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        logger.info(f"Backfill {backfill_id} {start}..{end}: queued {queued} of {len(days)} partitions "
+                    f"({len(days) - queued} already done or queued)")
+        return backfill_id, queued
+
+    def partitions(self):
+        """All partitions with their backfill options, in date order"""
+        with self._connect() as conn:
+            cursor = conn.execute('''
+                SELECT p.*, b.options FROM partitions p JOIN backfills b USING (backfill_id)
+                ORDER BY partition_date
+            ''')
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def counts(self):
+        """Number of partitions per status"""
+        with self._connect() as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM partitions GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in PARTITION_STATUSES}
+
+    def _claim(self):
+        """Mark the oldest pending partition running and return it, or None"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute('''
+                    SELECT p.partition_date, p.attempts, b.options FROM partitions p JOIN backfills b USING (backfill_id)
+                    WHERE p.status = 'pending' ORDER BY p.partition_date LIMIT 1
+                ''').fetchone()
+                if row is not None:
+                    conn.execute('''
+                        UPDATE partitions SET status = 'running', attempts = attempts + 1, started_at = ?
+                        WHERE partition_date = ?
+                    ''', (time.time(), row[0]))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return {"partition_date": row[0], "attempt": row[1] + 1, "options": json.loads(row[2])}
+
+    def _finish(self, partition_date, result=None, error=None):
+        with self._connect() as conn:
+            if error is None:
+                conn.execute('''
+                    UPDATE partitions SET status = 'done', finished_at = ?, result = ?, error = NULL, pid = NULL
+                    WHERE partition_date = ?
+                ''', (time.time(), json.dumps(result, default=str), partition_date))
+            else:
+                conn.execute('''
+                    UPDATE partitions SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                                          finished_at = ?, error = ?, pid = NULL
+                    WHERE partition_date = ?
+                ''', (self.max_attempts, time.time(), str(error), partition_date))
+
+    def status(self, partition_date):
+        with self._connect() as conn:
+            row = conn.execute("SELECT status FROM partitions WHERE partition_date = ?", (partition_date,)).fetchone()
+        return row[0] if row else None
+
+    def recover(self):
+        """Return partitions left running by a daemon that died to the queue"""
+        with self._connect() as conn:
+            cursor = conn.execute('''
+                UPDATE partitions SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                                      error = 'scheduler stopped while running', pid = NULL
+                WHERE status = 'running'
+            ''', (self.max_attempts,))
+            if cursor.rowcount:
+                logger.warning(f"Requeued {cursor.rowcount} partitions interrupted by a scheduler restart")
+
+    def run_partition(self, partition):
+        """Run the pipeline on the raw files of one day, holding the run lock shared"""
+        from main import run_pipeline
+        day = partition["partition_date"]
+        files = raw_files_by_date(self.raw_dir).get(day, [])
+        if not files:
+            logger.info(f"Partition {day}: no raw files")
+            return {"input_files": 0}
+
+        # Runs starting in the same second would share a metrics report name
+        options = dict({"metrics_dir": os.path.join(self.log_dir, "metrics", day)}, **partition["options"])
+        with RunLock(self.lock_path, shared=True):
+            result = run_pipeline(**dict(options, collect=False, input_files=files, include_known=False))
+        if len(result["processed_files"]) < len(files):
+            raise RuntimeError(f"{len(files) - len(result['processed_files'])} of {len(files)} files failed to process")
+        return {
+            "input_files": len(files),
+            "processed_files": result["processed_files"],
+            "skipped_stages": result["skipped_stages"],
+            "training_stats": result["training_stats"],
+            "elapsed_time": result["elapsed_time"]
+        }
+
+    def _start_partition(self, partition):
+        process = multiprocessing.Process(target=_partition_main, args=(self.options, partition),
+                                          name=f"partition-{partition['partition_date']}")
+        process.start()
+        with self._connect() as conn:
+            conn.execute("UPDATE partitions SET pid = ? WHERE partition_date = ?",
+                         (process.pid, partition["partition_date"]))
+        self._running[partition["partition_date"]] = process
+        logger.info(f"Started partition {partition['partition_date']} ({len(self._running)}/{self.concurrency} running)")
+
+    def _reap(self):
+        for day, process in list(self._running.items()):
+            if process.is_alive():
+                continue
+            process.join()
+            del self._running[day]
+            if self.status(day) == "running":
+                # Killed or crashed before it could record its outcome
+                logger.error(f"Partition {day} exited with code {process.exitcode} without recording its outcome")
+                self._finish(day, error=f"partition process exited with code {process.exitcode}")
+        if self._nightly is not None and not self._nightly.is_alive():
+            self._nightly.join()
+            logger.info(f"Nightly pipeline run finished with exit code {self._nightly.exitcode}")
+            self._nightly = None
+
+    def _request_nightly(self):
+        if self._nightly is not None:
+            logger.warning("Nightly pipeline run still in progress, skipping today's run")
+            return
+        self._nightly_due = True
+
+    def step(self):
+        """One scheduling round: reap finished processes, start the nightly run or more partitions"""
+        self._reap()
+        if self._nightly_due and not self._running:
+            self._nightly_due = False
+            self._nightly = multiprocessing.Process(target=_nightly_main, args=(self.options,), name="nightly-pipeline")
+            self._nightly.start()
+            logger.info("Started nightly pipeline run")
+        if self._nightly_due or self._nightly is not None:
+            return
+        while len(self._running) < self.concurrency:
+            partition = self._claim()
+            if partition is None:
+                break
+            self._start_partition(partition)
+
+    def run(self, until_idle=False, nightly=True):
+        """Schedule forever; with until_idle, return once no partition is pending or running"""
+        daemon_lock = RunLock(f"{self.state_path}.daemon.lock", blocking=False)
+        if not daemon_lock.acquire():
+            raise RuntimeError(f"Another scheduler is already running on {self.state_path}")
+        jobs = schedule.Scheduler()
+        if nightly:
+            jobs.every().day.at(self.nightly_at).do(self._request_nightly)
+            logger.info(f"Scheduler started: nightly run at {self.nightly_at}, up to {self.concurrency} partitions at once")
+        try:
+            self.recover()
+            while True:
+                jobs.run_pending()
+                self.step()
+                if until_idle and not self._running and self._nightly is None and self.counts()["pending"] == 0:
+                    return self.counts()
+                time.sleep(self.poll_seconds)
+        finally:
+            for process in list(self._running.values()) + ([self._nightly] if self._nightly else []):
+                process.join()
+            daemon_lock.release()
+
+def _partition_main(scheduler_options, partition):
+    # Imported before the partition log is set up, so importing main cannot replace it
+    from main import run_pipeline  # noqa: F401
+    scheduler = PipelineScheduler(**scheduler_options)
+    day = partition["partition_date"]
+    setup_logging(log_file=os.path.join(scheduler.log_dir, f"partition_{day}.log"))
+    logger.info(f"Partition {day} started (attempt {partition['attempt']})")
+    try:
+        result = scheduler.run_partition(partition)
+    except Exception as e:
+        logger.error(f"Partition {day} failed: {str(e)}")
+        scheduler._finish(day, error=e)
+        raise SystemExit(1)
+    scheduler._finish(day, result=result)
+    logger.info(f"Partition {day} done")
+
+def _nightly_main(scheduler_options):
+    setup_logging(log_file="logs/pipeline.log")
+    from main import run_pipeline
+    with RunLock(scheduler_options["lock_path"]):
+        run_pipeline(**scheduler_options["pipeline_options"])
+
+if __name__ == "__main__":
+    setup_logging(log_file="logs/scheduler.log")
+    import argparse
+    parser = argparse.ArgumentParser(description="Nightly pipeline runs and parallel date-range backfills")
+    parser.add_argument("--state", default="data/scheduler.db", help="Partition status database")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    daemon_parser = subparsers.add_parser("daemon", help="Run the nightly job and queued backfills")
+    daemon_parser.add_argument("--concurrency", type=int, default=2, help="Partitions run at the same time")
+    daemon_parser.add_argument("--nightly-at", default="02:00", help="Time of the nightly run")
+    daemon_parser.add_argument("--no-nightly", action="store_true", help="Only run backfills")
+    daemon_parser.add_argument("--until-idle", action="store_true", help="Exit once every backfill partition is finished")
+
+    backfill_parser = subparsers.add_parser("backfill", help="Queue a date range, one partition per day")
+    backfill_parser.add_argument("start_date", help="First day, YYYY-MM-DD")
+    backfill_parser.add_argument("end_date", help="Last day, YYYY-MM-DD")
+    backfill_parser.add_argument("--force", action="append", default=[],
+                                 help="Rebuild these stages (or all) even if their outputs are up to date")
+
+    subparsers.add_parser("status", help="Show partition counts per status")
+    args = parser.parse_args()
+
+    if args.command == "daemon":
+        scheduler = PipelineScheduler(state_path=args.state, concurrency=args.concurrency, nightly_at=args.nightly_at,
+                                      poll_seconds=1.0 if args.until_idle else 30.0)
+        scheduler.run(until_idle=args.until_idle, nightly=not args.no_nightly)
+    elif args.command == "backfill":
+        PipelineScheduler(state_path=args.state).submit_backfill(args.start_date, args.end_date, force=args.force)
+    elif args.command == "status":
+        print(json.dumps(PipelineScheduler(state_path=args.state).counts(), indent=2))
@@ -0,0 +1,183 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+
+logger = logging.getLogger(__name__)
+
+PROFILED_STAGES = ["collector", "processor", "database", "conversation"]
+PROFILE_MODES = ["cprofile", "sampling", "both"]
+
+class HotTimers:
+    def __init__(self):
+        """Aggregate timers for hot loops; a single attribute check when disabled"""
+        self.enabled = False
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, count=1):
+        with self._lock:
+            total = self.totals.setdefault(name, {"seconds": 0.0, "calls": 0, "items": 0})
+            total["seconds"] += seconds
+            total["calls"] += 1
+            total["items"] += count
+
+    def timer(self, name, count=1):
+        """Context manager timing one block that handles count items"""
+        if not self.enabled:
+            return nullcontext()
+        return self._timed(name, count)
+
+    @contextmanager
+    def _timed(self, name, count):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, count)
+
+    def iterate(self, name, iterable):
+        """Time the work done producing each item of an iterable (e.g. JSON serialization)"""
+        if not self.enabled:
+            return iterable
+        return self._timed_iter(name, iterable)
+
+    def _timed_iter(self, name, iterable):
+        iterator = iter(iterable)
+        seconds = 0.0
+        items = 0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    seconds += time.perf_counter() - start
+                    break
+                seconds += time.perf_counter() - start
+                items += 1
+                yield item
+        finally:
+            self.add(name, seconds, items)
+
+    def summary(self):
+        with self._lock:
+            return {name: dict(total, seconds_per_item=total["seconds"] / total["items"] if total["items"] else 0.0)
+                    for name, total in self.totals.items()}
+
+    def reset(self):
+        with self._lock:
+            self.totals = {}
+
+hot_timers = HotTimers()
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ':')
+
+class SamplingProfiler:
+    def __init__(self, thread_id, interval=0.005):
+        """Sample one thread's Python stack at a fixed interval into collapsed stacks"""
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+class StageProfiler:
+    def __init__(self, stages=(), mode="both", output_dir="logs/profiles", interval=0.005):
+        """Profile the selected pipeline stages; stages not selected run untouched"""
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unsupported profile mode: {mode}")
+        self.stages = set(PROFILED_STAGES) if "all" in stages else set(stages)
+        self.mode = mode
+        self.interval = interval
+        self.run_dir = os.path.join(output_dir, datetime.now().strftime("%Y%m%d_%H%M%S"))
+        self.stacks = Counter()
+        self.dumps = []
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.stages)
+
+    def profile(self, stage, file=None):
+        """Context manager profiling one stage run; a no-op for stages not selected"""
+        if stage not in self.stages:
+            return nullcontext()
+        return self._profile(stage, file)
+
+    @contextmanager
+    def _profile(self, stage, file):
+        os.makedirs(self.run_dir, exist_ok=True)
+        label = stage if not file else f"{stage}_{os.path.splitext(os.path.basename(file))[0]}"
+
+        profiler = cProfile.Profile() if self.mode in ("cprofile", "both") else None
+        sampler = SamplingProfiler(threading.get_ident(), self.interval) if self.mode in ("sampling", "both") else None
+        if sampler:
+            sampler.start()
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+            if sampler:
+                sampler.stop()
+            if profiler:
+                dump_path = os.path.join(self.run_dir, f"{label}.prof")
+                profiler.dump_stats(dump_path)
+                with self._lock:
+                    self.dumps.append(dump_path)
+            if sampler:
+                with self._lock:
+                    for stack, count in sampler.stacks.items():
+                        # The stage is the root frame so stages can be told apart in one flame graph
+                        self.stacks[f"{stage};{stack}"] += count
+
+    def write(self):
+        """Write the merged collapsed-stack file and hot-loop timers; returns the output paths"""
+        if not self.enabled:
+            return {}
+        os.makedirs(self.run_dir, exist_ok=True)
+        outputs = {"profile_dumps": list(self.dumps)}
+
+        if self.stacks:
+            collapsed_path = os.path.join(self.run_dir, "stacks.collapsed")
+            with open(collapsed_path, 'w', encoding='utf-8') as f:
+                for stack, count in sorted(self.stacks.items()):
+                    f.write(f"{stack} {count}\n")
+            outputs["collapsed_stacks"] = collapsed_path
+
+        timers_path = os.path.join(self.run_dir, "hot_timers.json")
+        with open(timers_path, 'w', encoding='utf-8') as f:
+            json.dump(hot_timers.summary(), f, indent=2)
+        outputs["hot_timers"] = timers_path
+
+        logger.info(f"Profiles saved to {self.run_dir}")
+        return outputs
@@ -0,0 +1,224 @@
+import logging
+import numpy as np
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+# A row is rejected by a signal when its value falls outside the threshold; None disables a check.
+QUALITY_THRESHOLDS = {
+    "min_letters": 4,              # "+1", "^", emoji-only replies
+    "max_length": 10000,           # pasted logs and walls of text
+    "min_alpha_ratio": 0.5,        # letters per non-space character
+    "min_diacritic_ratio": 0.005,  # ä/ö/å per letter, checked only on long texts ...
+    "diacritic_min_letters": 200,  # ... of at least this many letters, where Finnish almost always has them
+    "max_url_ratio": 0.5,          # share of characters inside links (link dumps)
+    "max_quote_ratio": 0.6,        # share of characters in "> quoted" lines
+    "min_distinct_word_ratio": 0.3,  # distinct words per word, checked from repetition_min_words words
+    "repetition_min_words": 6,
+    "max_char_run": 10,            # longest run of one character, longer ones like "!!!!!!!!!!!" are rejected
+    "min_score": -5,
+    "reject_bots": True
+}
+SIGNALS = ["length", "alpha_ratio", "diacritic_ratio", "url_ratio", "quote_ratio", "repetition", "score", "bot"]
+
+URL_PATTERN = r'https?://\S+|www\.\S+'
+QUOTE_PATTERN = r'(?m)^[ \t]*>.*$'
+# Matched against lowercased text
+BOT_AUTHOR_PATTERN = r'bot$|^automoderator$'
+BOT_TEXT_PATTERN = (r'i am a bot|i\'m a bot|olen botti|beep boop|'
+                    r'this action was performed automatically|tämä viesti on lähetetty automaattisesti')
+
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+# Rows whose lowercased text contains one of these are the only ones the regular expressions run on
+URL_HINTS = ['://', 'www.']
+QUOTE_HINTS = ['>']
+BOT_HINTS = ['bot', 'boop', 'automa']
+
+def _per_row(mask, bounds):
+    """Number of True positions of mask inside each row's [start, end) range"""
+    return np.diff(np.searchsorted(np.flatnonzero(mask), bounds))
+
+def _rows_containing(lower, bounds, needles):
+    """Boolean per row: some needle occurs in its lowercased code points
+
+    A match spanning two rows marks the first one, so callers only use this to
+    pick the rows worth checking exactly.
+    """
+    found = np.zeros(len(lower), dtype=bool)
+    for needle in needles:
+        codes = [ord(c) for c in needle]
+        if len(lower) < len(codes):
+            continue
+        match = lower[:len(lower) - len(codes) + 1] == codes[0]
+        for k, code in enumerate(codes[1:], start=1):
+            match &= lower[k:len(lower) - len(codes) + 1 + k] == code
+        found[:len(match)] |= match
+    return _per_row(found, bounds) > 0
+
+def _character_counts(text, max_char_run=0):
+    """Character and word counts of every row from one array of the chunk's code points
+
+    Letters are ASCII, Latin-1/Latin Extended, Greek and Cyrillic letters, which covers
+    Finnish and what else shows up on the subreddits. Words are whitespace separated
+    and compared lowercased through a 64-bit polynomial hash.
+    """
+    lengths = text.str.len().to_numpy(dtype=np.int64)
+    bounds = np.concatenate(([0], np.cumsum(lengths)))
+    cp = np.frombuffer(''.join(text.tolist()).encode('utf-32-le'), dtype=np.uint32)
+    row_start = np.zeros(len(cp), dtype=bool)
+    row_start[bounds[:-1][lengths > 0]] = True
+
+    upper = ((cp >= 65) & (cp <= 90)) | ((cp >= 0xC0) & (cp <= 0xDE) & (cp != 0xD7))
+    lower = np.where(upper, cp + 32, cp)
+    is_space = (cp == 32) | ((cp >= 9) & (cp <= 13)) | (cp == 0xA0)
+    is_letter = (((lower >= 97) & (lower <= 122)) | ((cp >= 0xC0) & (cp <= 0x24F) & (cp != 0xD7) & (cp != 0xF7))
+                 | ((cp >= 0x370) & (cp <= 0x4FF)))
+
+    counts = {
+        "length": lengths,
+        "url_rows": _rows_containing(lower, bounds, URL_HINTS),
+        "quote_rows": _rows_containing(lower, bounds, QUOTE_HINTS),
+        "bot_rows": _rows_containing(lower, bounds, BOT_HINTS),
+        "spaces": _per_row(is_space, bounds),
+        "letters": _per_row(is_letter, bounds),
+        "diacritics": _per_row((lower == ord('ä')) | (lower == ord('ö')) | (lower == ord('å')), bounds)
+    }
+
+    # Runs of one repeated character, not crossing row boundaries; run is the run length minus one
+    if max_char_run > 0:
+        repeats = np.zeros(len(cp), dtype=bool)
+        repeats[1:] = cp[1:] == cp[:-1]
+        repeats &= ~row_start
+        position = np.arange(len(cp))
+        run = position - np.maximum.accumulate(np.where(repeats, 0, position))
+        counts["char_run"] = _per_row(run >= max_char_run, bounds) > 0
+    else:
+        counts["char_run"] = np.zeros(len(lengths), dtype=bool)
+
+    # Word starts, the row of each word and a hash of its lowercased characters
+    in_word = ~is_space
+    starts = in_word.copy()
+    starts[1:] &= ~in_word[:-1] | row_start[1:]
+    counts["words"] = _per_row(starts, bounds)
+    word_starts = np.flatnonzero(starts)
+    if len(word_starts) == 0:
+        counts["distinct_words"] = np.zeros(len(lengths), dtype=np.int64)
+        return counts
+
+    chars = np.flatnonzero(in_word)
+    first_chars = np.flatnonzero(starts[chars])
+    offset = np.arange(len(chars)) - np.repeat(first_chars, np.diff(np.append(first_chars, len(chars))))
+    powers = np.cumprod(np.full(offset.max() + 1, HASH_MULTIPLIER, dtype=np.uint64))
+    word_hash = np.add.reduceat(lower[chars].astype(np.uint64) * powers[offset], first_chars)
+
+    # Words are in row order: put the row in the high bits and count distinct keys per row
+    word_rows = (np.searchsorted(bounds, word_starts, side='right') - 1).astype(np.uint64)
+    row_bits = max(int(word_rows[-1]).bit_length(), 1)
+    keys = np.sort((word_rows << np.uint64(64 - row_bits)) | (word_hash >> np.uint64(row_bits)))
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    counts["distinct_words"] = np.bincount((keys[first] >> np.uint64(64 - row_bits)).astype(np.int64),
+                                           minlength=len(lengths))
+    return counts
+
+class QualityScorer:
+    def __init__(self, thresholds=None, chunk_rows=100000):
+        """Score and filter comments with column operations over the whole frame
+
+        thresholds overrides entries of QUALITY_THRESHOLDS.
+        """
+        self.thresholds = dict(QUALITY_THRESHOLDS, **(thresholds or {}))
+        self.chunk_rows = chunk_rows
+        self.last_rejections = {signal: 0 for signal in SIGNALS}
+
+    def signals(self, df):
+        """Per-row quality signals of df['text'] (and score/author when present) as a DataFrame"""
+        text = df['text'].fillna("").astype(str)
+        counts = _character_counts(text, self.thresholds["max_char_run"] or 0)
+        length = counts["length"]
+        non_space = length - counts["spaces"]
+        letters = counts["letters"]
+        words = counts["words"]
+        url_chars = self._removed_chars(text, counts["url_rows"], URL_PATTERN)
+        quote_chars = self._removed_chars(text, counts["quote_rows"], QUOTE_PATTERN)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            signals = pd.DataFrame({
+                "length": length,
+                "letters": letters,
+                "alpha_ratio": np.where(non_space > 0, letters / non_space, 0.0),
+                "diacritic_ratio": np.where(letters > 0, counts["diacritics"] / letters, 0.0),
+                "url_ratio": np.where(length > 0, url_chars / length, 0.0),
+                "quote_ratio": np.where(length > 0, quote_chars / length, 0.0),
+                "words": words,
+                "distinct_word_ratio": np.where(words > 0, counts["distinct_words"] / words, 1.0),
+                "char_run": counts["char_run"]
+            }, index=df.index)
+
+        signals["score"] = (pd.to_numeric(df['score'], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+                            if 'score' in df.columns else np.nan)
+
+        bot = np.zeros(len(text), dtype=bool)
+        candidates = np.flatnonzero(counts["bot_rows"])
+        bot[candidates] = text.iloc[candidates].str.lower().str.contains(BOT_TEXT_PATTERN, regex=True).to_numpy()
+        if 'author' in df.columns:
+            authors = df['author'].astype(object).fillna("").astype(str).str.lower()
+            bot = bot | authors.str.contains(BOT_AUTHOR_PATTERN, regex=True).to_numpy()
+        signals["bot"] = bot
+        return signals
+
+    @staticmethod
+    def _removed_chars(text, rows, pattern):
+        """Characters matched by pattern per row, evaluated only on the given candidate rows"""
+        removed = np.zeros(len(text), dtype=np.int64)
+        candidates = np.flatnonzero(rows)
+        subset = text.iloc[candidates]
+        removed[candidates] = subset.str.len().to_numpy() - subset.str.replace(pattern, '', regex=True).str.len().to_numpy()
+        return removed
+
+    def rejections(self, signals):
+        """Boolean rejection mask per signal; a row may be rejected by several signals"""
+        t = self.thresholds
+        false = np.zeros(len(signals), dtype=bool)
+
+        def below(column, limit):
+            return signals[column].to_numpy() < limit if limit is not None else false
+
+        def above(column, limit):
+            return signals[column].to_numpy() > limit if limit is not None else false
+
+        long_text = signals["letters"].to_numpy() >= t["diacritic_min_letters"]
+        many_words = signals["words"].to_numpy() >= t["repetition_min_words"]
+        return {
+            "length": below("letters", t["min_letters"]) | above("length", t["max_length"]),
+            "alpha_ratio": below("alpha_ratio", t["min_alpha_ratio"]),
+            "diacritic_ratio": long_text & below("diacritic_ratio", t["min_diacritic_ratio"]),
+            "url_ratio": above("url_ratio", t["max_url_ratio"]),
+            "quote_ratio": above("quote_ratio", t["max_quote_ratio"]),
+            "repetition": (many_words & below("distinct_word_ratio", t["min_distinct_word_ratio"]))
+                          | signals["char_run"].to_numpy(dtype=bool),
+            # NaN scores compare False, so rows without a score are kept
+            "score": below("score", t["min_score"]),
+            "bot": signals["bot"].to_numpy(dtype=bool) if t["reject_bots"] else false
+        }
+
+    def filter(self, df):
+        """Rows of df passing every check; per-signal rejection counts are kept in last_rejections
+
+        Signals are computed chunk_rows rows at a time to bound the memory of the
+        code point arrays on multi-million-row frames.
+        """
+        self.last_rejections = {signal: 0 for signal in SIGNALS}
+        rejected = np.zeros(len(df), dtype=bool)
+
+        for start in range(0, len(df), self.chunk_rows):
+            chunk = df.iloc[start:start + self.chunk_rows]
+            for signal, mask in self.rejections(self.signals(chunk)).items():
+                rejected[start:start + len(chunk)] |= mask
+                self.last_rejections[signal] += int(mask.sum())
+
+        logger.info("Quality filter removed %d of %d records, by signal: %s", int(rejected.sum()), len(df),
+                    ", ".join(f"{signal}={count}" for signal, count in self.last_rejections.items() if count))
+        return df[~rejected]
@@ -4,9 +4,9 @@ import time
 import logging
 import os
 from datetime import datetime
+from pipeline_logging import setup_logging
 
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class RedditCollector:
@@ -19,13 +19,34 @@ class RedditCollector:
         )
 
         self.subreddits = ['Suomi', 'Finland', 'LearnFinnish']
+        self.last_stats = {"rows_in": 0, "rows_out": 0}
 
 
         os.makedirs("data/raw", exist_ok=True)
 
     def collect_data(self, limit=100, min_comment_length=10):
         """Collect data from the specified subreddits"""
+        batches = list(self.iter_batches(limit=limit, min_comment_length=min_comment_length))
+
+        if batches:
+            df = pd.concat(batches, ignore_index=True)
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            output_file = f"data/raw/reddit_{timestamp}.csv"
+            df.to_csv(output_file, index=False, encoding='utf-8')
+            logger.info(f"Collected {len(df)} conversations and saved to {output_file}")
+            return output_file
+        else:
+            logger.warning("No data collected")
+            return None
+
+    def iter_batches(self, limit=100, min_comment_length=10, batch_size=1000):
+        """Yield collected comments as DataFrames of about batch_size rows
+
+        A batch always holds every collected comment of the submissions in it, so
+        threads are never split across batches.
+        """
         all_conversations = []
+        self.last_stats = {"rows_in": 0, "rows_out": 0}
 
         for subreddit_name in self.subreddits:
             try:
@@ -41,6 +62,7 @@ class RedditCollector:
                     submission.comments.replace_more(limit=0)
 
                     for comment in submission.comments.list():
+                        self.last_stats["rows_in"] += 1
                         if len(comment.body) >= min_comment_length and self._is_finnish(comment.body):
                             conversation = {
                                 'source': 'reddit',
@@ -48,11 +70,19 @@ class RedditCollector:
                                 'post_id': submission.id,
                                 'post_title': submission.title,
                                 'comment_id': comment.id,
+                                'author': str(comment.author) if comment.author else None,
+                                'parent_id': comment.parent_id,
+                                'depth': getattr(comment, 'depth', None),
                                 'text': comment.body,
                                 'created_utc': comment.created_utc,
                                 'score': comment.score
                             }
                             all_conversations.append(conversation)
+                            self.last_stats["rows_out"] += 1
+
+                    if len(all_conversations) >= batch_size:
+                        yield pd.DataFrame(all_conversations)
+                        all_conversations = []
 
                 time.sleep(2)
 
@@ -61,15 +91,7 @@ class RedditCollector:
                 continue
 
         if all_conversations:
-            df = pd.DataFrame(all_conversations)
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            output_file = f"data/raw/reddit_{timestamp}.csv"
-            df.to_csv(output_file, index=False, encoding='utf-8')
-            logger.info(f"Collected {len(df)} conversations and saved to {output_file}")
-            return output_file
-        else:
-            logger.warning("No data collected")
-            return None
+            yield pd.DataFrame(all_conversations)
 
     def _is_finnish(self, text):
         """Detect if text is in Finnish language"""
@@ -86,7 +108,7 @@ class RedditCollector:
 
                 return detected_lang == 'fi'
             except LangDetectException as e:
-                logger.debug(f"Language detection failed: {str(e)}, falling back to basic detection")
+                logger.debug("Language detection failed: %s, falling back to basic detection", e)
 
         except ImportError:
             logger.warning("langdetect library not installed, using basic Finnish detection logic")
@@ -130,6 +152,7 @@ class RedditCollector:
             return False
 
 if __name__ == "__main__":
+    setup_logging(log_file=None)
     import os
 
 
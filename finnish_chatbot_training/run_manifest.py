@@ -0,0 +1,138 @@
+import os
+import json
+import fcntl
+import hashlib
+import logging
+import tempfile
+
+
+logger = logging.getLogger(__name__)
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Source files whose code determines each stage's output
+STAGE_CODE = {
+    "process": ["data_processor.py", "quality_scoring.py", "transform_plan.py", "frame_schema.py"],
+    "store": ["database_manager.py", "frame_schema.py"],
+    "convert": ["conversation_processor.py", "thread_builder.py", "jsonl_shards.py", "frame_schema.py"],
+    "stats": ["corpus_stats.py"]
+}
+
+STAGES = list(STAGE_CODE)
+
+class RunManifest:
+    def __init__(self, path="data/run_manifest.json", force=()):
+        """Load the run manifest recording what produced each stage output
+
+        force lists stages to rebuild regardless of the manifest ("all" for every stage).
+        """
+        self.path = path
+        self.force = set(STAGES) if "all" in force else set(force)
+        self.data = {"file_hashes": {}, "stages": {stage: {} for stage in STAGES}}
+        self.hash_cache_hits = 0
+        self.hash_cache_misses = 0
+        self._recorded = set()
+        self._read(self.data)
+
+    def _read(self, data):
+        """Merge the manifest on disk into data"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                loaded = json.load(f)
+            data["file_hashes"].update(loaded.get("file_hashes", {}))
+            for stage, entries in loaded.get("stages", {}).items():
+                data["stages"].setdefault(stage, {}).update(entries)
+        except Exception as e:
+            logger.warning(f"Could not read run manifest {self.path}, rebuilding everything: {str(e)}")
+
+    def file_hash(self, path):
+        """SHA-256 of a file, reused from the manifest while its size and mtime are unchanged"""
+        stat = os.stat(path)
+        cached = self.data["file_hashes"].get(path)
+        if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            self.hash_cache_hits += 1
+            return cached["sha256"]
+
+        self.hash_cache_misses += 1
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        self.data["file_hashes"][path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                                          "sha256": digest.hexdigest()}
+        return digest.hexdigest()
+
+    def fingerprint(self, stage, inputs, config=None):
+        """Hash of a stage's input files, its code and its configuration"""
+        digest = hashlib.sha256(stage.encode('utf-8'))
+        for path in inputs:
+            digest.update(path.encode('utf-8'))
+            digest.update(self.file_hash(path).encode('utf-8'))
+        for code_file in STAGE_CODE[stage]:
+            digest.update(self.file_hash(os.path.join(MODULE_DIR, code_file)).encode('utf-8'))
+        digest.update(json.dumps(config or {}, sort_keys=True, default=str).encode('utf-8'))
+        return digest.hexdigest()
+
+    def lookup(self, stage, key, fingerprint):
+        """Recorded entry when the stage output for key is up to date, otherwise None"""
+        if stage in self.force:
+            return None
+        entry = self.data["stages"].get(stage, {}).get(key)
+        if not entry or entry["fingerprint"] != fingerprint:
+            return None
+        if not all(os.path.exists(path) for path in entry.get("outputs", [])):
+            return None
+        return entry
+
+    def record(self, stage, key, fingerprint, outputs=(), result=None):
+        """Record a freshly built stage output and persist the manifest"""
+        self.data["stages"].setdefault(stage, {})[key] = {
+            "fingerprint": fingerprint,
+            "outputs": list(outputs),
+            "result": result
+        }
+        self._recorded.add((stage, key))
+        self.save()
+
+    def known_inputs(self, stage):
+        """Inputs a stage has been run on before, in the order they were first seen"""
+        return list(self.data["stages"].get(stage, {}))
+
+    def save(self):
+        """Write the manifest atomically
+
+        Pipeline runs over different files may run at the same time (backfill
+        partitions), so under a lock the manifest is re-read and only the entries this
+        run recorded replace the ones on disk.
+        """
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        with open(f"{self.path}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            merged = {"file_hashes": {}, "stages": {stage: {} for stage in STAGES}}
+            self._read(merged)
+            merged["file_hashes"].update(self.data["file_hashes"])
+            for stage, key in self._recorded:
+                merged["stages"].setdefault(stage, {})[key] = self.data["stages"][stage][key]
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.run_manifest.')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(merged, f, indent=2)
+                os.replace(tmp_path, self.path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        self.data = merged
+
+def flatten_paths(value):
+    """All file paths in a path, list of paths or {split: path} mapping"""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, dict):
+        value = value.values()
+    return [path for item in value for path in flatten_paths(item)]
@@ -1,8 +1,8 @@
 import os
 import logging
 import subprocess
+from pipeline_logging import setup_logging
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 def setup_project():
@@ -29,4 +29,5 @@ def setup_project():
     logger.info("Project environment setup complete")
 
 if __name__ == "__main__":
+    setup_logging(log_file=None)
     setup_project()
\ No newline at end of file
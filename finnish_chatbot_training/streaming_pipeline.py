@@ -0,0 +1,216 @@
+import os
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a batch stream on a queue
+END_OF_STREAM = None
+
+class _CsvAppender:
+    def __init__(self, path):
+        """Append batches to an intermediate CSV under the header of the first batch
+
+        Later batches are reindexed to those columns, so a batch with its columns in
+        another order or a different set of them still lines up with the header.
+        """
+        self.path = path
+        self.columns = list(pd.read_csv(path, nrows=0).columns) if os.path.exists(path) else None
+
+    def append(self, df):
+        if self.columns is None:
+            self.columns = list(df.columns)
+            df.to_csv(self.path, mode='a', header=True, index=False, encoding='utf-8')
+            return
+        dropped = [column for column in df.columns if column not in self.columns]
+        if dropped:
+            # Logged once per batch
+            logger.warning("Dropping columns %s missing from the header of %s", dropped, self.path)
+        df.reindex(columns=self.columns).to_csv(self.path, mode='a', header=False, index=False, encoding='utf-8')
+
+class StageStats:
+    def __init__(self, name):
+        """Counters for one streaming stage"""
+        self.name = name
+        self.batches = 0
+        self.rows_in = 0
+        self.rows_out = 0
+        self.busy_seconds = 0.0
+        self.errors = 0
+
+    def to_dict(self):
+        return {
+            "batches": self.batches,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "busy_seconds": self.busy_seconds,
+            "errors": self.errors
+        }
+
+def _run_stage(stats, inbox, handle, outboxes):
+    """Take batches from inbox until END_OF_STREAM, handle each and pass results downstream
+
+    handle returns the batch to forward, or None for sink stages (which count their own
+    output rows). A failing batch is logged and dropped so downstream stages keep running, and the
+    inbox is always drained so upstream stages never block on a full queue.
+    """
+    try:
+        while True:
+            batch = inbox.get()
+            if batch is END_OF_STREAM:
+                break
+
+            start_time = time.perf_counter()
+            try:
+                result = handle(batch)
+            except Exception as e:
+                stats.errors += 1
+                logger.error("Streaming stage %s failed on a batch: %s", stats.name, e)
+                continue
+            finally:
+                stats.busy_seconds += time.perf_counter() - start_time
+                stats.batches += 1
+                stats.rows_in += len(batch)
+
+            if result is not None:
+                stats.rows_out += len(result)
+                for outbox in outboxes:
+                    outbox.put(result)
+    finally:
+        for outbox in outboxes:
+            outbox.put(END_OF_STREAM)
+
+def _fail_stage(stats, inbox, outboxes, error):
+    """Stand in for a stage that could not start: drain its inbox and end its outboxes
+
+    Upstream stages then finish instead of blocking on a full queue.
+    """
+    stats.errors += 1
+    logger.error(f"Streaming stage {stats.name} could not start: {str(error)}")
+    try:
+        while inbox.get() is not END_OF_STREAM:
+            pass
+    finally:
+        for outbox in outboxes:
+            outbox.put(END_OF_STREAM)
+
+def run_streaming_pipeline(collector, processor, db_manager, conversation_processor, limit=200,
+                           batch_size=1000, queue_size=4, keep_intermediate=True):
+    """Run collection, processing, database storage and conversation building concurrently
+
+    Stages are threads connected by bounded queues of record batches, so wall-clock time
+    approaches the slowest stage rather than the sum of all stages. Collection waits on the
+    network and SQLite and file writes release the GIL, which is where the overlap comes from.
+    """
+    run_name = f"reddit_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    raw_file = f"data/raw/{run_name}.csv" if keep_intermediate else None
+    processed_file = f"data/processed/{run_name}.csv" if keep_intermediate else None
+
+    raw_queue = queue.Queue(maxsize=queue_size)
+    db_queue = queue.Queue(maxsize=queue_size)
+    conversation_queue = queue.Queue(maxsize=queue_size)
+
+    stats = {name: StageStats(name) for name in ("collector", "processor", "database", "conversation")}
+    results = {}
+
+    def collect():
+        collector_stats = stats["collector"]
+        try:
+            raw_csv = _CsvAppender(raw_file) if raw_file else None
+            start_time = time.perf_counter()
+            for batch in collector.iter_batches(limit=limit, batch_size=batch_size):
+                collector_stats.busy_seconds += time.perf_counter() - start_time
+                collector_stats.batches += 1
+                collector_stats.rows_out += len(batch)
+                if raw_csv:
+                    raw_csv.append(batch)
+                raw_queue.put(batch)
+                start_time = time.perf_counter()
+        except Exception as e:
+            collector_stats.errors += 1
+            logger.error(f"Streaming stage collector failed: {str(e)}")
+        finally:
+            raw_queue.put(END_OF_STREAM)
+
+    def process():
+        seen_texts = set()
+        try:
+            processed_csv = _CsvAppender(processed_file) if processed_file else None
+        except Exception as e:
+            _fail_stage(stats["processor"], raw_queue, [db_queue, conversation_queue], e)
+            return
+
+        def handle(batch):
+            processed = processor.process_batch(batch, seen_texts=seen_texts)
+            if processed_csv:
+                processed_csv.append(processed)
+            return processed
+
+        _run_stage(stats["processor"], raw_queue, handle, [db_queue, conversation_queue])
+
+    def store():
+        try:
+            # SQLite connections must be used on the thread that created them
+            conn = sqlite3.connect(db_manager.db_path, timeout=db_manager.timeout)
+        except Exception as e:
+            _fail_stage(stats["database"], db_queue, [], e)
+            return
+        source_file = processed_file or f"stream://{run_name}"
+
+        def handle(batch):
+            stats["database"].rows_out += db_manager.store_batch(batch, conn, source_file=source_file)
+
+        try:
+            _run_stage(stats["database"], db_queue, handle, [])
+            db_manager.mark_processed(source_file, conn)
+        finally:
+            conn.close()
+
+    def build_conversations():
+        try:
+            stream = conversation_processor.open_stream(run_name)
+        except Exception as e:
+            _fail_stage(stats["conversation"], conversation_queue, [], e)
+            return
+
+        def handle(batch):
+            stream.write_batch(batch)
+            stats["conversation"].rows_out += len(batch)
+
+        try:
+            _run_stage(stats["conversation"], conversation_queue, handle, [])
+        finally:
+            results["training"] = stream.close()
+
+    threads = [threading.Thread(target=target, name=f"pipeline-{name}", daemon=True)
+               for name, target in (("collector", collect), ("processor", process),
+                                    ("database", store), ("conversation", build_conversations))]
+
+    start_time = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed_time = time.time() - start_time
+
+    stage_stats = {name: stage.to_dict() for name, stage in stats.items()}
+    busiest = max(stage_stats.items(), key=lambda item: item[1]["busy_seconds"])
+    logger.info(f"Streaming pipeline finished in {elapsed_time:.2f}s; slowest stage {busiest[0]} "
+                f"({busiest[1]['busy_seconds']:.2f}s busy), sum of stages "
+                f"{sum(stage['busy_seconds'] for stage in stage_stats.values()):.2f}s")
+
+    has_data = stats["collector"].rows_out > 0
+    return {
+        "run_name": run_name,
+        "raw_file": raw_file if has_data else None,
+        "processed_file": processed_file if has_data else None,
+        "training": results.get("training"),
+        "stage_stats": stage_stats,
+        "elapsed_time": elapsed_time
+    }
@@ -0,0 +1,130 @@
+import os
+import logging
+import numpy as np
+import pandas as pd
+from pipeline_logging import setup_logging
+
+
+logger = logging.getLogger(__name__)
+
+FINNISH_WORDS = [
+    'ja', 'on', 'ei', 'se', 'että', 'kun', 'minä', 'sinä', 'hän', 'olen', 'kuin', 'mutta', 'jos',
+    'niin', 'mitä', 'hyvä', 'kiitos', 'suomi', 'suomen', 'voi', 'ovat', 'olla', 'paljon', 'vähän',
+    'suomessa', 'myös', 'pitää', 'vain', 'siis', 'tai', 'sauna', 'kahvi', 'järvi', 'talvi', 'kesä',
+    'mökki', 'ruisleipä', 'äiti', 'isä', 'työ', 'koulu', 'kaupunki', 'metsä', 'lumi', 'päivä',
+    'ihan', 'kyllä', 'tosi', 'kiva', 'huono', 'uusi', 'vanha', 'tänään', 'huomenna', 'eilen'
+]
+SYLLABLES = ['ka', 'ko', 'ku', 'la', 'lo', 'lu', 'ma', 'mi', 'na', 'ne', 'pa', 'pi', 'ra', 'ri', 'sa', 'si',
+             'ta', 'ti', 'va', 'vi', 'jä', 'lä', 'mä', 'nä', 'pä', 'sä', 'tä', 'hö', 'kö', 'lö', 'sy', 'ty']
+ENGLISH_SAMPLES = [
+    "This is clearly English text and should be filtered out.",
+    "Another English sentence for testing purposes.",
+    "Random text that is not in Finnish language at all."
+]
+SUBREDDITS = ['Suomi', 'Finland', 'LearnFinnish']
+CORRUPTIONS = ['null_text', 'english_text', 'blank_text', 'mojibake', 'missing_subreddit']
+
+def _unique_word(number):
+    """A pronounceable pseudo-word spelling number in base len(SYLLABLES), so texts never collide"""
+    parts = []
+    while True:
+        number, digit = divmod(number, len(SYLLABLES))
+        parts.append(SYLLABLES[digit])
+        if number == 0:
+            return ''.join(parts) + 'nen'
+
+def generate_corpus(rows, seed=0, duplicate_rate=0.05, corruption_rate=0.02, max_depth=6,
+                    reply_rate=0.6, comments_per_post=20, start_row=0):
+    """Build a raw Reddit-shaped DataFrame of Finnish-like comments, reproducible for a seed
+
+    duplicate_rate is the fraction of rows whose text repeats an earlier row and
+    corruption_rate the fraction damaged in one of the CORRUPTIONS ways. Comments
+    reply to the previous comment of their post with probability reply_rate, and
+    threads are cut back to top level after max_depth replies. start_row offsets the
+    ids so chunks generated separately can be concatenated into one corpus.
+    """
+    rng = np.random.default_rng([seed, start_row])
+    words = np.array(FINNISH_WORDS, dtype=object)
+
+    posts = max(1, rows // comments_per_post)
+    post_of_row = np.sort(rng.integers(0, posts, size=rows))
+    position = np.arange(rows)
+    first_in_post = np.ones(rows, dtype=bool)
+    first_in_post[1:] = post_of_row[1:] != post_of_row[:-1]
+
+    # Depth counts the replies since the last top-level comment of the post
+    is_reply = (rng.random(rows) < reply_rate) & ~first_in_post
+    last_reset = np.maximum.accumulate(np.where(is_reply, 0, position))
+    depth = (position - last_reset) % (max_depth + 1)
+
+    post_ids = np.array([f"s{start_row // comments_per_post + post:x}" for post in range(posts)], dtype=object)
+    comment_ids = np.array([f"c{start_row + row:x}" for row in range(rows)], dtype=object)
+    post_id = post_ids[post_of_row]
+    parent_id = np.where(depth == 0, 't3_' + post_id, 't1_' + np.roll(comment_ids, 1))
+
+    lengths = rng.integers(3, 40, size=rows)
+    picks = rng.integers(0, len(words), size=int(lengths.sum()))
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    texts = [' '.join(words[picks[offsets[i]:offsets[i + 1]]]) + ' ' + _unique_word(start_row + i)
+             for i in range(rows)]
+
+    df = pd.DataFrame({
+        'source': 'reddit',
+        'subreddit': np.array(SUBREDDITS, dtype=object)[rng.integers(0, len(SUBREDDITS), size=posts)][post_of_row],
+        'post_id': post_id,
+        'post_title': 'Keskustelu ' + post_id,
+        'comment_id': comment_ids,
+        'parent_id': parent_id,
+        'depth': depth,
+        'text': texts,
+        'created_utc': (1_600_000_000 + np.sort(rng.integers(0, 100_000_000, size=rows))).astype(float),
+        'score': rng.integers(-5, 500, size=rows)
+    })
+
+    duplicates = np.flatnonzero(rng.random(rows) < duplicate_rate)
+    duplicates = duplicates[duplicates > 0]
+    if len(duplicates):
+        sources = (rng.random(len(duplicates)) * duplicates).astype(np.int64)
+        df.loc[duplicates, 'text'] = df['text'].to_numpy()[sources]
+
+    corrupted = np.flatnonzero(rng.random(rows) < corruption_rate)
+    kinds = rng.integers(0, len(CORRUPTIONS), size=len(corrupted))
+    for kind, name in enumerate(CORRUPTIONS):
+        targets = corrupted[kinds == kind]
+        if name == 'null_text':
+            df.loc[targets, 'text'] = None
+        elif name == 'english_text':
+            df.loc[targets, 'text'] = rng.choice(ENGLISH_SAMPLES, size=len(targets))
+        elif name == 'blank_text':
+            df.loc[targets, 'text'] = '   '
+        elif name == 'mojibake':
+            df.loc[targets, 'text'] = [text.encode('utf-8').decode('latin-1') for text in df.loc[targets, 'text']]
+        elif name == 'missing_subreddit':
+            df.loc[targets, 'subreddit'] = None
+
+    return df
+
+def write_corpus(output_file, rows, chunk_rows=1_000_000, **options):
+    """Generate a corpus of rows rows to a CSV file chunk by chunk, so 10M rows fit in memory"""
+    os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+    for start in range(0, rows, chunk_rows):
+        chunk = generate_corpus(min(chunk_rows, rows - start), start_row=start, **options)
+        chunk.to_csv(output_file, mode='w' if start == 0 else 'a', header=(start == 0), index=False, encoding='utf-8')
+    logger.info(f"Synthetic corpus of {rows} rows saved to {output_file}")
+    return output_file
+
+if __name__ == "__main__":
+    setup_logging(log_file=None)
+    import argparse
+    parser = argparse.ArgumentParser(description="Generate a seeded synthetic Finnish Reddit corpus")
+    parser.add_argument("output_file", help="CSV file to write, e.g. data/raw/synthetic_1m.csv")
+    parser.add_argument("--rows", type=int, default=10_000, help="Number of comments")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--duplicate-rate", type=float, default=0.05, help="Fraction of rows repeating an earlier text")
+    parser.add_argument("--corruption-rate", type=float, default=0.02, help="Fraction of damaged rows")
+    parser.add_argument("--max-depth", type=int, default=6, help="Deepest reply level of a thread")
+    parser.add_argument("--reply-rate", type=float, default=0.6, help="Probability a comment replies to the previous one")
+    args = parser.parse_args()
+
+    write_corpus(args.output_file, args.rows, seed=args.seed, duplicate_rate=args.duplicate_rate,
+                 corruption_rate=args.corruption_rate, max_depth=args.max_depth, reply_rate=args.reply_rate)
@@ -0,0 +1,61 @@
+import json
+import numpy as np
+from conversation_packer import ConversationPacker
+
+
+def conversation(*words_per_message):
+    return {"messages": [{"role": "human" if n % 2 == 0 else "assistant", "content": " ".join(["sana"] * words)}
+                         for n, words in enumerate(words_per_message)]}
+
+
+def test_split_long_cuts_at_message_boundaries():
+    packer = ConversationPacker(token_budget=20, message_overhead=1, conversation_overhead=2)
+    conversations = [conversation(3, 4), conversation(8, 8, 8, 30, 2), conversation()]
+    segments, lengths = packer.split_long(*packer.measure(conversations))
+
+    assert segments.tolist() == [[0, 0, 2], [1, 0, 2], [1, 2, 3], [1, 3, 4], [1, 4, 5], [2, 0, 0]]
+    assert lengths.tolist() == [11, 20, 11, 33, 5, 2]
+
+
+def test_pack_fills_bins_and_gives_oversize_items_their_own():
+    packer = ConversationPacker(token_budget=10)
+    lengths = np.array([6, 4, 3, 7, 25, 5, 5])
+    assignment = packer.pack(lengths)
+
+    totals = np.bincount(assignment, weights=lengths)
+    assert totals[assignment[4]] == 25 and (assignment == assignment[4]).sum() == 1
+    assert all(total <= 10 for bin_number, total in enumerate(totals) if bin_number != assignment[4])
+    assert assignment.max() + 1 == 4
+
+    batches = [np.flatnonzero(assignment == bin_number) for bin_number in range(assignment.max() + 1)]
+    assert packer.padding_efficiency(lengths, batches, padded_size=10) == 1.0
+
+
+def test_bucket_keeps_padded_batches_within_budget():
+    packer = ConversationPacker(token_budget=12)
+    lengths = np.array([5, 1, 2, 6, 3, 3, 20])
+    batches = packer.bucket(lengths)
+
+    assert sorted(position for batch in batches for position in batch) == list(range(7))
+    assert all(lengths[batch].max() * len(batch) <= 12 for batch in batches if len(batch) > 1)
+    assert packer.padding_efficiency(lengths, batches) <= 1.0
+
+
+def test_run_reads_in_chunks_and_writes_every_message_once(tmp_path):
+    conversations = [conversation(*np.random.default_rng(n).integers(1, 40, size=n % 6 + 1).tolist())
+                     for n in range(40)]
+    input_file = tmp_path / "conversations.jsonl"
+    input_file.write_text(''.join(json.dumps(c) + '\n' for c in conversations), encoding='utf-8')
+    packer = ConversationPacker(token_budget=64)
+
+    outputs = []
+    for chunk_size in (7, 1000):
+        output_file = str(tmp_path / f"packed_{chunk_size}.jsonl")
+        report = packer.run([str(input_file)], output_file, chunk_size=chunk_size)
+        with open(output_file, encoding='utf-8') as f:
+            outputs.append([json.loads(line) for line in f])
+        assert 0 < report["padding_efficiency_after"] <= 1.0
+    assert outputs[0] == outputs[1]
+
+    written = [message["content"] for batch in outputs[0] for c in batch["conversations"] for message in c["messages"]]
+    assert sorted(written) == sorted(message["content"] for c in conversations for message in c["messages"])
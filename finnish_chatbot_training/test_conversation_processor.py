@@ -0,0 +1,178 @@
+import os
+import json
+import pandas as pd
+from conversation_processor import ConversationProcessor
+
+
+def _reference_single_turn(df):
+    """Row-by-row single-turn output as originally generated with iterrows()"""
+    lines = []
+    for _, row in df.iterrows():
+        if not isinstance(row.get('text', ''), str) or len(row.get('text', '').strip()) < 10:
+            continue
+        conversation = {
+            "messages": [
+                {"role": "human", "content": "Please respond in Finnish style to the following content"},
+                {"role": "assistant", "content": row.get('text', '')}
+            ]
+        }
+        lines.append(json.dumps(conversation, ensure_ascii=False) + '\n')
+    return ''.join(lines)
+
+
+def _reference_multi_turn(df):
+    """Row-by-row multi-turn output as originally generated with iterrows()"""
+    lines = []
+    for _, group in df.groupby('post_id'):
+        if len(group) > 1:
+            messages = []
+            for i, (_, comment) in enumerate(group.iterrows()):
+                role = "human" if i % 2 == 0 else "assistant"
+                messages.append({"role": role, "content": comment.get('text', '')})
+            lines.append(json.dumps({"messages": messages}, ensure_ascii=False) + '\n')
+    return ''.join(lines)
+
+
+def _sample_frame():
+    return pd.DataFrame({
+        'text': [
+            'Hyvää huomenta kaikille täällä!',
+            'liian lyhyt',
+            '   lyhyt   ',
+            None,
+            'Lainausmerkit "näin" ja \\ kenoviiva\nsekä rivinvaihto',
+            'Tämä on toinen kommentti samassa ketjussa',
+            'Ohjausmerkki \x01 ja emoji 😀 mukana tekstissä',
+            'Yksinäinen kommentti ilman vastauksia',
+        ],
+        'post_id': ['b', 'a', 'b', 'a', 'c', 'a', None, 'd'],
+        'score': [1, 2, 3, 4, 5, 6, 7, 8],
+    })
+
+
+def test_jsonl_output_matches_row_by_row_reference(tmp_path):
+    df = _sample_frame()
+
+    for encoder in ("json", "orjson"):
+        processor = ConversationProcessor(output_dir=str(tmp_path), batch_size=2, json_encoder=encoder)
+
+        single_path = os.path.join(str(tmp_path), f"{encoder}_single.jsonl")
+        multi_path = os.path.join(str(tmp_path), f"{encoder}_multi.jsonl")
+        single_count = processor._create_single_turn_data(df, single_path)
+        multi_count = processor._create_multi_turn_data(df, multi_path)
+
+        with open(single_path, encoding='utf-8') as f:
+            assert f.read() == _reference_single_turn(df)
+        with open(multi_path, encoding='utf-8') as f:
+            assert f.read() == _reference_multi_turn(df)
+        assert single_count == 6
+        assert multi_count == 2
+
+
+def test_process_csv_round_trip_matches_reference(tmp_path):
+    csv_file = os.path.join(str(tmp_path), "processed_sample.csv")
+    _sample_frame().to_csv(csv_file, index=False, encoding='utf-8')
+    df = pd.read_csv(csv_file, encoding='utf-8')
+
+    stats = ConversationProcessor(output_dir=str(tmp_path)).process_csv_to_jsonl(csv_file)
+
+    with open(stats["single_turn_path"], encoding='utf-8') as f:
+        assert f.read() == _reference_single_turn(df)
+    with open(stats["multi_turn_path"], encoding='utf-8') as f:
+        assert f.read() == _reference_multi_turn(df)
+
+
+def test_sharded_output_supports_random_access(tmp_path):
+    from jsonl_shards import ShardedJsonlReader
+
+    df = pd.concat([_sample_frame()] * 50, ignore_index=True)
+    plain = ConversationProcessor(output_dir=str(tmp_path))
+    plain_path = os.path.join(str(tmp_path), "plain_single.jsonl")
+    plain._create_single_turn_data(df, plain_path)
+    with open(plain_path, encoding='utf-8') as f:
+        expected = [json.loads(line) for line in f]
+
+    for compression in ("gzip", None):
+        processor = ConversationProcessor(output_dir=str(tmp_path), output_format="sharded",
+                                          shard_size_bytes=2048, compression=compression,
+                                          shard_block_size=512)
+        output_path = os.path.join(str(tmp_path), f"sharded_{compression}_single.jsonl")
+        count = processor._create_single_turn_data(df, output_path)
+
+        with ShardedJsonlReader(os.path.join(str(tmp_path), f"sharded_{compression}_single.shards.json")) as reader:
+            assert count == len(reader) == len(expected)
+            assert len(reader.shards) > 1
+            assert reader[len(reader) - 1] == expected[-1]
+            assert [reader[n] for n in range(len(reader))] == expected
+            shuffled = list(reader.iter_shuffled(seed=1))
+            assert sorted(map(json.dumps, shuffled)) == sorted(map(json.dumps, expected))
+
+
+def test_conversation_dataset_random_access_and_sharding(tmp_path):
+    import pickle
+    from conversation_processor import ConversationDataset
+
+    df = pd.concat([_sample_frame()] * 20, ignore_index=True)
+    plain = ConversationProcessor(output_dir=str(tmp_path))
+    single_path = os.path.join(str(tmp_path), "plain_single.jsonl")
+    multi_path = os.path.join(str(tmp_path), "plain_multi.jsonl")
+    plain._create_single_turn_data(df, single_path)
+    plain._create_multi_turn_data(df, multi_path)
+    sharded = ConversationProcessor(output_dir=str(tmp_path), output_format="sharded", shard_size_bytes=1024)
+    sharded._create_multi_turn_data(df, os.path.join(str(tmp_path), "sharded_multi.jsonl"))
+    paths = [single_path, os.path.join(str(tmp_path), "sharded_multi.shards.json")]
+
+    expected = []
+    for path in (single_path, multi_path):
+        with open(path, encoding='utf-8') as f:
+            expected.extend(json.loads(line) for line in f)
+
+    dataset = ConversationDataset(paths)
+    assert len(dataset) == len(expected)
+    assert dataset[0] == expected[0]
+    assert dataset[-1] == expected[-1]
+    assert dataset[3:10:2] == expected[3:10:2]
+    assert list(dataset) == expected
+    assert os.path.exists(ConversationDataset.index_path_for(single_path))
+
+    shuffled = list(dataset.iterate(shuffle=True, seed=7))
+    assert shuffled == list(ConversationDataset(paths).iterate(shuffle=True, seed=7))
+    assert shuffled != expected
+
+    restored = pickle.loads(pickle.dumps(dataset))
+    worker_items = []
+    for shard_id in range(3):
+        worker_items.extend(restored.iterate(shuffle=True, seed=7, num_shards=3, shard_id=shard_id))
+    assert sorted(map(json.dumps, worker_items)) == sorted(map(json.dumps, expected))
+
+
+def test_hash_splits_are_stable_and_keep_posts_together(tmp_path):
+    from conversation_processor import DEFAULT_SPLIT_RATIOS
+
+    df = pd.DataFrame({
+        'post_id': [f"post{i // 3}" for i in range(600)],
+        'text': [f"Kommentti numero {i} ketjussa" for i in range(600)],
+    })
+    csv_file = os.path.join(str(tmp_path), "splits.csv")
+    df.to_csv(csv_file, index=False, encoding='utf-8')
+
+    processor = ConversationProcessor(output_dir=str(tmp_path), split_ratios=DEFAULT_SPLIT_RATIOS)
+    stats = processor.process_csv_to_jsonl(csv_file)
+
+    assert sum(stats["splits"]["single_turn"].values()) == stats["single_turn_count"] == 600
+    assert sum(stats["splits"]["multi_turn"].values()) == stats["multi_turn_count"] == 200
+    assert stats["splits"]["single_turn"]["train"] > stats["splits"]["single_turn"]["test"]
+    assert os.path.exists(os.path.join(str(tmp_path), "splits_splits.json"))
+
+    post_splits = {}
+    for split, path in stats["single_turn_path"].items():
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                text = json.loads(line)["messages"][1]["content"]
+                post = f"post{int(text.split()[2]) // 3}"
+                assert post_splits.setdefault(post, split) == split
+
+    # Adding data never moves existing posts to another split
+    bigger = pd.concat([df, pd.DataFrame({'post_id': ['new'] * 5, 'text': ['Uusi kommentti'] * 5})],
+                       ignore_index=True)
+    assert (processor.assign_splits(bigger)[:len(df)] == processor.assign_splits(df)).all()
@@ -0,0 +1,54 @@
+from collections import Counter
+from corpus_stats import (CorpusStatistics, HyperLogLog, TOKEN_PATTERN, build_statistics, iter_file_texts,
+                          load_stopwords, merge_sketches, write_stopwords, _hashes)
+from data_processor import DataProcessor
+from synthetic_corpus import generate_corpus
+
+
+def corpus_texts(rows, seed):
+    return generate_corpus(rows, seed=seed, corruption_rate=0.0)['text'].tolist()
+
+
+def test_estimates_bound_exact_counts():
+    texts = corpus_texts(3000, seed=1)
+    stats = build_statistics([texts[:1000], texts[1000:]], width=2 ** 12, vocabulary_capacity=100)
+    exact = Counter(token for text in texts for token in TOKEN_PATTERN.findall(text.lower()))
+
+    for token, estimate in stats.top(1, 10):
+        assert exact[token] <= estimate <= exact[token] + 2 * sum(exact.values()) / 2 ** 12
+    assert [token for token, _ in stats.top(1, 5)] == [token for token, _ in exact.most_common(5)]
+    assert abs(stats.distinct[1].count() - len(exact)) < 0.05 * len(exact)
+    assert stats.documents == 3000 and stats.ngram_totals[1] == sum(exact.values())
+
+
+def test_hyperloglog_counts_distinct_keys():
+    hll = HyperLogLog(precision=12)
+    hll.add(_hashes([f"sana{n}" for n in range(100000)]))
+    hll.add(_hashes([f"sana{n}" for n in range(50000)]))
+    assert abs(hll.count() - 100000) < 5000
+
+
+def test_sketches_from_separate_runs_merge(tmp_path):
+    first, second = corpus_texts(1500, seed=2), corpus_texts(1500, seed=3)
+    whole = build_statistics([first, second])
+    build_statistics([first]).save(str(tmp_path / "a.npz"))
+    build_statistics([second]).save(str(tmp_path / "b.npz"))
+
+    merged = merge_sketches([str(tmp_path / "a.npz"), str(tmp_path / "b.npz")], str(tmp_path / "merged.npz"))
+
+    assert (merged.frequencies.table == whole.frequencies.table).all()
+    assert merged.summary() == whole.summary()
+    assert CorpusStatistics.load(str(tmp_path / "merged.npz")).summary() == whole.summary()
+
+
+def test_derived_stopwords_feed_preprocessing(tmp_path):
+    csv_file = str(tmp_path / "processed.csv")
+    generate_corpus(2000, seed=5).to_csv(csv_file, index=False)
+    stats = build_statistics(iter_file_texts([csv_file], column="text", batch_rows=300))
+    stopwords_file = write_stopwords(stats, str(tmp_path / "stopwords.txt"), min_document_share=0.3)
+
+    derived = load_stopwords(stopwords_file)
+    assert 'sauna' in derived and not any(word.endswith('nen') for word in derived)
+
+    processor = DataProcessor(checkpoint_dir=str(tmp_path / "checkpoints"), stopwords_file=stopwords_file)
+    assert 'sauna' not in processor._preprocess_text("sauna on kuuma").split()
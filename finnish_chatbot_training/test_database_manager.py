@@ -0,0 +1,40 @@
+import sqlite3
+import pandas as pd
+from database_manager import DatabaseManager
+from synthetic_corpus import write_corpus
+
+
+def test_interrupted_store_resumes_and_inserts_each_row_once(tmp_path):
+    processed_file = write_corpus(str(tmp_path / "processed" / "corpus.csv"), 1000, seed=6, duplicate_rate=0.0)
+    db_manager = DatabaseManager(db_path=str(tmp_path / "chatbot.db"), checkpoint_rows=150)
+    insert_rows = db_manager._insert_rows
+    chunks = []
+
+    def crash_on_third_chunk(cursor, df, source_file=None):
+        chunks.append(len(df))
+        if len(chunks) == 3:
+            inserted = insert_rows(cursor, df.iloc[:50], source_file=source_file)
+            raise sqlite3.OperationalError(f"disk I/O error after {inserted} rows")
+        return insert_rows(cursor, df, source_file=source_file)
+
+    db_manager._insert_rows = crash_on_third_chunk
+    assert not db_manager.store_data(processed_file, replace=True)
+    db_manager._insert_rows = insert_rows
+
+    assert db_manager.store_data(processed_file, replace=True)
+    assert db_manager.last_stats["rows_in"] == 1000 - 300
+
+    with sqlite3.connect(db_manager.db_path) as conn:
+        texts = [row[0] for row in conn.execute("SELECT text FROM conversations ORDER BY id")]
+        assert conn.execute("SELECT COUNT(*) FROM store_checkpoints").fetchone()[0] == 0
+    assert texts == pd.read_csv(processed_file)['text'].fillna('').tolist()
+    assert not db_manager.store_data(processed_file)
+
+
+def test_rows_of_a_file_are_looked_up_through_the_source_file_index(tmp_path):
+    db_manager = DatabaseManager(db_path=str(tmp_path / "chatbot.db"))
+
+    with sqlite3.connect(db_manager.db_path) as conn:
+        plan = conn.execute("EXPLAIN QUERY PLAN SELECT COUNT(*) FROM conversations WHERE source_file = ?",
+                            ("data/processed/corpus.csv",)).fetchall()
+    assert any("idx_conversations_source_file" in row[-1] for row in plan)
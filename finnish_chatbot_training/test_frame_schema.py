@@ -0,0 +1,33 @@
+import pandas as pd
+from frame_schema import read_frame, bytes_per_row, STRING_DTYPE
+from synthetic_corpus import write_corpus
+
+
+def test_columns_get_the_shared_types(tmp_path):
+    csv_file = str(tmp_path / "typed.csv")
+    pd.DataFrame({
+        'source': ['reddit', 'reddit', None],
+        'post_id': ['0012', '12', '0012'],
+        'comment_id': ['1e5', 'c2', 'c3'],
+        'text': ['moi', None, 'hei'],
+        'created_utc': [1.6e9, 1.7e9, None],
+        'score': ['5', 'paljon', '2.5'],
+        'extra': [1, 2, 3]
+    }).to_csv(csv_file, index=False)
+
+    df = read_frame(csv_file)
+
+    assert isinstance(df['source'].dtype, pd.CategoricalDtype)
+    assert df['post_id'].tolist() == ['0012', '12', '0012']
+    assert df['comment_id'].tolist() == ['1e5', 'c2', 'c3']
+    assert df['text'].dtype == pd.api.types.pandas_dtype(STRING_DTYPE)
+    assert pd.isna(df['text'][1])
+    assert str(df['created_utc'].dtype) == 'float64'
+    assert str(df['score'].dtype) == 'Int32'
+    assert df['score'].tolist()[0] == 5 and df['score'].isna().tolist() == [False, True, True]
+    assert df['extra'].tolist() == [1, 2, 3]
+
+
+def test_schema_reduces_memory_per_row(tmp_path):
+    csv_file = write_corpus(str(tmp_path / "synthetic.csv"), 5000)
+    assert bytes_per_row(read_frame(csv_file)) < 0.8 * bytes_per_row(pd.read_csv(csv_file))
@@ -0,0 +1,36 @@
+import os
+import sqlite3
+from synthetic_corpus import write_corpus
+
+
+def stored(db_path="data/finnish_chatbot.db"):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT COUNT(*), COUNT(source_file) FROM conversations").fetchone()
+
+
+def test_store_stage_skips_only_while_the_database_holds_the_rows(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from main import run_pipeline
+    raw_file = write_corpus("data/raw/corpus.csv", 300, seed=5)
+
+    def run(**options):
+        return run_pipeline(collect=False, input_files=[raw_file], **options)["skipped_stages"]["store"]
+
+    assert run() == 0
+    rows = stored()[0]
+    assert rows > 0
+    assert run() == 1 and stored() == (rows, rows)
+
+    os.remove("data/finnish_chatbot.db")
+    assert run() == 0 and stored() == (rows, rows)
+
+    with sqlite3.connect("data/finnish_chatbot.db") as conn:
+        conn.execute("DELETE FROM conversations")
+    assert run() == 0 and stored() == (rows, rows)
+
+    assert run(force=["store"]) == 0 and stored() == (rows, rows)
+
+    # Rows stored before source_file existed are replaced, not duplicated
+    with sqlite3.connect("data/finnish_chatbot.db") as conn:
+        conn.execute("UPDATE conversations SET source_file = NULL")
+    assert run() == 0 and stored() == (rows, rows)
@@ -0,0 +1,43 @@
+import json
+import logging
+from pipeline_logging import setup_logging, shutdown_logging, flush_repeated
+
+
+def _read_entries(log_file):
+    with open(log_file, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_repeated_messages_are_sampled_with_counts(tmp_path):
+    log_file = str(tmp_path / "pipeline.log")
+    setup_logging(log_file=log_file, console=False, burst=3)
+    try:
+        logger = logging.getLogger("test_pipeline_logging")
+        for row in range(100):
+            logger.error("Error inserting row data: %s", f"bad row {row}")
+        logger.info("Stored file")
+        flush_repeated()
+    finally:
+        shutdown_logging()
+
+    entries = _read_entries(log_file)
+    inserts = [entry for entry in entries if entry["message"].startswith("Error inserting row data")]
+    assert [entry["message"] for entry in inserts[:3]] == [f"Error inserting row data: bad row {row}" for row in range(3)]
+    assert inserts[3]["repeated"] == 97
+    assert inserts[3]["message"] == "Error inserting row data: bad row 99 (repeated 97 more times)"
+    assert any(entry["message"] == "Stored file" and entry["level"] == "INFO" for entry in entries)
+
+
+def test_disabled_levels_are_never_formatted(tmp_path):
+    class Exploding:
+        def __str__(self):
+            raise AssertionError("formatted a disabled record")
+
+    log_file = str(tmp_path / "pipeline.log")
+    setup_logging(level="INFO", log_file=log_file, console=False)
+    try:
+        logging.getLogger("test_pipeline_logging").debug("Language detection failed: %s", Exploding())
+    finally:
+        shutdown_logging()
+
+    assert _read_entries(log_file) == []
@@ -0,0 +1,67 @@
+import re
+import json
+import time
+from pipeline_metrics import PipelineMetrics, current_rss_bytes
+
+
+def test_a_stage_keeps_its_peak_when_another_stage_starts():
+    metrics = PipelineMetrics()
+    baseline = current_rss_bytes()
+    with metrics.stage("outer") as outer:
+        block = bytearray(200 * 2 ** 20)
+        block[::4096] = b'x' * len(block[::4096])
+        time.sleep(0.2)
+        del block
+        with metrics.stage("inner") as inner:
+            pass
+
+    assert outer.peak_rss_bytes - baseline > 150 * 2 ** 20
+    assert inner.peak_rss_bytes < outer.peak_rss_bytes
+
+
+def test_json_report_and_prometheus_file_cover_every_stage(tmp_path):
+    metrics = PipelineMetrics(metrics_dir=str(tmp_path))
+    input_file = tmp_path / "raw.csv"
+    input_file.write_text("text\nmoi\n", encoding='utf-8')
+    for file in ("a.csv", "b.csv"):
+        with metrics.stage("processor", file, inputs=[str(input_file)]) as record:
+            record.rows_in, record.rows_out = 100, 90
+    try:
+        with metrics.stage("database", "a.csv") as record:
+            record.rows_in = 90
+            raise RuntimeError("locked")
+    except RuntimeError:
+        pass
+    metrics.count_cache("manifest_process", hit=True)
+    metrics.count_cache("manifest_process", hit=False, count=3)
+
+    with open(metrics.write_json_report(), encoding='utf-8') as f:
+        report = json.load(f)
+    processor, database = report["stages"]["processor"], report["stages"]["database"]
+    assert (processor["files"], processor["rows_in"], processor["rows_out"], processor["errors"]) == (2, 200, 180, 0)
+    assert processor["bytes_read"] == 2 * input_file.stat().st_size
+    assert (database["files"], database["rows_in"], database["errors"]) == (1, 90, 1)
+    assert processor["wall_seconds"] == sum(r["wall_seconds"] for r in report["files"] if r["stage"] == "processor")
+    assert [(r["stage"], r["file"], r["status"]) for r in report["files"]] == [
+        ("processor", "a.csv", "ok"), ("processor", "b.csv", "ok"), ("database", "a.csv", "error")]
+    assert report["caches"]["manifest_process"] == {"hits": 1, "misses": 3, "hit_rate": 0.25}
+
+    with open(metrics.write_prometheus(), encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    types = {line.split()[2]: line.split()[3] for line in lines if line.startswith("# TYPE ")}
+    samples = {}
+    for line in lines:
+        if not line.startswith("#"):
+            match = re.fullmatch(r'([a-z_]+)(?:\{(\w+)="([\w]+)"\})? (\S+)', line)
+            assert match, line
+            name, label, value, number = match.groups()
+            assert name in types and types[name] == "gauge"
+            samples[(name, label, value)] = float(number)
+
+    assert samples[("finnish_pipeline_stage_rows_in", "stage", "processor")] == 200
+    assert samples[("finnish_pipeline_stage_errors", "stage", "database")] == 1
+    assert samples[("finnish_pipeline_stage_files", "stage", "processor")] == 2
+    assert samples[("finnish_pipeline_cache_hit_rate", "cache", "manifest_process")] == 0.25
+    assert ("finnish_pipeline_peak_rss_bytes", None, None) in samples
+    assert ("finnish_pipeline_last_run_timestamp_seconds", None, None) in samples
+    assert {name for name, _, _ in samples} == set(types)
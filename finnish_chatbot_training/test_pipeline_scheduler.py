@@ -0,0 +1,72 @@
+import json
+from datetime import date, timedelta
+import pytest
+from pipeline_scheduler import PipelineScheduler, RunLock, raw_files_by_date
+from synthetic_corpus import write_corpus
+
+
+def test_run_lock_is_shared_by_partitions_and_exclusive_for_full_runs(tmp_path):
+    lock_path = str(tmp_path / "pipeline.lock")
+    with RunLock(lock_path, shared=True), RunLock(lock_path, shared=True, blocking=False):
+        with pytest.raises(RuntimeError):
+            with RunLock(lock_path, blocking=False):
+                pass
+    with RunLock(lock_path, blocking=False):
+        assert not RunLock(lock_path, shared=True, blocking=False).acquire()
+
+
+def test_backfill_partitions_run_in_parallel_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_corpus("data/raw/reddit_20260901_020000.csv", 400, seed=1)
+    write_corpus("data/raw/reddit_20260901_140000.csv", 400, seed=2)
+    write_corpus("data/raw/reddit_20260903_020000.csv", 400, seed=3)
+    assert sorted(raw_files_by_date()) == ["2026-09-01", "2026-09-03"]
+
+    scheduler = PipelineScheduler(concurrency=2, poll_seconds=0.2)
+    assert scheduler.submit_backfill("2026-09-01", "2026-09-03")[1] == 3
+    assert scheduler.run(until_idle=True, nightly=False)["done"] == 3
+
+    partitions = {p["partition_date"]: p for p in scheduler.partitions()}
+    assert json.loads(partitions["2026-09-01"]["result"])["input_files"] == 2
+    assert json.loads(partitions["2026-09-02"]["result"])["input_files"] == 0
+    with open("data/run_manifest.json", encoding="utf-8") as f:
+        assert len(json.load(f)["stages"]["convert"]) == 3
+
+    # Overlapping backfill: only the new day is queued, finished days keep their results
+    assert scheduler.submit_backfill("2026-09-02", "2026-09-04", force=["all"])[1] == 1
+    scheduler.run(until_idle=True, nightly=False)
+    after = {p["partition_date"]: p for p in scheduler.partitions()}
+    assert all(after[day]["finished_at"] == partitions[day]["finished_at"] for day in partitions)
+    assert after["2026-09-04"]["status"] == "done"
+
+
+def test_backfill_refuses_days_still_being_collected(tmp_path):
+    scheduler = PipelineScheduler(state_path=str(tmp_path / "scheduler.db"))
+    today = date.today()
+    with pytest.raises(ValueError):
+        scheduler.submit_backfill(today - timedelta(days=2), today)
+    with pytest.raises(ValueError):
+        scheduler.submit_backfill(today + timedelta(days=1), today + timedelta(days=3))
+    assert scheduler.partitions() == []
+
+
+class CrashedProcess:
+    exitcode = 1
+
+    def is_alive(self):
+        return False
+
+    def join(self):
+        pass
+
+
+def test_partition_that_crashed_before_recording_is_requeued(tmp_path):
+    scheduler = PipelineScheduler(state_path=str(tmp_path / "scheduler.db"), max_attempts=2)
+    scheduler.submit_backfill("2026-09-01", "2026-09-01")
+
+    for status in ["pending", "failed"]:
+        partition = scheduler._claim()
+        scheduler._running[partition["partition_date"]] = CrashedProcess()
+        scheduler._reap()
+        assert scheduler.status("2026-09-01") == status
+    assert not scheduler._running
@@ -4,9 +4,9 @@ import logging
 from data_processor import DataProcessor
 from database_manager import DatabaseManager
 from conversation_processor import ConversationProcessor
+from pipeline_logging import setup_logging
 
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 def test_process_corrupted():
@@ -52,4 +52,5 @@ def test_process_corrupted():
     logger.info("Test completed")
 
 if __name__ == "__main__":
+    setup_logging(log_file=None)
     test_process_corrupted()
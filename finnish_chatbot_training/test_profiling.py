@@ -0,0 +1,63 @@
+import re
+import json
+import time
+import pstats
+from contextlib import nullcontext
+from profiling import HotTimers, StageProfiler, hot_timers
+
+
+def busy_stage(seconds=0.3):
+    total = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        with hot_timers.timer("test.inner_loop", 10):
+            total += sum(range(1000))
+    return total
+
+
+def test_stage_profile_writes_loadable_dumps_stacks_and_timers(tmp_path, monkeypatch):
+    monkeypatch.setattr(hot_timers, "enabled", True)
+    hot_timers.reset()
+    profiler = StageProfiler(stages=["processor"], output_dir=str(tmp_path), interval=0.002)
+
+    with profiler.profile("processor", "data/raw/corpus.csv"):
+        busy_stage()
+    with profiler.profile("database"):
+        busy_stage(0.05)
+    timed = dict(hot_timers.totals["test.inner_loop"])
+    outputs = profiler.write()
+    hot_timers.reset()
+
+    assert [dump.endswith("processor_corpus.prof") for dump in outputs["profile_dumps"]] == [True]
+    stats = pstats.Stats(outputs["profile_dumps"][0])
+    assert any(function[2] == "busy_stage" for function in stats.stats)
+
+    with open(outputs["collapsed_stacks"], encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    assert lines
+    for line in lines:
+        match = re.fullmatch(r'([^;]+(?:;[^;]+)*) (\d+)', line)
+        assert match, line
+        frames = match.group(1).split(';')
+        assert frames[0] == "processor" and len(frames) > 1
+    assert any("busy_stage (test_profiling.py:" in line for line in lines)
+
+    with open(outputs["hot_timers"], encoding='utf-8') as f:
+        timers = json.load(f)
+    loop = timers["test.inner_loop"]
+    assert loop["calls"] == timed["calls"] > 0
+    assert loop["items"] == 10 * loop["calls"]
+    assert loop["seconds"] == timed["seconds"] > 0
+    assert loop["seconds_per_item"] == loop["seconds"] / loop["items"]
+
+
+def test_disabled_timers_record_nothing():
+    timers = HotTimers()
+    assert isinstance(timers.timer("off"), nullcontext)
+    with timers.timer("off", 5):
+        pass
+    assert list(timers.iterate("off", [1, 2])) == [1, 2]
+    assert timers.summary() == {}
+
+    assert not StageProfiler().enabled
+    assert StageProfiler().write() == {}
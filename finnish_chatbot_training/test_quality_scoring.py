@@ -0,0 +1,71 @@
+import pandas as pd
+from quality_scoring import QualityScorer, SIGNALS
+from data_processor import DataProcessor
+from synthetic_corpus import generate_corpus
+
+
+GOOD = "Tämä on ihan hyvä kommentti saunasta ja kesästä."
+
+def sample_frame():
+    return pd.DataFrame({
+        'text': [GOOD, "+1", "https://example.com/a https://example.com/b", "> lainattu pitkä rivi toisesta kommentista\nok",
+                 "spam spam spam spam spam spam spam spam", "Jeeeeeeeeeeeeeee, kiva juttu", "I am a bot, beep boop",
+                 "Kommentti jolla on huonot pisteet.", "Moderaattorin kommentti täällä.", None],
+        'score': [5, 1, 1, 1, 1, 1, 1, -20, 1, 1],
+        'author': ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'AutoModerator', 'i']
+    })
+
+
+def test_each_signal_rejects_its_rows():
+    scorer = QualityScorer()
+    filtered = scorer.filter(sample_frame())
+
+    assert filtered['text'].tolist() == [GOOD]
+    assert scorer.last_rejections == {
+        "length": 2, "alpha_ratio": 2, "diacritic_ratio": 0, "url_ratio": 1, "quote_ratio": 1,
+        "repetition": 2, "score": 1, "bot": 2
+    }
+    assert set(scorer.last_rejections) == set(SIGNALS)
+
+
+def test_thresholds_can_be_changed_or_disabled():
+    scorer = QualityScorer({"min_score": None, "reject_bots": False, "max_char_run": None})
+    kept = scorer.filter(sample_frame())['text'].tolist()
+
+    assert "Kommentti jolla on huonot pisteet." in kept
+    assert "Moderaattorin kommentti täällä." in kept
+    assert "Jeeeeeeeeeeeeeee, kiva juttu" in kept
+    assert scorer.last_rejections["score"] == scorer.last_rejections["bot"] == 0
+
+
+def test_chunking_does_not_change_the_result():
+    df = generate_corpus(3000, seed=3, corruption_rate=0.2)
+    whole = QualityScorer(chunk_rows=100000)
+    chunked = QualityScorer(chunk_rows=317)
+
+    assert whole.filter(df).index.equals(chunked.filter(df).index)
+    assert whole.last_rejections == chunked.last_rejections
+    pd.testing.assert_frame_equal(whole.signals(df), pd.concat([chunked.signals(df.iloc[:1000]),
+                                                                chunked.signals(df.iloc[1000:])]))
+
+
+def test_processor_reports_quality_rejections(tmp_path):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    input_file = str(raw_dir / "comments.csv")
+    sample_frame().assign(source='reddit', post_id='p1').to_csv(input_file, index=False)
+
+    processor = DataProcessor(checkpoint_dir=str(tmp_path / "checkpoints"))
+    output_file = processor.process_file(input_file)
+
+    assert pd.read_csv(output_file)['text'].tolist() == [GOOD]
+    assert processor.last_stats["quality_rejections"]["bot"] == 2
+
+
+def test_char_run_rejects_only_runs_longer_than_the_maximum():
+    texts = ["Mahtavaa" + "!" * 10 + " kiva juttu", "Mahtavaa" + "!" * 11 + " kiva juttu"]
+    scorer = QualityScorer()
+    kept = scorer.filter(pd.DataFrame({'text': texts, 'score': [1, 1], 'author': ['a', 'b']}))
+
+    assert kept['text'].tolist() == texts[:1]
+    assert scorer.last_rejections["repetition"] == 1
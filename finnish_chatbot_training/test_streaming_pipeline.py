@@ -0,0 +1,76 @@
+import threading
+import pandas as pd
+from synthetic_corpus import generate_corpus
+from data_processor import DataProcessor
+from database_manager import DatabaseManager
+from conversation_processor import ConversationProcessor
+from streaming_pipeline import run_streaming_pipeline
+
+
+class CorpusCollector:
+    def __init__(self, df):
+        self.df = df
+
+    def iter_batches(self, limit=None, batch_size=1000):
+        """Whole posts per batch, every other batch with its columns in reverse order"""
+        post_starts = self.df.index[self.df['post_id'] != self.df['post_id'].shift()].tolist() + [len(self.df)]
+        start = 0
+        for number, end in enumerate(post_starts[1:]):
+            if end - start < batch_size and end != len(self.df):
+                continue
+            batch = self.df.iloc[start:end].reset_index(drop=True)
+            if number % 2:
+                batch = batch[batch.columns[::-1]]
+            yield batch
+            start = end
+
+
+def sorted_lines(path):
+    with open(path, encoding='utf-8') as f:
+        return sorted(f)
+
+
+def test_streaming_output_matches_batch_output(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    df = generate_corpus(1500, seed=7)
+    raw_file = "data/raw/corpus.csv"
+    (tmp_path / "data" / "raw").mkdir(parents=True)
+    df.to_csv(raw_file, index=False)
+
+    processed_file = DataProcessor(checkpoint_dir="checkpoints").process_file(raw_file)
+    expected = ConversationProcessor(output_dir="batch").process_csv_to_jsonl(processed_file)
+
+    result = run_streaming_pipeline(CorpusCollector(df), DataProcessor(), DatabaseManager(db_path="data/stream.db"),
+                                    ConversationProcessor(output_dir="stream"), batch_size=200)
+    assert result["stage_stats"]["collector"]["batches"] > 3
+
+    pd.testing.assert_frame_equal(pd.read_csv(result["raw_file"]), pd.read_csv(raw_file))
+    pd.testing.assert_frame_equal(pd.read_csv(result["processed_file"]), pd.read_csv(processed_file))
+
+    training = result["training"]
+    assert training["single_turn_count"] == expected["single_turn_count"]
+    assert training["multi_turn_count"] == expected["multi_turn_count"]
+    for key in ("single_turn_path", "multi_turn_path"):
+        assert sorted_lines(training[key]) == sorted_lines(expected[key])
+
+
+def test_pipeline_returns_when_a_consumer_cannot_start(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    conversation_processor = ConversationProcessor(output_dir="stream")
+
+    def unwritable(run_name):
+        raise PermissionError("output directory is not writable")
+
+    conversation_processor.open_stream = unwritable
+    results = []
+    run = threading.Thread(target=lambda: results.append(run_streaming_pipeline(
+        CorpusCollector(generate_corpus(1500, seed=8)), DataProcessor(), DatabaseManager(db_path="data/stream.db"),
+        conversation_processor, batch_size=100, queue_size=2, keep_intermediate=False)), daemon=True)
+    run.start()
+    run.join(timeout=60)
+
+    assert not run.is_alive()
+    stage_stats = results[0]["stage_stats"]
+    assert stage_stats["conversation"]["errors"] == 1
+    assert stage_stats["database"]["rows_in"] == stage_stats["processor"]["rows_out"] > 0
+    assert results[0]["training"] is None
@@ -0,0 +1,46 @@
+import pandas as pd
+from synthetic_corpus import generate_corpus, write_corpus
+from benchmark import compare_to_baseline
+
+
+def test_corpus_is_reproducible_for_a_seed():
+    assert generate_corpus(2000, seed=7).equals(generate_corpus(2000, seed=7))
+    assert not generate_corpus(2000, seed=7).equals(generate_corpus(2000, seed=8))
+
+
+def test_duplicate_and_corruption_rates_are_controlled():
+    clean = generate_corpus(20000, duplicate_rate=0.0, corruption_rate=0.0)
+    assert not clean['text'].duplicated().any()
+    assert clean['text'].notna().all()
+
+    noisy = generate_corpus(20000, duplicate_rate=0.1, corruption_rate=0.05)
+    assert 0.08 < noisy['text'].duplicated().mean() < 0.12
+    assert 0.002 < noisy['text'].isna().mean() < 0.02
+
+
+def test_threads_respect_max_depth_and_parents():
+    df = generate_corpus(5000, max_depth=3, corruption_rate=0.0)
+    assert df['depth'].max() == 3
+
+    by_comment = df.set_index('comment_id')
+    replies = df[df['depth'] > 0]
+    parents = by_comment.loc[replies['parent_id'].str[3:]]
+    assert (parents['post_id'].to_numpy() == replies['post_id'].to_numpy()).all()
+    assert (parents['depth'].to_numpy() + 1 == replies['depth'].to_numpy()).all()
+    assert (df.loc[df['depth'] == 0, 'parent_id'] == 't3_' + df.loc[df['depth'] == 0, 'post_id']).all()
+
+
+def test_chunked_corpus_has_unique_ids(tmp_path):
+    output_file = str(tmp_path / "raw" / "synthetic.csv")
+    write_corpus(output_file, 2500, chunk_rows=1000)
+    df = pd.read_csv(output_file)
+    assert len(df) == 2500
+    assert df['comment_id'].is_unique
+
+
+def test_compare_to_baseline_flags_slowdowns_and_memory_growth():
+    baseline = {"10000": {"store_data": {"rows_per_second": 1000.0, "peak_rss_bytes": 100.0}}}
+    current = {"10000": {"store_data": {"rows_per_second": 700.0, "peak_rss_bytes": 110.0}}}
+
+    regressions = compare_to_baseline(current, baseline, tolerance=0.2)
+    assert [(r["stage"], r["metric"]) for r in regressions] == [("store_data", "rows_per_second")]
@@ -0,0 +1,66 @@
+import os
+import json
+import time
+import numpy as np
+import pandas as pd
+from thread_builder import ThreadBuilder
+from conversation_processor import ConversationProcessor
+
+
+def _thread_frame():
+    # Post p1:  a -> b -> c, a -> d ; e replies to an uncollected comment ; post p2: f -> g
+    return pd.DataFrame({
+        'post_id': ['p1', 'p1', 'p1', 'p1', 'p1', 'p2', 'p2'],
+        'comment_id': ['a', 'b', 'c', 'd', 'e', 'f', 'g'],
+        'parent_id': ['t3_p1', 't1_a', 't1_b', 't1_a', 't1_missing', 't3_p2', 't1_f'],
+        'text': ['juuri', 'vastaus', 'syvempi', 'sisarus', 'orpo', 'toinen', 'vastaus2'],
+    })
+
+
+def test_build_index_links_parents_and_children():
+    parent_rows, child_offsets, children = ThreadBuilder().build_index(_thread_frame())
+
+    assert parent_rows.tolist() == [-1, 0, 1, 0, -1, -1, 5]
+    assert children[child_offsets[0]:child_offsets[1]].tolist() == [1, 3]
+    assert children[child_offsets[5]:child_offsets[6]].tolist() == [6]
+
+
+def test_missing_ids_never_link_comments():
+    df = pd.DataFrame({
+        'post_id': ['p1'] * 5,
+        'comment_id': ['a', None, 'c', 'd', None],
+        'parent_id': ['t3_p1', 't1_a', None, None, 't1_c'],
+        'text': ['juuri', 'ilman id:tä', 'ilman vanhempaa', 'toinen ilman', 'vastaus'],
+    })
+    parent_rows, child_offsets, children = ThreadBuilder().build_index(df)
+
+    assert parent_rows.tolist() == [-1, 0, -1, -1, 2]
+    assert children[child_offsets[1]:child_offsets[2]].tolist() == []
+
+
+def test_root_to_leaf_chains_become_conversations(tmp_path):
+    processor = ConversationProcessor(output_dir=str(tmp_path))
+    output_path = os.path.join(str(tmp_path), "threads.jsonl")
+
+    count = processor._create_multi_turn_data(_thread_frame(), output_path)
+
+    with open(output_path, encoding='utf-8') as f:
+        conversations = [[m["content"] for m in json.loads(line)["messages"]] for line in f]
+    assert count == 3
+    assert conversations == [['juuri', 'vastaus', 'syvempi'], ['juuri', 'sisarus'], ['toinen', 'vastaus2']]
+
+
+def test_large_posts_stay_fast():
+    # One post with a 20k-deep reply chain and 20k direct replies to the root
+    depth = 20000
+    ids = [f"c{i}" for i in range(2 * depth)]
+    parents = ['t3_big'] + [f"t1_c{i - 1}" for i in range(1, depth)] + ['t1_c0'] * depth
+    df = pd.DataFrame({'post_id': 'big', 'comment_id': ids, 'parent_id': parents})
+
+    start_time = time.perf_counter()
+    chains = list(ThreadBuilder(max_turns=8).iter_chains(df))
+    assert time.perf_counter() - start_time < 5
+
+    assert len(chains) == depth + 1
+    deep_chain = [chain for chain in chains if chain[-1] == depth - 1][0]
+    assert deep_chain.tolist() == list(np.arange(depth - 8, depth))
@@ -0,0 +1,60 @@
+import json
+import pandas as pd
+from data_processor import DataProcessor, normalize_text
+from tokenized_export import VocabTokenizer, TokenizedExporter, TokenizedDataset, build_vocab
+from conversation_packer import ConversationPacker
+
+
+TEXTS = [
+    "Ja se on hyvä, don't worry! Katso https://example.com/x <b>nyt</b>",
+    "Ja se on kesä2026 ja sauna on kuuma.",
+    "Ja minä olen samaa mieltä, sauna on paras."
+]
+
+
+def write_vocab(tmp_path, texts=TEXTS):
+    csv_file = str(tmp_path / "processed.csv")
+    pd.DataFrame({'text': texts, 'processed_text': [''] * len(texts)}).to_csv(csv_file, index=False)
+    return build_vocab([csv_file], str(tmp_path / "vocab.txt"), min_freq=1)
+
+
+def test_normalization_matches_processed_text_before_stopwords():
+    processor = DataProcessor()
+    for text in TEXTS:
+        kept = [word for word in normalize_text(text) if word not in processor.stopwords]
+        assert processor._preprocess_text(text) == ' '.join(kept)
+    assert normalize_text(TEXTS[0]) == ["ja", "se", "on", "hyvä", "dont", "worry", "katso", "nyt"]
+    assert normalize_text(TEXTS[1])[3] == "kesä"
+
+
+def test_vocabulary_keeps_stopwords_and_encodes_every_word(tmp_path):
+    tokenizer = VocabTokenizer(write_vocab(tmp_path))
+
+    assert tokenizer.vocab[6:9] == ["ja", "on", "se"]
+    for text in TEXTS:
+        assert tokenizer.unk_id not in tokenizer.encode(text)
+    assert tokenizer.encode("don't") == [tokenizer.token_to_id["dont"]]
+    assert tokenizer.encode("tuntematon sana") == [tokenizer.unk_id] * 2
+    assert tokenizer.encode(None) == []
+
+
+def test_export_round_trip_and_packer_lengths_agree(tmp_path):
+    tokenizer = VocabTokenizer(write_vocab(tmp_path))
+    conversations = [{"messages": [{"role": "human", "content": TEXTS[0]},
+                                   {"role": "assistant", "content": TEXTS[1]}]},
+                     {"messages": [{"role": "human", "content": TEXTS[2]}]}]
+    jsonl_file = tmp_path / "conversations.jsonl"
+    jsonl_file.write_text(''.join(json.dumps(c, ensure_ascii=False) + '\n' for c in conversations), encoding='utf-8')
+
+    prefix = TokenizedExporter(tokenizer, output_dir=str(tmp_path / "tokenized"), workers=1).export(
+        [str(jsonl_file)], "sample")
+    dataset = TokenizedDataset(prefix)
+
+    tokens, roles = dataset[0]
+    assert tokens.tolist() == ([tokenizer.bos_id, tokenizer.role_ids["human"]] + tokenizer.encode(TEXTS[0])
+                               + [tokenizer.role_ids["assistant"]] + tokenizer.encode(TEXTS[1]) + [tokenizer.eos_id])
+    assert roles.tolist()[-1] == 1
+
+    packer = ConversationPacker()
+    message_lengths, message_starts = packer.measure(conversations)
+    assert packer.conversation_lengths(message_lengths, message_starts).tolist() == dataset.lengths.tolist()
@@ -0,0 +1,59 @@
+import pandas as pd
+from transform_plan import TransformPlan
+from data_processor import DataProcessor
+from synthetic_corpus import write_corpus
+
+
+def numbered(rows):
+    return pd.DataFrame({'text': [f"rivi {n}" for n in range(rows)], 'n': range(rows)})
+
+
+def test_filters_move_ahead_of_transforms_they_do_not_depend_on():
+    plan = (TransformPlan(chunk_rows=10)
+            .add("dedup", lambda df: df.drop_duplicates('text'), kind="frame")
+            .add("upper", lambda df: df.assign(upper=df['text'].str.upper()), writes=["upper"])
+            .add("slow_filter", lambda df: df[df['n'] % 2 == 0], kind="filter", cost=10.0, reads=["n"])
+            .add("fast_filter", lambda df: df[df['n'] % 3 == 0], kind="filter", cost=1.0, reads=["n"])
+            .add("needs_upper", lambda df: df[df['upper'] != ""], kind="filter", reads=["upper"]))
+
+    assert plan.explain() == "dedup -> (fast_filter + slow_filter + upper + needs_upper) per 10 rows"
+
+    result = plan.execute(numbered(95))
+    assert result['n'].tolist() == list(range(0, 95, 6))
+    assert result['upper'].iloc[1] == "RIVI 6"
+    steps = plan.last_report["steps"]
+    assert steps["fast_filter"]["rows_in"] == 95 and steps["fast_filter"]["rows_out"] == 32
+    assert steps["upper"]["rows_in"] == 16
+
+
+def test_sink_receives_every_chunk_and_empty_frames_keep_columns():
+    chunks = []
+    plan = TransformPlan(chunk_rows=4).add("mark", lambda df: df.assign(mark=True), writes=["mark"])
+    assert plan.execute(numbered(10), sink=lambda chunk, done, total: chunks.append((len(chunk), done, total))) is None
+    assert chunks == [(4, 4, 10), (4, 8, 10), (2, 10, 10)]
+
+    assert list(plan.execute(numbered(0)).columns) == ['text', 'n', 'mark']
+
+
+def test_process_file_resumes_fused_pass_after_failure(tmp_path):
+    raw_dir = tmp_path / "raw"
+    input_file = write_corpus(str(raw_dir / "corpus.csv"), 2000, seed=4)
+    expected = DataProcessor(checkpoint_dir=str(tmp_path / "clean"), checkpoint_rows=300).process_file(input_file)
+    expected_text = open(expected, encoding='utf-8').read()
+
+    processor = DataProcessor(checkpoint_dir=str(tmp_path / "checkpoints"), checkpoint_rows=300)
+    preprocess_column = processor._preprocess_column
+    calls = []
+
+    def fail_once(df, preprocess=None):
+        calls.append(len(df))
+        if len(calls) == 3:
+            raise RuntimeError("interrupted")
+        return preprocess_column(df, preprocess)
+
+    processor._preprocess_column = fail_once
+    output_file = processor.process_file(input_file)
+
+    assert open(output_file, encoding='utf-8').read() == expected_text
+    assert processor.last_stats["plan"]["steps"]["preprocess"]["rows_in"] == sum(calls[3:]) < sum(calls)
+    assert processor.last_stats["rows_out"] == len(pd.read_csv(output_file))
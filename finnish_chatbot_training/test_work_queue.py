@@ -0,0 +1,115 @@
+import os
+import time
+import sqlite3
+from synthetic_corpus import write_corpus
+from work_queue import WorkQueue, QueueWorker, run_local_workers
+
+
+def test_expired_lease_is_reclaimed_by_another_worker(tmp_path):
+    work_queue = WorkQueue(str(tmp_path / "queue.db"), lease_seconds=0.05)
+    work_queue.register(["data/raw/a.csv", "data/raw/b.csv"])
+    assert work_queue.register(["data/raw/a.csv"]) == 0
+
+    first = work_queue.claim("worker-1")
+    assert first["input_file"] == "data/raw/a.csv"
+    time.sleep(0.1)
+
+    second = work_queue.claim("worker-2")
+    assert second["job_id"] == first["job_id"]
+    assert second["attempt"] == 2
+    assert not work_queue.heartbeat(first["job_id"], "worker-1")
+    assert not work_queue.complete(first["job_id"], "worker-1", {})
+    assert work_queue.complete(second["job_id"], "worker-2", {"rows": 1})
+    assert work_queue.counts() == {"pending": 1, "running": 0, "done": 1, "failed": 0}
+
+
+def test_jobs_fail_after_max_attempts(tmp_path):
+    work_queue = WorkQueue(str(tmp_path / "queue.db"), lease_seconds=60, max_attempts=2)
+    work_queue.register(["data/raw/bad.csv"])
+
+    job = work_queue.claim("worker-1")
+    work_queue.fail(job["job_id"], "worker-1", "boom")
+    job = work_queue.claim("worker-1")
+    work_queue.fail(job["job_id"], "worker-1", "boom again")
+
+    assert work_queue.claim("worker-1") is None
+    assert work_queue.counts()["failed"] == 1
+    assert work_queue.jobs()[0]["error"] == "boom again"
+
+
+def test_local_worker_processes_drain_the_queue(tmp_path):
+    raw_files = [write_corpus(str(tmp_path / "data" / "raw" / f"part_{n}.csv"), 300, seed=n) for n in range(5)]
+    os.makedirs(tmp_path / "data" / "processed")
+    queue_options = {"queue_path": str(tmp_path / "queue.db"), "lease_seconds": 30}
+    worker_options = {
+        "db_path": str(tmp_path / "data" / "chatbot.db"),
+        "output_dir": str(tmp_path / "data" / "training"),
+        "checkpoint_dir": str(tmp_path / "data" / "checkpoints"),
+        "poll_seconds": 0.1
+    }
+    WorkQueue(**queue_options).register(raw_files)
+
+    assert run_local_workers(3, queue_options, worker_options) == [0, 0, 0]
+
+    jobs = WorkQueue(**queue_options).jobs()
+    assert [job["status"] for job in jobs] == ["done"] * 5
+    assert all(job["attempts"] == 1 for job in jobs)
+    with sqlite3.connect(worker_options["db_path"]) as conn:
+        sources = conn.execute("SELECT COUNT(DISTINCT source_file) FROM conversations").fetchone()[0]
+    assert sources == 5
+    assert all(os.path.exists(os.path.join(worker_options["output_dir"], f"part_{n}_single_turn.jsonl")) for n in range(5))
+
+
+def make_worker(tmp_path, work_queue):
+    return QueueWorker(work_queue, worker_id="worker-1", db_path=str(tmp_path / "chatbot.db"),
+                       output_dir=str(tmp_path / "training"), checkpoint_dir=str(tmp_path / "checkpoints"))
+
+
+def test_worker_stops_before_storing_once_its_lease_is_reclaimed(tmp_path):
+    work_queue = WorkQueue(str(tmp_path / "queue.db"), lease_seconds=60)
+    work_queue.register(["data/raw/a.csv"])
+    worker = make_worker(tmp_path, work_queue)
+    stored = []
+
+    def reclaimed_while_processing(input_file):
+        with sqlite3.connect(work_queue.queue_path) as conn:
+            conn.execute("UPDATE jobs SET worker = 'worker-2'")
+        return input_file
+
+    worker.processor.process_file = reclaimed_while_processing
+    worker.db_manager.store_data = lambda *args, **kwargs: stored.append(args)
+
+    assert worker.run_job(work_queue.claim("worker-1")) is None
+    assert stored == []
+    assert work_queue.jobs()[0]["status"] == "running" and work_queue.jobs()[0]["worker"] == "worker-2"
+
+
+def test_heartbeat_errors_are_retried(tmp_path):
+    raw_file = write_corpus(str(tmp_path / "data" / "raw" / "part.csv"), 200, seed=1)
+    os.makedirs(tmp_path / "data" / "processed")
+    work_queue = WorkQueue(str(tmp_path / "queue.db"), lease_seconds=0.3)
+    work_queue.register([raw_file])
+    worker = make_worker(tmp_path, work_queue)
+    heartbeat = work_queue.heartbeat
+    calls = []
+
+    def flaky_heartbeat(job_id, worker_id):
+        calls.append(job_id)
+        if len(calls) <= 2:
+            raise sqlite3.OperationalError("database is locked")
+        return heartbeat(job_id, worker_id)
+
+    process_file = worker.processor.process_file
+    reclaimed = []
+
+    def slow_process_file(input_file):
+        time.sleep(0.5)
+        reclaimed.append(work_queue.claim("worker-2"))
+        return process_file(input_file)
+
+    work_queue.heartbeat = flaky_heartbeat
+    worker.processor.process_file = slow_process_file
+
+    assert worker.run_job(work_queue.claim("worker-1"))["stored_rows"] > 0
+    assert reclaimed == [None] and len(calls) > 2
+    assert work_queue.jobs()[0]["status"] == "done"
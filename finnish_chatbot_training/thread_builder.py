@@ -0,0 +1,89 @@
+import logging
+import numpy as np
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+class ThreadBuilder:
+    def __init__(self, max_turns=16, min_turns=2, chunk_size=1_000_000):
+        """Initialize reply-thread builder
+
+        max_turns caps how far each chain is followed up from its leaf, which bounds the
+        work on very deep threads to O(leaves * max_turns).
+        """
+        self.max_turns = max_turns
+        self.min_turns = min_turns
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def _strip_fullname(ids):
+        """Turn Reddit fullnames such as t1_abc / t3_xyz into bare ids; missing ids stay missing"""
+        return ids.astype(str).str.replace(r'^t\d_', '', regex=True).where(ids.notna())
+
+    def build_index(self, df):
+        """Parent row of every comment plus a CSR parent->children index, without per-pair work
+
+        Returns (parent_rows, child_offsets, children): parent_rows[i] is the row position of
+        comment i's parent or -1 for thread roots (replies to the post itself, or replies to
+        comments that were not collected), and children[child_offsets[i]:child_offsets[i + 1]]
+        are the row positions of its direct replies in input order.
+        """
+        n = len(df)
+        post_codes, _ = pd.factorize(df['post_id'])
+        comment_ids = self._strip_fullname(df['comment_id'])
+        parent_ids = self._strip_fullname(df['parent_id'])
+
+        # Comment ids are unique on Reddit; keep the first row if a corrupted file repeats one.
+        # Rows without an id can't be replied to, and replies without a parent id are roots.
+        unique = (~comment_ids.duplicated(keep='first') & comment_ids.notna()).to_numpy()
+        lookup = pd.Index(comment_ids.to_numpy()[unique])
+        parent_rows = lookup.get_indexer(parent_ids.to_numpy())
+        parent_rows = np.where(parent_rows >= 0, np.flatnonzero(unique)[np.maximum(parent_rows, 0)], -1)
+
+        # Replies must stay within their own post and cannot point at themselves
+        valid = (parent_rows >= 0) & (parent_rows != np.arange(n))
+        valid[valid] &= post_codes[parent_rows[valid]] == post_codes[valid]
+        valid &= post_codes >= 0
+        parent_rows = np.where(valid, parent_rows, -1).astype(np.int64)
+
+        child_counts = np.bincount(parent_rows[valid], minlength=n)
+        child_offsets = np.concatenate(([0], np.cumsum(child_counts)))
+        replies = np.flatnonzero(valid)
+        children = replies[np.argsort(parent_rows[replies], kind='stable')]
+
+        return parent_rows, child_offsets, children
+
+    def iter_chains(self, df):
+        """Yield row positions of each root-to-leaf reply chain, grouped by post_id"""
+        if len(df) == 0:
+            return
+
+        parent_rows, child_offsets, _ = self.build_index(df)
+        post_codes, _ = pd.factorize(df['post_id'], sort=True)
+
+        leaves = np.flatnonzero((np.diff(child_offsets) == 0) & (post_codes >= 0))
+        leaves = leaves[np.lexsort((leaves, post_codes[leaves]))]
+        if len(leaves) == 0:
+            return
+
+        truncated = 0
+        for chunk_start in range(0, len(leaves), self.chunk_size):
+            chunk = leaves[chunk_start:chunk_start + self.chunk_size]
+
+            # Walk the chains up in lockstep; row k holds the k-th ancestor of each leaf (or -1)
+            steps = np.full((self.max_turns, len(chunk)), -1, dtype=np.int64)
+            current = chunk
+            for step in range(self.max_turns):
+                steps[step] = current
+                current = np.where(current >= 0, parent_rows[np.maximum(current, 0)], -1)
+                if not (current >= 0).any():
+                    break
+
+            truncated += int((current >= 0).sum())
+            lengths = (steps >= 0).sum(axis=0)
+            for column in np.flatnonzero(lengths >= self.min_turns).tolist():
+                yield steps[:lengths[column], column][::-1]
+
+        if truncated:
+            logger.info(f"Truncated {truncated} reply chains to their last {self.max_turns} turns")
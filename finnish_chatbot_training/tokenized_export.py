@@ -0,0 +1,275 @@
+import os
+import json
+import logging
+import multiprocessing
+from collections import Counter
+import numpy as np
+import pandas as pd
+from conversation_processor import ConversationDataset
+from data_processor import normalize_text
+from pipeline_logging import setup_logging
+
+
+logger = logging.getLogger(__name__)
+
+SPECIAL_TOKENS = ['<pad>', '<unk>', '<bos>', '<eos>', '<human>', '<assistant>']
+
+# Role mask values stored per token
+ROLE_IDS = {"human": 0, "assistant": 1}
+
+INDEX_DTYPE = np.dtype([('offset', '<i8'), ('length', '<i4')])
+
+class VocabTokenizer:
+    def __init__(self, vocab_path):
+        """Word-level tokenizer over a vocabulary file built by build_vocab"""
+        with open(vocab_path, 'r', encoding='utf-8') as f:
+            self.vocab = [line.rstrip('\n') for line in f if line.rstrip('\n')]
+        self.token_to_id = {token: i for i, token in enumerate(self.vocab)}
+        self.name = f"vocab:{os.path.basename(vocab_path)}"
+        self.unk_id = self.token_to_id['<unk>']
+        self.bos_id = self.token_to_id['<bos>']
+        self.eos_id = self.token_to_id['<eos>']
+        self.role_ids = {role: self.token_to_id[f"<{role}>"] for role in ROLE_IDS}
+
+    @property
+    def vocab_size(self):
+        return len(self.vocab)
+
+    def encode(self, text):
+        """Encode the words of data_processor.normalize_text, stopwords included"""
+        lookup = self.token_to_id.get
+        unk_id = self.unk_id
+        return [lookup(word, unk_id) for word in normalize_text(text)]
+
+class HuggingFaceTokenizer:
+    def __init__(self, name_or_path):
+        """Wrap a locally available Hugging Face tokenizer"""
+        from transformers import AutoTokenizer
+
+        self.name_or_path = name_or_path
+        self.name = f"hf:{name_or_path}"
+        self.tokenizer = AutoTokenizer.from_pretrained(name_or_path, local_files_only=True)
+        self.bos_id = self.tokenizer.bos_token_id if self.tokenizer.bos_token_id is not None else self.tokenizer.cls_token_id
+        self.eos_id = self.tokenizer.eos_token_id if self.tokenizer.eos_token_id is not None else self.tokenizer.sep_token_id
+        # No dedicated role tokens; role boundaries are kept in the role mask
+        self.role_ids = {role: None for role in ROLE_IDS}
+
+    @property
+    def vocab_size(self):
+        return len(self.tokenizer)
+
+    def encode(self, text):
+        if not isinstance(text, str):
+            return []
+        return self.tokenizer.encode(text, add_special_tokens=False)
+
+    def __getstate__(self):
+        return {'name_or_path': self.name_or_path}
+
+    def __setstate__(self, state):
+        self.__init__(state['name_or_path'])
+
+def load_tokenizer(spec):
+    """Load a tokenizer from 'vocab:<path>' or 'hf:<local name or path>'"""
+    kind, _, value = spec.partition(':')
+    if kind == 'vocab':
+        return VocabTokenizer(value)
+    if kind == 'hf':
+        try:
+            return HuggingFaceTokenizer(value)
+        except ImportError:
+            logger.error("transformers library not installed, cannot load Hugging Face tokenizer")
+            raise
+    raise ValueError(f"Unknown tokenizer spec: {spec}")
+
+def build_vocab(csv_files, vocab_path, max_size=50000, min_freq=2, chunksize=100000):
+    """Build a word vocabulary from the text column of processed CSV files
+
+    Texts are normalized like processed_text but keep their stopwords, which
+    conversations still contain when encoded.
+    """
+    counts = Counter()
+    for csv_file in csv_files:
+        try:
+            for chunk in pd.read_csv(csv_file, usecols=['text'], encoding='utf-8', chunksize=chunksize):
+                for text in chunk['text'].dropna().tolist():
+                    counts.update(normalize_text(text))
+        except Exception as e:
+            logger.error(f"Error reading text from {csv_file}: {str(e)}")
+
+    words = [word for word, count in counts.most_common() if count >= min_freq and word not in SPECIAL_TOKENS]
+    words = words[:max(0, max_size - len(SPECIAL_TOKENS))]
+
+    os.makedirs(os.path.dirname(vocab_path) or '.', exist_ok=True)
+    with open(vocab_path, 'w', encoding='utf-8') as f:
+        for token in SPECIAL_TOKENS + words:
+            f.write(token + '\n')
+
+    logger.info(f"Saved vocabulary of {len(SPECIAL_TOKENS) + len(words)} tokens to {vocab_path}")
+    return vocab_path
+
+def tokenize_conversation(tokenizer, conversation):
+    """Token IDs and per-token role mask for one conversation"""
+    tokens = []
+    roles = []
+    if tokenizer.bos_id is not None:
+        tokens.append(tokenizer.bos_id)
+        roles.append(ROLE_IDS["human"])
+
+    for message in conversation.get("messages", []):
+        role = ROLE_IDS.get(message.get("role"), ROLE_IDS["human"])
+        message_tokens = tokenizer.encode(message.get("content", ""))
+        role_token = tokenizer.role_ids.get(message.get("role"))
+        if role_token is not None:
+            message_tokens = [role_token] + message_tokens
+        tokens.extend(message_tokens)
+        roles.extend([role] * len(message_tokens))
+
+    if tokenizer.eos_id is not None:
+        tokens.append(tokenizer.eos_id)
+        roles.append(roles[-1] if roles else ROLE_IDS["human"])
+
+    return tokens, roles
+
+# Worker state for multiprocessing.Pool
+_worker_dataset = None
+_worker_tokenizer = None
+
+def _init_worker(dataset, tokenizer):
+    global _worker_dataset, _worker_tokenizer
+    _worker_dataset = dataset
+    _worker_tokenizer = tokenizer
+
+def _tokenize_range(bounds):
+    start, end = bounds
+    lengths = []
+    tokens = []
+    roles = []
+    for position in range(start, end):
+        conversation_tokens, conversation_roles = tokenize_conversation(_worker_tokenizer, _worker_dataset[position])
+        lengths.append(len(conversation_tokens))
+        tokens.extend(conversation_tokens)
+        roles.extend(conversation_roles)
+    return np.array(lengths, dtype=np.int32), tokens, roles
+
+class TokenizedExporter:
+    def __init__(self, tokenizer, output_dir="data/tokenized", workers=None, chunk_size=2000):
+        """Initialize exporter writing conversations as a flat token-ID memmap plus index"""
+        self.tokenizer = tokenizer
+        self.output_dir = output_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        os.makedirs(output_dir, exist_ok=True)
+
+    def _token_dtype(self):
+        return np.uint16 if self.tokenizer.vocab_size <= np.iinfo(np.uint16).max + 1 else np.uint32
+
+    def export(self, input_paths, name):
+        """Tokenize generated conversation files once and write <name>.tokens/.roles/.index/.meta"""
+        dataset = ConversationDataset(input_paths)
+        prefix = os.path.join(self.output_dir, name)
+        token_dtype = self._token_dtype()
+
+        ranges = [(start, min(start + self.chunk_size, len(dataset)))
+                  for start in range(0, len(dataset), self.chunk_size)]
+
+        logger.info(f"Tokenizing {len(dataset)} conversations with {self.workers} workers ({self.tokenizer.name})")
+        all_lengths = []
+        total_tokens = 0
+
+        with open(f"{prefix}.tokens.bin", 'wb') as tokens_file, open(f"{prefix}.roles.bin", 'wb') as roles_file:
+            if self.workers > 1 and len(ranges) > 1:
+                pool = multiprocessing.Pool(self.workers, initializer=_init_worker,
+                                            initargs=(dataset, self.tokenizer))
+                results = pool.imap(_tokenize_range, ranges)
+            else:
+                pool = None
+                _init_worker(dataset, self.tokenizer)
+                results = map(_tokenize_range, ranges)
+
+            try:
+                for lengths, tokens, roles in results:
+                    np.asarray(tokens, dtype=token_dtype).tofile(tokens_file)
+                    np.asarray(roles, dtype=np.uint8).tofile(roles_file)
+                    all_lengths.append(lengths)
+                    total_tokens += len(tokens)
+            finally:
+                if pool:
+                    pool.close()
+                    pool.join()
+
+        lengths = np.concatenate(all_lengths) if all_lengths else np.zeros(0, dtype=np.int32)
+        index = np.zeros(len(lengths), dtype=INDEX_DTYPE)
+        index['length'] = lengths
+        if len(lengths):
+            index['offset'][1:] = np.cumsum(lengths[:-1], dtype=np.int64)
+        np.save(f"{prefix}.index.npy", index)
+
+        meta = {
+            "conversations": int(len(lengths)),
+            "tokens": int(total_tokens),
+            "token_dtype": np.dtype(token_dtype).name,
+            "vocab_size": int(self.tokenizer.vocab_size),
+            "tokenizer": self.tokenizer.name,
+            "roles": ROLE_IDS,
+            "sources": list(dataset.paths)
+        }
+        with open(f"{prefix}.meta.json", 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+
+        dataset.close()
+        logger.info(f"Exported {meta['conversations']} conversations / {meta['tokens']} tokens to {prefix}.*")
+        return prefix
+
+class TokenizedDataset:
+    def __init__(self, prefix):
+        """Map an exported token file with zero parsing"""
+        with open(f"{prefix}.meta.json", 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.index = np.load(f"{prefix}.index.npy", mmap_mode='r')
+        if self.meta["tokens"] > 0:
+            self.tokens = np.memmap(f"{prefix}.tokens.bin", dtype=self.meta["token_dtype"], mode='r')
+            self.roles = np.memmap(f"{prefix}.roles.bin", dtype=np.uint8, mode='r')
+        else:
+            self.tokens = np.zeros(0, dtype=self.meta["token_dtype"])
+            self.roles = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def lengths(self):
+        return self.index['length']
+
+    def __getitem__(self, position):
+        """Token IDs and role mask of one conversation as memmap views"""
+        offset, length = self.index[position].tolist()
+        return self.tokens[offset:offset + length], self.roles[offset:offset + length]
+
+if __name__ == "__main__":
+    setup_logging(log_file=None)
+    import argparse
+    parser = argparse.ArgumentParser(description="Pre-tokenize training conversations")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    vocab_parser = subparsers.add_parser("vocab", help="Build a vocabulary from processed CSV files")
+    vocab_parser.add_argument("csv_files", nargs="+", help="Processed CSV files with a text column")
+    vocab_parser.add_argument("--output", default="data/tokenized/vocab.txt", help="Vocabulary file")
+    vocab_parser.add_argument("--max-size", type=int, default=50000, help="Maximum vocabulary size")
+    vocab_parser.add_argument("--min-freq", type=int, default=2, help="Minimum token frequency")
+
+    export_parser = subparsers.add_parser("export", help="Tokenize JSONL files into the binary format")
+    export_parser.add_argument("inputs", nargs="+", help="JSONL files or .shards.json manifests")
+    export_parser.add_argument("--name", required=True, help="Output name inside the output directory")
+    export_parser.add_argument("--tokenizer", default="vocab:data/tokenized/vocab.txt",
+                               help="Tokenizer spec: vocab:<path> or hf:<local name or path>")
+    export_parser.add_argument("--output-dir", default="data/tokenized", help="Output directory")
+    export_parser.add_argument("--workers", type=int, default=None, help="Tokenizer processes (default: all cores)")
+
+    args = parser.parse_args()
+
+    if args.command == "vocab":
+        build_vocab(args.csv_files, args.output, max_size=args.max_size, min_freq=args.min_freq)
+    elif args.command == "export":
+        exporter = TokenizedExporter(load_tokenizer(args.tokenizer), output_dir=args.output_dir, workers=args.workers)
+        exporter.export(args.inputs, args.name)
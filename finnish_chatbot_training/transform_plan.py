@@ -0,0 +1,141 @@
+import time
+import logging
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+# frame: needs the whole frame (validation, deduplication) and ends a fused pass
+# filter: drops rows, row by row; transform: adds or rewrites columns, row by row
+STEP_KINDS = ["frame", "filter", "transform"]
+
+class PlanStep:
+    def __init__(self, name, func, kind="transform", cost=1.0, reads=("text",), writes=()):
+        """One DataFrame -> DataFrame step of a TransformPlan
+
+        cost is the relative per-row cost used to order filters; reads and writes
+        name the columns the step depends on and produces, which decides whether a
+        filter may run before a transform.
+        """
+        if kind not in STEP_KINDS:
+            raise ValueError(f"Unknown step kind '{kind}', expected one of {STEP_KINDS}")
+        self.name = name
+        self.func = func
+        self.kind = kind
+        self.cost = cost
+        self.reads = set(reads)
+        self.writes = set(writes)
+
+    def __repr__(self):
+        return f"{self.name}[{self.kind}]"
+
+class TransformPlan:
+    def __init__(self, chunk_rows=50000):
+        """Lazily declared sequence of steps, optimized and run only by execute()
+
+        Steps are added with add(), which returns the plan so calls can be chained.
+        """
+        self.chunk_rows = chunk_rows
+        self.steps = []
+        self.last_report = None
+
+    def add(self, name, func, kind="transform", cost=1.0, reads=("text",), writes=()):
+        self.steps.append(PlanStep(name, func, kind, cost, reads, writes))
+        return self
+
+    def optimize(self):
+        """Stages in execution order: a frame step alone, or a list of fused row-wise steps
+
+        Within each run of row-wise steps between frame steps, a filter moves ahead
+        of every transform whose output it does not read, and cheaper filters run
+        before costlier ones, so rows are dropped before the expensive work.
+        """
+        stages, run = [], []
+        for step in self.steps + [None]:
+            if step is not None and step.kind != "frame":
+                run.append(step)
+                continue
+            if run:
+                stages.append(self._reorder(run))
+                run = []
+            if step is not None:
+                stages.append(step)
+        return stages
+
+    @staticmethod
+    def _reorder(run):
+        ordered = []
+        for step in run:
+            position = len(ordered)
+            if step.kind == "filter":
+                # Walk back past transforms it doesn't depend on and costlier filters
+                while position > 0:
+                    before = ordered[position - 1]
+                    if before.kind == "transform" and not (before.writes & step.reads):
+                        position -= 1
+                    elif before.kind == "filter" and before.cost > step.cost:
+                        position -= 1
+                    else:
+                        break
+            ordered.insert(position, step)
+        return ordered
+
+    def explain(self, stages=None):
+        """The optimized plan as one line, fused passes in parentheses"""
+        stages = self.optimize() if stages is None else stages
+        return " -> ".join(
+            "(" + " + ".join(step.name for step in stage) + f") per {self.chunk_rows} rows"
+            if isinstance(stage, list) else stage.name
+            for stage in stages
+        )
+
+    def execute(self, df, sink=None, resume=None):
+        """Run the optimized plan on df and return the result
+
+        With sink, the final fused pass hands each finished chunk to
+        sink(chunk, rows_done, rows_total) instead of collecting it (a final frame
+        step hands over its whole result) and None is returned; resume(df) may then return the number of rows of the frame
+        entering that pass that are already done, so they are skipped. Per-step
+        timings and row counts are kept in last_report.
+        """
+        stages = self.optimize()
+        timings = {step.name: {"seconds": 0.0, "rows_in": 0, "rows_out": 0} for step in self.steps}
+        self.last_report = {"plan": self.explain(stages), "steps": timings}
+        logger.info(f"Transform plan: {self.last_report['plan']}")
+
+        for number, stage in enumerate(stages):
+            if not isinstance(stage, list):
+                df = self._run_step(stage, df, timings)
+                continue
+
+            streaming = sink is not None and number == len(stages) - 1
+            start = resume(df) if streaming and resume else 0
+            outputs = []
+            # An empty frame still goes through once, so the output has the added columns
+            for chunk_start in range(start, len(df), self.chunk_rows) if len(df) else [0]:
+                chunk = df.iloc[chunk_start:chunk_start + self.chunk_rows]
+                for step in stage:
+                    chunk = self._run_step(step, chunk, timings)
+                if streaming:
+                    sink(chunk, min(chunk_start + self.chunk_rows, len(df)), len(df))
+                else:
+                    outputs.append(chunk)
+            df = None if streaming else pd.concat(outputs)
+
+        if sink is not None and df is not None:
+            sink(df, len(df), len(df))
+            df = None
+        logger.info("Transform plan timings: " + ", ".join(
+            f"{name} {t['seconds']:.2f}s ({t['rows_in']} -> {t['rows_out']} rows)" for name, t in timings.items()))
+        return df
+
+    @staticmethod
+    def _run_step(step, df, timings):
+        started = time.perf_counter()
+        rows_in = len(df)
+        df = step.func(df)
+        timing = timings[step.name]
+        timing["seconds"] += time.perf_counter() - started
+        timing["rows_in"] += rows_in
+        timing["rows_out"] += len(df)
+        return df
@@ -0,0 +1,301 @@
+import os
+import glob
+import json
+import time
+import socket
+import sqlite3
+import logging
+import threading
+import multiprocessing
+from contextlib import closing
+from data_processor import DataProcessor
+from database_manager import DatabaseManager
+from conversation_processor import ConversationProcessor, DEFAULT_SPLIT_RATIOS
+from pipeline_logging import setup_logging
+
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ["pending", "running", "done", "failed"]
+
+class LeaseLost(RuntimeError):
+    """The job was reclaimed by another worker while this one ran it"""
+
+class WorkQueue:
+    def __init__(self, queue_path="data/work_queue.db", lease_seconds=300.0, max_attempts=3):
+        """Job queue of input files in a SQLite file that every worker opens
+
+        Workers on other hosts reach it through a shared mount, which must support
+        POSIX file locks; the rollback journal is used because WAL needs shared memory
+        that network filesystems don't provide. A claimed job is leased for
+        lease_seconds and must be heartbeated; once a lease expires the job can be
+        claimed again, up to max_attempts claims in total.
+        """
+        self.queue_path = queue_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(queue_path) or '.', exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    input_file TEXT UNIQUE NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker TEXT,
+                    lease_expires REAL,
+                    registered_at REAL,
+                    finished_at REAL,
+                    result TEXT,
+                    error TEXT
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, job_id)")
+
+    def _connect(self):
+        # Autocommit mode, transactions are opened explicitly with BEGIN IMMEDIATE
+        return closing(sqlite3.connect(self.queue_path, timeout=60.0, isolation_level=None))
+
+    def register(self, input_files):
+        """Add files as pending jobs; files already in the queue are left as they are"""
+        now = time.time()
+        with self._connect() as conn:
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO jobs (input_file, registered_at) VALUES (?, ?)",
+                             [(path, now) for path in input_files])
+            added = conn.total_changes - before
+        logger.info(f"Registered {added} new jobs ({len(input_files) - added} already queued)")
+        return added
+
+    def claim(self, worker_id):
+        """Lease the oldest pending job, or a running job whose lease expired; None if there is none"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._expire(conn, now)
+                row = conn.execute('''
+                    SELECT job_id, input_file, attempts, status FROM jobs
+                    WHERE (status = 'pending' OR (status = 'running' AND lease_expires < ?)) AND attempts < ?
+                    ORDER BY job_id LIMIT 1
+                ''', (now, self.max_attempts)).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+
+                job_id, input_file, attempts, status = row
+                conn.execute('''
+                    UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, lease_expires = ?
+                    WHERE job_id = ?
+                ''', (worker_id, now + self.lease_seconds, job_id))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        if status == "running":
+            logger.warning(f"Reclaimed expired lease on {input_file} (attempt {attempts + 1}/{self.max_attempts})")
+        return {"job_id": job_id, "input_file": input_file, "attempt": attempts + 1, "worker": worker_id}
+
+    def _expire(self, conn, now):
+        """Fail running jobs whose lease expired on their last allowed attempt"""
+        conn.execute('''
+            UPDATE jobs SET status = 'failed', finished_at = ?, error = 'lease expired on last attempt'
+            WHERE status = 'running' AND lease_expires < ? AND attempts >= ?
+        ''', (now, now, self.max_attempts))
+
+    def heartbeat(self, job_id, worker_id):
+        """Extend the lease; False if the job is no longer leased to this worker"""
+        with self._connect() as conn:
+            cursor = conn.execute('''
+                UPDATE jobs SET lease_expires = ? WHERE job_id = ? AND worker = ? AND status = 'running'
+            ''', (time.time() + self.lease_seconds, job_id, worker_id))
+            return cursor.rowcount == 1
+
+    def complete(self, job_id, worker_id, result=None):
+        """Mark a leased job done; False if the lease was lost to another worker"""
+        with self._connect() as conn:
+            cursor = conn.execute('''
+                UPDATE jobs SET status = 'done', finished_at = ?, result = ?, error = NULL, lease_expires = NULL
+                WHERE job_id = ? AND worker = ? AND status = 'running'
+            ''', (time.time(), json.dumps(result, default=str), job_id, worker_id))
+            return cursor.rowcount == 1
+
+    def fail(self, job_id, worker_id, error):
+        """Give a failed job back to the queue, or fail it for good after max_attempts"""
+        with self._connect() as conn:
+            cursor = conn.execute('''
+                UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                                finished_at = ?, error = ?, lease_expires = NULL
+                WHERE job_id = ? AND worker = ? AND status = 'running'
+            ''', (self.max_attempts, time.time(), str(error), job_id, worker_id))
+            return cursor.rowcount == 1
+
+    def counts(self):
+        """Number of jobs per status"""
+        with self._connect() as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in JOB_STATUSES}
+
+    def jobs(self):
+        """All jobs as dictionaries, in registration order"""
+        with self._connect() as conn:
+            cursor = conn.execute("SELECT * FROM jobs ORDER BY job_id")
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+class QueueWorker:
+    def __init__(self, work_queue, worker_id=None, db_path="data/finnish_chatbot.db",
+                 output_dir="data/training", checkpoint_dir="data/checkpoints",
+                 output_format="jsonl", split=False, poll_seconds=5.0):
+        """Claim jobs from a WorkQueue and run process_file -> store_data -> process_csv_to_jsonl"""
+        self.work_queue = work_queue
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.poll_seconds = poll_seconds
+        self.processor = DataProcessor(checkpoint_dir=checkpoint_dir)
+        self.db_manager = DatabaseManager(db_path=db_path)
+        self.conversation_processor = ConversationProcessor(
+            output_dir=output_dir,
+            output_format=output_format,
+            split_ratios=DEFAULT_SPLIT_RATIOS if split else None
+        )
+
+    def run(self, max_jobs=None, wait=False):
+        """Work until the queue is drained (or max_jobs are done); returns the number of jobs run
+
+        While other workers hold leases it keeps polling, so it can take over jobs whose
+        lease expires; with wait=True it also keeps polling once the queue is empty.
+        """
+        done = 0
+        while max_jobs is None or done < max_jobs:
+            job = self.work_queue.claim(self.worker_id)
+            if job is None:
+                counts = self.work_queue.counts()
+                if not wait and counts["pending"] == 0 and counts["running"] == 0:
+                    break
+                time.sleep(self.poll_seconds)
+                continue
+            self.run_job(job)
+            done += 1
+        logger.info(f"Worker {self.worker_id} finished after {done} jobs")
+        return done
+
+    def run_job(self, job):
+        """Run the file-level stages on one claimed job while a thread heartbeats its lease"""
+        lease_lost = threading.Event()
+        stop = threading.Event()
+
+        def heartbeat():
+            interval = self.work_queue.lease_seconds / 3
+            while not stop.wait(interval):
+                try:
+                    renewed = self.work_queue.heartbeat(job["job_id"], self.worker_id)
+                except Exception as e:
+                    # Retried well before the lease runs out, so a busy queue file doesn't cost the lease
+                    logger.warning(f"Heartbeat on {job['input_file']} failed, retrying: {str(e)}")
+                    interval = self.work_queue.lease_seconds / 15
+                    continue
+                interval = self.work_queue.lease_seconds / 3
+                if not renewed:
+                    lease_lost.set()
+                    logger.warning(f"Worker {self.worker_id} lost the lease on {job['input_file']}")
+                    return
+
+        def check_lease():
+            # Renewed here too, so a lease lost since the last heartbeat is noticed before the next stage
+            if lease_lost.is_set() or not self.work_queue.heartbeat(job["job_id"], self.worker_id):
+                lease_lost.set()
+                raise LeaseLost(f"Lease on {job['input_file']} was lost to another worker")
+
+        heartbeat_thread = threading.Thread(target=heartbeat, name=f"heartbeat-{job['job_id']}", daemon=True)
+        heartbeat_thread.start()
+        logger.info(f"Worker {self.worker_id} running {job['input_file']} (attempt {job['attempt']})")
+        try:
+            result = self._run_stages(job["input_file"], check_lease)
+        except LeaseLost as e:
+            logger.warning(f"Worker {self.worker_id} abandoned {job['input_file']}: {str(e)}")
+            return None
+        except Exception as e:
+            logger.error(f"Job {job['input_file']} failed on worker {self.worker_id}: {str(e)}")
+            self.work_queue.fail(job["job_id"], self.worker_id, e)
+            return None
+        finally:
+            stop.set()
+            heartbeat_thread.join()
+
+        if lease_lost.is_set() or not self.work_queue.complete(job["job_id"], self.worker_id, result):
+            logger.warning(f"Result of {job['input_file']} from worker {self.worker_id} discarded, job was reclaimed")
+            return None
+        return result
+
+    def _run_stages(self, input_file, check_lease=lambda: None):
+        """process -> store -> convert, stopping between stages once check_lease raises LeaseLost"""
+        processed_file = self.processor.process_file(input_file)
+        if not processed_file:
+            raise RuntimeError(f"process_file failed for {input_file}")
+        check_lease()
+        if not self.db_manager.store_data(processed_file, replace=True):
+            raise RuntimeError(f"store_data failed for {processed_file}")
+        check_lease()
+        stats = self.conversation_processor.process_csv_to_jsonl(processed_file)
+        if not stats:
+            raise RuntimeError(f"process_csv_to_jsonl failed for {processed_file}")
+        return {
+            "processed_file": processed_file,
+            "stored_rows": self.db_manager.last_stats["rows_out"],
+            "single_turn_path": stats["single_turn_path"],
+            "multi_turn_path": stats["multi_turn_path"],
+            "single_turn_count": stats["single_turn_count"],
+            "multi_turn_count": stats["multi_turn_count"]
+        }
+
+def _worker_main(queue_options, worker_options, max_jobs, wait):
+    setup_logging(log_file=None)
+    QueueWorker(WorkQueue(**queue_options), **worker_options).run(max_jobs=max_jobs, wait=wait)
+
+def run_local_workers(processes, queue_options=None, worker_options=None, max_jobs=None, wait=False):
+    """Run several worker processes on this host against the same queue and wait for them"""
+    workers = [multiprocessing.Process(target=_worker_main, name=f"queue-worker-{n}",
+                                       args=(queue_options or {}, worker_options or {}, max_jobs, wait))
+               for n in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return [worker.exitcode for worker in workers]
+
+if __name__ == "__main__":
+    setup_logging(log_file=None)
+    import argparse
+    parser = argparse.ArgumentParser(description="Distribute file-level pipeline stages through a shared job queue")
+    parser.add_argument("--queue", default="data/work_queue.db", help="Queue database on a shared mount")
+    parser.add_argument("--lease-seconds", type=float, default=300.0, help="Lease length, renewed every third of it")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    register_parser = subparsers.add_parser("register", help="Queue raw CSV files as jobs")
+    register_parser.add_argument("files", nargs="*", help="Files to queue (default: data/raw/*.csv)")
+
+    work_parser = subparsers.add_parser("work", help="Claim and run jobs until the queue is drained")
+    work_parser.add_argument("--processes", type=int, default=1, help="Worker processes to start on this host")
+    work_parser.add_argument("--max-jobs", type=int, default=None, help="Jobs per worker before exiting")
+    work_parser.add_argument("--wait", action="store_true", help="Keep polling for new jobs instead of exiting")
+    work_parser.add_argument("--output-format", choices=["jsonl", "sharded"], default="jsonl",
+                             help="Training data output format")
+    work_parser.add_argument("--split", action="store_true", help="Write train/validation/test outputs")
+
+    subparsers.add_parser("status", help="Show job counts per status")
+
+    args = parser.parse_args()
+    queue_options = {"queue_path": args.queue, "lease_seconds": args.lease_seconds}
+
+    if args.command == "register":
+        WorkQueue(**queue_options).register(args.files or sorted(glob.glob("data/raw/*.csv")))
+    elif args.command == "work":
+        worker_options = {"output_format": args.output_format, "split": args.split}
+        if args.processes == 1:
+            QueueWorker(WorkQueue(**queue_options), **worker_options).run(max_jobs=args.max_jobs, wait=args.wait)
+        else:
+            run_local_workers(args.processes, queue_options, worker_options, max_jobs=args.max_jobs, wait=args.wait)
+    elif args.command == "status":
+        print(json.dumps(WorkQueue(**queue_options).counts(), indent=2))